@@ -0,0 +1,86 @@
+"""Compares the throughput of loading temp tables into PostgreSQL with
+`COPY ... FROM STDIN` vs. the previous `INSERT`-based path.
+
+Requires a running PostgreSQL server, e.g. a local container:
+
+    docker run --rm -d -p 5432:5432 -e POSTGRES_PASSWORD=postgres postgres:16
+
+And its connection string (in the format `PostgreSQL()` takes), set via the environment:
+
+    BLENDSQL_BENCHMARK_POSTGRES=postgres:postgres@localhost:5432/postgres python -m benchmark.postgres_copy
+"""
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+from colorama import Fore
+
+from blendsql.db import PostgreSQL
+from blendsql.db._sqlalchemy import SQLAlchemyDatabase
+
+POSTGRES_KEY = "BLENDSQL_BENCHMARK_POSTGRES"
+NUM_ROWS = [10_000, 100_000, 500_000]
+
+
+class InsertPostgreSQL(PostgreSQL):
+    """Loads temp tables with `INSERT` statements, as before `COPY` was used."""
+
+    _insert_df = SQLAlchemyDatabase._insert_df
+    _insert_arrow = SQLAlchemyDatabase._insert_arrow
+
+
+def make_df(num_rows: int) -> pd.DataFrame:
+    """Mimics the output table of an ingredient: a distinct value, and the ingredient's output for it."""
+    return pd.DataFrame(
+        {
+            "value": [f"value {i}" for i in range(num_rows)],
+            "answer": [
+                f"answer {i % 100}" if i % 10 else None for i in range(num_rows)
+            ],
+            "score": [i / num_rows for i in range(num_rows)],
+            "is_match": [i % 2 == 0 for i in range(num_rows)],
+        }
+    )
+
+
+def time_load(db: PostgreSQL, data, tablename: str) -> float:
+    start = time.time()
+    db.to_temp_table(data, tablename)
+    elapsed = time.time() - start
+    assert db.execute_to_list(f'SELECT COUNT(*) FROM "{tablename}"')[0] == len(data)
+    db._reset_connection()
+    return elapsed
+
+
+if __name__ == "__main__":
+    if os.getenv(POSTGRES_KEY) is None:
+        raise ValueError(
+            f"Set `{POSTGRES_KEY}` to the connection string of a PostgreSQL database to benchmark against"
+        )
+    dbs = {
+        "COPY": PostgreSQL(os.environ[POSTGRES_KEY]),
+        "INSERT": InsertPostgreSQL(os.environ[POSTGRES_KEY]),
+    }
+    rows = []
+    for num_rows in NUM_ROWS:
+        df = make_df(num_rows)
+        inputs = {
+            "DataFrame": df,
+            "Arrow": pa.Table.from_pandas(df, preserve_index=False),
+        }
+        for input_name, data in inputs.items():
+            for method, db in dbs.items():
+                print(f"Loading {num_rows} rows from {input_name} with {method}...")
+                elapsed = time_load(db, data, "benchmark_temp_table")
+                rows.append(
+                    {
+                        "# Rows": num_rows,
+                        "Input": input_name,
+                        "Method": method,
+                        "Runtime (s)": elapsed,
+                        "Rows / Second": num_rows / elapsed,
+                    }
+                )
+    df = pd.DataFrame(rows)
+    print(Fore.GREEN + df.to_markdown(index=False) + Fore.RESET)
@@ -0,0 +1,89 @@
+"""Compares the wall-clock time of a 500-value `LLMMap` against a remote model,
+when batches are sent one at a time vs. concurrently.
+
+Instead of a real model, we start a local stub server mimicking the Ollama `/api/chat`
+endpoint, which answers every request after a fixed latency.
+
+Run with `python -m benchmark.remote_concurrency`
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+from colorama import Fore
+
+from blendsql import blend, config, LLMMap
+from blendsql.db import Pandas
+from blendsql.models import OllamaLLM
+
+NUM_VALUES = 500
+BATCH_SIZE = 5
+LATENCY_SECONDS = 0.05
+ASYNC_LIMITS = [1, 4, 16]
+
+
+class StubServer(ThreadingHTTPServer):
+    # Allow many concurrent connections, without resetting any
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        values = [
+            v
+            for v in body["messages"][-1]["content"].split("Values:\n")[-1].split("\n")
+            if v and not v.startswith("Answer")
+        ]
+        time.sleep(LATENCY_SECONDS)
+        response = json.dumps(
+            {
+                "model": body["model"],
+                "created_at": "2024-01-01T00:00:00Z",
+                "message": {
+                    "role": "assistant",
+                    "content": ";".join(str(len(v)) for v in values),
+                },
+                "done": True,
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+if __name__ == "__main__":
+    server = StubServer(("127.0.0.1", 0), StubOllamaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"http://127.0.0.1:{server.server_address[1]}"
+    db = Pandas(pd.DataFrame({"value": [f"value {i}" for i in range(NUM_VALUES)]}))
+    query = "SELECT {{LLMMap('How many characters?', 'w::value')}} FROM w"
+    print(
+        f"Running `LLMMap` over {NUM_VALUES} values ({NUM_VALUES // BATCH_SIZE} requests, {LATENCY_SECONDS}s latency each)..."
+    )
+    limits, runtimes = [], []
+    for limit in ASYNC_LIMITS:
+        config.set_async_limit(limit)
+        model = OllamaLLM("stub", host=host, caching=False)
+        start = time.time()
+        smoothie = blend(
+            query=query,
+            db=db,
+            default_model=model,
+            ingredients={LLMMap.from_args(batch_size=BATCH_SIZE)},
+        )
+        runtimes.append(time.time() - start)
+        limits.append(limit)
+        assert len(smoothie.df) == NUM_VALUES
+        assert smoothie.df.iloc[:, 0].notnull().all()
+    server.shutdown()
+    df = pd.DataFrame({"Async Limit": limits, "Runtime (s)": runtimes})
+    print(Fore.GREEN + df.to_markdown(index=False) + Fore.RESET)
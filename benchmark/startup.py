@@ -0,0 +1,121 @@
+"""Measures the startup cost of BlendSQL: the time to `import blendsql` in a fresh
+interpreter, and the time until the first query against a SQLite database returns.
+
+Each measurement runs in a new subprocess, so nothing is cached in `sys.modules`.
+The import is also profiled with `python -X importtime`, to show which top-level
+packages dominate it, and whether any heavy optional dependencies are imported eagerly.
+
+Run with `python -m benchmark.startup`
+"""
+import json
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import pandas as pd
+from colorama import Fore
+
+NUM_RUNS = 5
+TOP_K = 10
+# Optional dependencies which should only be imported when used
+HEAVY_MODULES = ["guidance", "transformers", "torch", "skrub", "haystack", "diskcache"]
+
+TIMING_SCRIPT = """
+import json, sqlite3, sys, tempfile, time
+from pathlib import Path
+
+db_path = Path(tempfile.mkdtemp()) / "startup.db"
+con = sqlite3.connect(db_path)
+con.execute("CREATE TABLE t (name TEXT, value INTEGER)")
+con.executemany("INSERT INTO t VALUES (?, ?)", [(str(i), i) for i in range(100)])
+con.commit()
+con.close()
+
+start = time.perf_counter()
+import blendsql
+from blendsql.db import SQLite
+query_start = time.perf_counter()
+smoothie = blendsql.blend(
+    query="SELECT name FROM t WHERE value > 50 ORDER BY value", db=SQLite(db_path)
+)
+end = time.perf_counter()
+assert len(smoothie.df) == 49
+print(json.dumps({
+    "import": query_start - start,
+    "first_query": end - query_start,
+    "total": end - start,
+    "heavy_modules": [m for m in %r if m in sys.modules],
+}))
+""" % (
+    HEAVY_MODULES,
+)
+
+
+def run_timing() -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", TIMING_SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def profile_imports() -> Tuple[float, List[Tuple[str, float]]]:
+    """Returns the cumulative import time of `blendsql` in seconds, along with
+    the time spent importing each top-level package, sorted descending."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import blendsql"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    package_to_us: Dict[str, int] = defaultdict(int)
+    blendsql_us = 0
+    for line in stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if m is None:
+            continue
+        self_us, cumulative_us, indent, module = m.groups()
+        if module == "blendsql" and len(indent) == 1:
+            blendsql_us = int(cumulative_us)
+        # Attribute each module's own import time to its top-level package
+        package_to_us[module.split(".")[0]] += int(self_us)
+    ranked = sorted(package_to_us.items(), key=lambda x: x[1], reverse=True)
+    return (blendsql_us / 1e6, [(name, us / 1e6) for name, us in ranked])
+
+
+if __name__ == "__main__":
+    print(f"Timing cold startup over {NUM_RUNS} fresh interpreters...")
+    runs = [run_timing() for _ in range(NUM_RUNS)]
+    timings = pd.DataFrame(
+        {
+            "Stage": ["import blendsql", "first blend() query", "total"],
+            "Median (s)": [
+                statistics.median(r[k] for r in runs)
+                for k in ["import", "first_query", "total"]
+            ],
+            "Min (s)": [
+                min(r[k] for r in runs) for k in ["import", "first_query", "total"]
+            ],
+        }
+    )
+    print(Fore.GREEN + timings.to_markdown(index=False) + Fore.RESET)
+    heavy_modules = runs[-1]["heavy_modules"]
+    if heavy_modules:
+        print(
+            Fore.RED
+            + f"Heavy optional modules imported at startup: {heavy_modules}"
+            + Fore.RESET
+        )
+
+    blendsql_seconds, ranked = profile_imports()
+    print()
+    print(
+        f"`python -X importtime`: `import blendsql` took {blendsql_seconds:.3f}s cumulative"
+    )
+    packages = pd.DataFrame(ranked[:TOP_K], columns=["Package", "Self Time (s)"])
+    print(Fore.GREEN + packages.to_markdown(index=False) + Fore.RESET)
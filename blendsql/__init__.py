@@ -1,4 +1,7 @@
-from .blend import blend
+from .blend import blend, blend_async
+from ._explain import explain
+from ._blend_many import blend_many
+from ._process_pool import BlendProcessPool
 from .ingredients import (
     LLMQA,
     LLMMap,
@@ -9,3 +12,5 @@ from .ingredients import (
     RAGQA,
 )
 from . import _configure as config
+from ._plan_cache import plan_cache
+from ._result_cache import result_cache
@@ -0,0 +1,150 @@
+"""Executes a batch of BlendSQL queries, de-duplicating ingredient work across them.
+
+Queries issued in bulk (e.g. over an evaluation set) often pass heavily overlapping values
+to the same ingredients. Run independently, each query would send its own, partially
+overlapping set of requests to the model. Instead, `blend_many()`:
+
+1. Plans all queries with `explain()`, fetching the values passed to each `MapIngredient` call
+2. Merges calls with the same `MapIngredient.merge_key()`, and executes each merged call once
+   over the union of their values
+3. Executes each query with `blend()`, within `Model.share_outputs()`, so that merged outputs,
+   along with any identical requests across queries (e.g. the same `LLMQA` call), are re-used
+"""
+from contextlib import ExitStack
+from typing import Dict, Hashable, List, Optional, Type, Tuple
+from collections.abc import Collection
+from colorama import Fore
+
+from ._constants import IngredientKwarg, IngredientType
+from ._explain import explain, IngredientExplanation
+from ._logger import logger
+from ._smoothie import Smoothie
+from .blend import blend, Kitchen
+from .db import Database
+from .ingredients import Ingredient
+from .models import Model
+
+
+def _merge_calls(
+    explanations: List[IngredientExplanation], kitchen: Kitchen
+) -> Dict[Hashable, Tuple[Ingredient, List[IngredientExplanation]]]:
+    """Groups the `MapIngredient` calls which can be executed as one."""
+    merged_calls: Dict[Hashable, Tuple[Ingredient, List[IngredientExplanation]]] = {}
+    for explanation in explanations:
+        if (
+            explanation.ingredient_type != IngredientType.MAP
+            or IngredientKwarg.VALUES not in explanation.call_kwargs
+        ):
+            continue
+        ingredient = kitchen.get_from_name(explanation.ingredient)
+        key = ingredient.merge_key(**explanation.call_kwargs)
+        if key is None:
+            continue
+        merged_calls.setdefault(key, (ingredient, []))[1].append(explanation)
+    return merged_calls
+
+
+def blend_many(
+    queries: List[str],
+    db: Database,
+    default_model: Optional[Model] = None,
+    ingredients: Optional[Collection[Type[Ingredient]]] = None,
+    verbose: bool = False,
+    infer_gen_constraints: bool = True,
+    table_to_title: Optional[Dict[str, str]] = None,
+    schema_qualify: bool = True,
+) -> List[Smoothie]:
+    """Executes many BlendSQL queries against the same database, sending each
+    distinct ingredient request to the model only once.
+
+    Calls to a `MapIngredient` (e.g. `LLMMap`) which share a `merge_key()` are merged
+    into a single call over the union of their values, so values shared across queries are
+    only mapped once, in as few batches as possible. Identical requests (e.g. the same `LLMQA` question
+    over the same context) are de-duplicated as well, even if the model has `caching` disabled.
+
+    Since values are gathered before execution, they may include some which cost-based
+    predicate ordering would have filtered out of a single query (see `explain()`).
+
+    Args:
+        queries: The BlendSQL queries to execute
+        db: Database connector object
+        ingredients: Collection of ingredient objects, as passed to `blend()`
+        default_model: As in `blend()`
+        verbose: As in `blend()`
+        infer_gen_constraints: As in `blend()`
+        table_to_title: As in `blend()`
+        schema_qualify: As in `blend()`
+
+    Returns:
+        One `Smoothie` per query, in the order of `queries`
+
+    Examples:
+        ```python
+        from blendsql import blend_many, LLMMap
+
+        smoothies = blend_many(
+            queries=[
+                "SELECT * FROM w WHERE {{LLMMap('Is this a sport?', 'w::name')}} = TRUE",
+                "SELECT COUNT(*) FROM w WHERE {{LLMMap('Is this a sport?', 'w::name')}} = TRUE AND year > 2000",
+            ],
+            db=db,
+            ingredients={LLMMap},
+            default_model=model,
+        )
+        ```
+    """
+    ingredients = ingredients or []
+    kitchen = Kitchen(db=db, session_uuid="blend_many")
+    kitchen.extend(ingredients)
+    models = {
+        id(model): model
+        for model in [default_model]
+        + [getattr(ingredient, "model", None) for ingredient in kitchen]
+        if model is not None
+    }
+    with ExitStack() as stack:
+        for model in models.values():
+            stack.enter_context(model.share_outputs())
+        explanations: List[IngredientExplanation] = []
+        for query in queries:
+            explanations.extend(
+                explain(
+                    query=query,
+                    db=db,
+                    ingredients=ingredients,
+                    default_model=default_model,
+                    schema_qualify=schema_qualify,
+                    infer_gen_constraints=infer_gen_constraints,
+                ).ingredients
+            )
+        for ingredient, calls in _merge_calls(explanations, kitchen).values():
+            if len(calls) < 2:
+                # Nothing to merge, so we leave the call to `blend()`
+                continue
+            values = list(
+                dict.fromkeys(
+                    value
+                    for call in calls
+                    for value in call.call_kwargs[IngredientKwarg.VALUES]
+                )
+            )
+            logger.debug(
+                Fore.CYAN
+                + f"Merged {len(calls)} calls to `{ingredient.name}` over {len(values)} distinct values"
+                + Fore.RESET
+            )
+            ingredient.add_values_passed(len(values))
+            ingredient._run(**calls[0].call_kwargs | {IngredientKwarg.VALUES: values})
+        return [
+            blend(
+                query=query,
+                db=db,
+                default_model=default_model,
+                ingredients=ingredients,
+                verbose=verbose,
+                infer_gen_constraints=infer_gen_constraints,
+                table_to_title=table_to_title,
+                schema_qualify=schema_qualify,
+            )
+            for query in queries
+        ]
@@ -7,10 +7,92 @@ DEFAULT_ASYNC_LIMIT = "10"
 MAX_OPTIONS_IN_PROMPT_KEY = "MAX_OPTIONS_IN_PROMPT"
 DEFAULT_MAX_OPTIONS_IN_PROMPT = 50
 
+INGREDIENT_CONCURRENCY_KEY = "BLENDSQL_INGREDIENT_CONCURRENCY"
+DEFAULT_INGREDIENT_CONCURRENCY = "1"
+
+PLAN_CACHE_SIZE_KEY = "BLENDSQL_PLAN_CACHE_SIZE"
+DEFAULT_PLAN_CACHE_SIZE = "128"
+
+RESULT_CACHE_SIZE_KEY = "BLENDSQL_RESULT_CACHE_SIZE"
+DEFAULT_RESULT_CACHE_SIZE = "0"
+RESULT_CACHE_TTL_KEY = "BLENDSQL_RESULT_CACHE_TTL"
+
+REQUESTS_PER_MINUTE_KEY = "BLENDSQL_REQUESTS_PER_MINUTE"
+TOKENS_PER_MINUTE_KEY = "BLENDSQL_TOKENS_PER_MINUTE"
+
+MAP_BATCH_TOKEN_BUDGET_KEY = "BLENDSQL_MAP_BATCH_TOKEN_BUDGET"
+
+MAX_RETRIES_KEY = "BLENDSQL_MAX_RETRIES"
+DEFAULT_MAX_RETRIES = "5"
+
+POOL_SIZE_KEY = "BLENDSQL_POOL_SIZE"
+MAX_OVERFLOW_KEY = "BLENDSQL_MAX_OVERFLOW"
+
 
 def set_async_limit(n: int):
+    """Sets the maximum number of in-flight requests to a single remote model."""
     os.environ[ASYNC_LIMIT_KEY] = str(n)
 
 
+def set_requests_per_minute(n: int):
+    """Sets the maximum number of requests per minute sent to a single remote model.
+    By default, requests are not rate limited."""
+    os.environ[REQUESTS_PER_MINUTE_KEY] = str(n)
+
+
+def set_tokens_per_minute(n: int):
+    """Sets the maximum number of (estimated) tokens per minute sent to a single remote model.
+    By default, tokens are not rate limited."""
+    os.environ[TOKENS_PER_MINUTE_KEY] = str(n)
+
+
+def set_max_retries(n: int):
+    """Sets how many times a rate-limited request is retried before raising."""
+    os.environ[MAX_RETRIES_KEY] = str(n)
+
+
 def set_max_options_in_prompt(n: int):
     os.environ[MAX_OPTIONS_IN_PROMPT_KEY] = str(n)
+
+
+def set_plan_cache_size(n: int):
+    """Sets the maximum number of compiled query plans to keep in memory.
+    Setting to 0 disables plan caching."""
+    os.environ[PLAN_CACHE_SIZE_KEY] = str(n)
+
+
+def set_result_cache_size(n: int):
+    """Sets the maximum number of `blend()` results to keep in memory.
+    Defaults to 0, which disables result caching."""
+    os.environ[RESULT_CACHE_SIZE_KEY] = str(n)
+
+
+def set_result_cache_ttl(seconds: float):
+    """Sets how many seconds a cached `blend()` result stays valid.
+    By default, results only expire once evicted or invalidated."""
+    os.environ[RESULT_CACHE_TTL_KEY] = str(seconds)
+
+
+def set_ingredient_concurrency(n: int):
+    """Sets the maximum number of independent ingredient calls within a subquery
+    that may be executed at once. Defaults to 1 (sequential execution)."""
+    os.environ[INGREDIENT_CONCURRENCY_KEY] = str(n)
+
+
+def set_map_batch_token_budget(n: int):
+    """Sets the default per-request token budget used to pack values into `LLMMap` batches.
+    By default, batches are formed with a fixed `batch_size` instead."""
+    os.environ[MAP_BATCH_TOKEN_BUDGET_KEY] = str(n)
+
+
+def set_pool_size(n: int):
+    """Sets how many connections a SQLite or PostgreSQL database keeps open in its pool,
+    for concurrent `blend()` calls to check out. Defaults to SQLAlchemy's default of 5.
+    """
+    os.environ[POOL_SIZE_KEY] = str(n)
+
+
+def set_max_overflow(n: int):
+    """Sets how many connections a SQLite or PostgreSQL database may open beyond its pool size,
+    which are closed once returned. Defaults to SQLAlchemy's default of 10."""
+    os.environ[MAX_OVERFLOW_KEY] = str(n)
@@ -0,0 +1,86 @@
+"""Per-call state of a `blend()` call.
+
+A `Model` or `Database` may be shared by many concurrent `blend()` calls (e.g. in a threaded
+web server, or via `blend_async()`). So, state belonging to a single call lives on an
+`ExecutionContext` instead: the prompts and token usage reported in its `SmoothieMeta`,
+the temp tables and lazy tables it creates, and the database connection it creates them on.
+
+The context of the running call is held in a `ContextVar`. Ingredient calls executed on
+other threads (see `blendsql._scheduler`) run in a copy of the caller's context, so they find it too.
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, List, Optional
+
+from attr import attrs, attrib
+
+from .db._temp_tables import TempTableRegistry
+from .db.utils import LazyTables
+
+
+@attrs
+class ExecutionContext:
+    """State of a single `blend()` call.
+
+    Args:
+        db: The database the call executes against
+        connection: The connection checked out from `db` for this call (see `Database.open_connection()`)
+    """
+
+    db: Any = attrib()
+    connection: Any = attrib(default=None)
+
+    # Usage of all models called during execution
+    prompts: List[dict] = attrib(factory=list)
+    raw_prompts: List[str] = attrib(factory=list)
+    prompt_tokens: int = attrib(default=0)
+    completion_tokens: int = attrib(default=0)
+    num_calls: int = attrib(default=0)
+    batch_sizes: List[int] = attrib(factory=list)
+
+    # Tables this call has created on `connection`, or will create when collected
+    temp_tables: TempTableRegistry = attrib(factory=TempTableRegistry)
+    lazy_tables: LazyTables = attrib(factory=LazyTables)
+
+    # Serializes use of `connection` by the ingredient calls of this `blend()` call
+    lock: threading.RLock = attrib(factory=threading.RLock)
+    _usage_lock: threading.Lock = attrib(init=False, factory=threading.Lock)
+
+    def log_prompt(
+        self, prompt: dict, raw_prompt: str, num_tokens: int = 0, cached: bool = False
+    ) -> None:
+        with self._usage_lock:
+            self.prompts.insert(-1, prompt)
+            self.raw_prompts.insert(-1, raw_prompt)
+            if not cached:
+                self.num_calls += 1
+                self.prompt_tokens += num_tokens
+
+    def log_batch_sizes(self, batch_sizes: List[int]) -> None:
+        with self._usage_lock:
+            self.batch_sizes.extend(batch_sizes)
+
+
+_current_context: ContextVar[Optional[ExecutionContext]] = ContextVar(
+    "blendsql_execution_context", default=None
+)
+
+
+def current_context(db=None) -> Optional[ExecutionContext]:
+    """Returns the context of the running `blend()` call, if any.
+    If `db` is given, only returns the context if the call executes against `db`.
+    """
+    context = _current_context.get()
+    if context is None or (db is not None and context.db is not db):
+        return None
+    return context
+
+
+@contextmanager
+def use_context(context: ExecutionContext):
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
@@ -0,0 +1,388 @@
+"""Cost-based ordering of the `MapIngredient` predicates ANDed together in a `WHERE` clause.
+
+Given a query like
+
+    SELECT * FROM w WHERE {{LLMMap('q1', 'w::x')}} = TRUE AND {{LLMMap('q2', 'w::y')}} > 3
+
+each ingredient would otherwise map every distinct value of its column. Instead, we estimate
+the cost (values x tokens per value x model latency) and selectivity of each predicate,
+run the one with the lowest `cost / (1 - selectivity)` first, and delete the rows it rejected
+from the subquery's temp table before the next ingredient selects its values.
+"""
+import math
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from attr import attrs, attrib
+from colorama import Fore
+from sqlglot import exp
+
+from ._constants import IngredientKwarg, IngredientType, DataType
+from ._logger import logger
+from ._scheduler import IngredientCall
+from .db import Database
+from .db.utils import double_quote_escape
+from .models import Model
+from .models._rate_limit import count_tokens
+from .parse import check
+from .parse._parse import get_conjuncts
+from .utils import get_tablename_colname
+
+# Defaults from System R (Selinger et al., 1979), for when we can't say anything better
+DEFAULT_EQ_SELECTIVITY = 0.1
+DEFAULT_RANGE_SELECTIVITY = 1 / 3
+DEFAULT_SELECTIVITY = 0.5
+BOOLEAN_SELECTIVITY = 0.5
+
+
+@attrs
+class IngredientCost:
+    """Estimated and actual cost of a `MapIngredient` predicate.
+    Costs are relative, in units of tokens x model latency (in seconds per request).
+    """
+
+    name: str = attrib()  # The ingredient alias, e.g. '{{A()}}'
+    ingredient: str = attrib()
+    tablename: str = attrib()
+    predicate: str = attrib()
+    estimated_values: int = attrib()
+    estimated_tokens_per_value: float = attrib()
+    estimated_selectivity: float = attrib()
+    # Average latency of the model's requests so far, or 1. if we haven't seen any
+    latency: float = attrib(default=1.0)
+    actual_values: Optional[int] = attrib(default=None)
+    actual_tokens_per_value: Optional[float] = attrib(default=None)
+    # Fraction of values passed to the ingredient which satisfied the predicate
+    actual_selectivity: Optional[float] = attrib(default=None)
+
+    @property
+    def estimated_cost(self) -> float:
+        return self.estimated_values * self.estimated_tokens_per_value * self.latency
+
+    @property
+    def actual_cost(self) -> Optional[float]:
+        if self.actual_values is None:
+            return None
+        return self.actual_values * self.actual_tokens_per_value * self.latency
+
+    @property
+    def rank(self) -> float:
+        """Predicates ANDed together are cheapest to evaluate in ascending order of rank
+        (Hellerstein & Stonebraker, 1993).
+        """
+        if self.estimated_selectivity >= 1:
+            return math.inf
+        return self.estimated_cost / (1 - self.estimated_selectivity)
+
+
+def get_filter_predicates(node: exp.Expression) -> Dict[str, exp.Expression]:
+    """Returns the top-level `AND` operands of the `WHERE` clause which compare a single
+    ingredient alias to literals, keyed by that alias.
+
+    Examples:
+        ```python
+        get_filter_predicates(
+            _parse_one("SELECT * FROM w WHERE {{A()}} = 1 AND w.x > 2 AND {{B()}} > w.y")
+        )
+        > {"{{A()}}": {{A()}} = 1}
+        ```
+    """
+    where = node.args.get("where")
+    predicates: Dict[str, List[exp.Expression]] = {}
+    for conjunct in get_conjuncts(where.this if where is not None else None):
+        if conjunct.find(exp.Select) is not None:
+            continue
+        identifiers = list(conjunct.find_all(exp.Identifier))
+        if len(identifiers) != 1 or not check.is_ingredient_node(identifiers[0]):
+            continue
+        predicates.setdefault(identifiers[0].this, []).append(conjunct)
+    return {
+        alias: exp.and_(*conjuncts) if len(conjuncts) > 1 else conjuncts[0]
+        for alias, conjuncts in predicates.items()
+    }
+
+
+def estimate_selectivity(
+    predicate: exp.Expression, output_type: Optional[DataType] = None
+) -> float:
+    """Estimates the fraction of values satisfying `predicate`, from its shape alone."""
+    if isinstance(predicate, exp.Paren):
+        return estimate_selectivity(predicate.this, output_type)
+    if isinstance(predicate, exp.Not):
+        return 1 - estimate_selectivity(predicate.this, output_type)
+    if isinstance(predicate, exp.And):
+        return estimate_selectivity(predicate.left, output_type) * estimate_selectivity(
+            predicate.right, output_type
+        )
+    if isinstance(predicate, (exp.EQ, exp.NEQ)):
+        if isinstance(predicate.expression, exp.Boolean) or (
+            getattr(output_type, "name", None) == "bool"
+        ):
+            selectivity = BOOLEAN_SELECTIVITY
+        else:
+            selectivity = DEFAULT_EQ_SELECTIVITY
+        return selectivity if isinstance(predicate, exp.EQ) else 1 - selectivity
+    if isinstance(predicate, (exp.GT, exp.GTE, exp.LT, exp.LTE)):
+        return DEFAULT_RANGE_SELECTIVITY
+    if isinstance(predicate, exp.Between):
+        return DEFAULT_RANGE_SELECTIVITY**2
+    if isinstance(predicate, exp.In):
+        return min(
+            len(predicate.expressions) * DEFAULT_EQ_SELECTIVITY, DEFAULT_SELECTIVITY
+        )
+    if isinstance(predicate, (exp.Like, exp.ILike)):
+        return DEFAULT_EQ_SELECTIVITY
+    if isinstance(predicate, (exp.Column, exp.Identifier)):
+        # e.g. `WHERE {{LLMMap('Is this true?', 'w::x')}}`
+        return BOOLEAN_SELECTIVITY
+    return DEFAULT_SELECTIVITY
+
+
+def get_latency(model: Optional[Model]) -> float:
+    if model is None:
+        return 1.0
+    metrics = model.scheduler.metrics
+    if metrics.completed == 0:
+        return 1.0
+    return metrics.avg_latency_seconds
+
+
+def estimate_cost(
+    db: Database,
+    name: str,
+    ingredient: str,
+    tablename: str,
+    temp_tablename: str,
+    colname: str,
+    predicate: exp.Expression,
+    dialect,
+    kwargs_dict: dict,
+) -> IngredientCost:
+    """Estimates the cost of mapping the distinct values of `colname` in `temp_tablename`,
+    the subquery's temp table for `tablename`.
+    """
+    quoted_column = f'"{double_quote_escape(colname)}"'
+    num_values, num_chars = db.execute_to_df(
+        f"SELECT COUNT(*), SUM(LENGTH(CAST({quoted_column} AS TEXT))) FROM "
+        f'(SELECT DISTINCT {quoted_column} FROM "{double_quote_escape(temp_tablename)}") AS "_values"'
+    ).iloc[0]
+    num_values = int(num_values)
+    num_chars = 0 if pd.isna(num_chars) else int(num_chars)
+    model = kwargs_dict.get(IngredientKwarg.MODEL)
+    return IngredientCost(
+        name=name,
+        ingredient=ingredient,
+        tablename=tablename,
+        predicate=predicate.sql(dialect=dialect),
+        estimated_values=num_values,
+        # +1 for the separator between values
+        estimated_tokens_per_value=math.ceil(num_chars / max(num_values, 1) / 4) + 1,
+        estimated_selectivity=estimate_selectivity(
+            predicate, kwargs_dict.get(IngredientKwarg.OUTPUT_TYPE)
+        ),
+        latency=get_latency(model),
+    )
+
+
+def apply_filter(
+    db: Database,
+    cost: IngredientCost,
+    predicate: exp.Expression,
+    temp_tablename: str,
+    colname: str,
+    new_col: str,
+    subtable: pd.DataFrame,
+    filter_tablename: str,
+    dialect,
+) -> None:
+    """Deletes the rows of `temp_tablename` whose value in `colname` doesn't satisfy `predicate`,
+    given the ingredient outputs in `subtable`. Records the actual selectivity on `cost`.
+    """
+    if len(subtable) == 0:
+        return
+    quoted_column = f'"{double_quote_escape(colname)}"'
+    quoted_filter_tablename = f'"{double_quote_escape(filter_tablename)}"'
+    db.to_temp_table(subtable, tablename=filter_tablename)
+    output_predicate = predicate.transform(
+        lambda node: exp.column(new_col, table=filter_tablename, quoted=True)
+        if check.is_ingredient_node(node) and not isinstance(node.parent, exp.Column)
+        else node
+    ).sql(dialect=dialect)
+    (num_passing,) = db.execute_to_list(
+        f"SELECT COUNT(*) FROM {quoted_filter_tablename} WHERE {output_predicate}"
+    )
+    cost.actual_selectivity = num_passing / len(subtable)
+    # `IN` never matches NULL, so we check for that separately
+    db.delete_from_temp_table(
+        temp_tablename,
+        keep_condition=f"{quoted_column} IN (SELECT {quoted_column} FROM {quoted_filter_tablename} WHERE {output_predicate})"
+        f" OR ({quoted_column} IS NULL AND EXISTS (SELECT 1 FROM {quoted_filter_tablename} WHERE {quoted_filter_tablename}.{quoted_column} IS NULL AND {output_predicate}))",
+    )
+
+
+def _run_and_filter(
+    fn: Callable,
+    db: Database,
+    cost: IngredientCost,
+    predicate: exp.Expression,
+    temp_tablename: str,
+    colname: str,
+    filter_tablename: Optional[str],
+    dialect,
+    tokenizer=None,
+):
+    function_out = fn()
+    new_col, _, _, subtable = function_out
+    cost.actual_values = len(subtable)
+    cost.actual_tokens_per_value = sum(
+        count_tokens(str(v), tokenizer) + 1 for v in subtable[colname]
+    ) / max(len(subtable), 1)
+    # If nothing else reads this table, there's no need to filter it
+    if filter_tablename is not None:
+        apply_filter(
+            db=db,
+            cost=cost,
+            predicate=predicate,
+            temp_tablename=temp_tablename,
+            colname=colname,
+            new_col=new_col,
+            subtable=subtable,
+            filter_tablename=filter_tablename,
+            dialect=dialect,
+        )
+    logger.debug(
+        Fore.CYAN
+        + f"`{cost.name}` mapped {cost.actual_values} values (estimated {cost.estimated_values}), "
+        + f"with selectivity {cost.actual_selectivity} (estimated {cost.estimated_selectivity:.2f})"
+        + Fore.RESET
+    )
+    return function_out
+
+
+def order_ingredient_calls(
+    db: Database,
+    node: exp.Expression,
+    dialect,
+    calls: List[IngredientCall],
+    prepared: List[Tuple[str, object, list, dict]],
+    get_temp_subquery_table: Callable,
+    get_temp_session_table: Callable,
+    aliases_to_tablenames: Dict[str, str],
+) -> Tuple[List[int], List[IngredientCost]]:
+    """Orders the `MapIngredient` predicates ANDed together in the `WHERE` clause of `node`
+    by ascending rank, and makes each delete the rows it rejected from the subquery's temp table,
+    so that later calls over the same table only map the surviving values.
+
+    The calls are modified in place, such that later calls reading a filtered table wait on its filters.
+
+    Args:
+        calls: The prepared ingredient calls, in the order they appear in the query
+        prepared: For each call, the tuple (alias, ingredient, args, kwargs_dict)
+
+    Returns:
+        Tuple containing the order to execute `calls` in, and the cost of each reordered predicate
+    """
+    predicates = get_filter_predicates(node)
+    # Mapping from tablename to the (call index, colname) of its filter predicates
+    table_to_filters: Dict[str, List[Tuple[int, str]]] = {}
+    for idx, (alias, ingredient, args, kwargs_dict) in enumerate(prepared):
+        if alias not in predicates or ingredient.ingredient_type != IngredientType.MAP:
+            continue
+        context = kwargs_dict.get(
+            IngredientKwarg.CONTEXT, args[1] if len(args) > 1 else None
+        )
+        if (
+            not isinstance(context, str)
+            or "::" not in context
+            or check.is_blendsql_query(context)
+        ):
+            continue
+        tablename, colname = get_tablename_colname(context)
+        tablename = aliases_to_tablenames.get(tablename, tablename)
+        # Ingredients only read from the subquery's temp table, if no previous subquery mapped this table
+        if db.has_temp_table(get_temp_session_table(tablename)):
+            continue
+        if not db.has_temp_table(get_temp_subquery_table(tablename)) and (
+            tablename in db.lazy_tables or not db.has_table(tablename)
+        ):
+            continue
+        table_to_filters.setdefault(tablename, []).append((idx, colname))
+    order: List[int] = []
+    costs: List[IngredientCost] = []
+    for tablename, filters in table_to_filters.items():
+        filter_indices = {idx for idx, _ in filters}
+        other_readers = [
+            idx
+            for idx, call in enumerate(calls)
+            if tablename in call.reads and idx not in filter_indices
+        ]
+        # Other ingredient types may need the rows a filter rejects
+        if any(
+            prepared[idx][1].ingredient_type != IngredientType.MAP
+            for idx in other_readers
+        ):
+            continue
+        if len(filters) + len(other_readers) < 2:
+            continue
+        temp_tablename = get_temp_subquery_table(tablename)
+        if not db.has_temp_table(temp_tablename):
+            # No other predicates applied to this table, so we need a copy we can filter
+            db.query_to_temp_table(
+                f'SELECT * FROM "{double_quote_escape(tablename)}"',
+                tablename=temp_tablename,
+            )
+        table_costs = []
+        for idx, colname in filters:
+            alias, ingredient, _, kwargs_dict = prepared[idx]
+            table_costs.append(
+                (
+                    estimate_cost(
+                        db=db,
+                        name=alias,
+                        ingredient=ingredient.name,
+                        tablename=tablename,
+                        temp_tablename=temp_tablename,
+                        colname=colname,
+                        predicate=predicates[alias],
+                        dialect=dialect,
+                        kwargs_dict=kwargs_dict,
+                    ),
+                    idx,
+                    colname,
+                )
+            )
+        table_costs.sort(key=lambda x: x[0].rank)
+        for position, (cost, idx, colname) in enumerate(table_costs):
+            model = prepared[idx][3].get(IngredientKwarg.MODEL)
+            is_last_reader = position == len(table_costs) - 1 and not other_readers
+            calls[idx].fn = partial(
+                _run_and_filter,
+                calls[idx].fn,
+                db=db,
+                cost=cost,
+                predicate=predicates[cost.name],
+                temp_tablename=temp_tablename,
+                colname=colname,
+                filter_tablename=None
+                if is_last_reader
+                else f"{temp_tablename}_filter{position}",
+                dialect=dialect,
+                tokenizer=getattr(model, "tokenizer", None),
+            )
+            calls[idx].writes.add(f"rows::{tablename}")
+            order.append(idx)
+            costs.append(cost)
+        for idx in other_readers:
+            calls[idx].reads.add(f"rows::{tablename}")
+        logger.debug(
+            Fore.CYAN
+            + f"Ordered predicates on `{tablename}` by estimated cost: "
+            + ", ".join(
+                f"{cost.name} ({cost.estimated_cost:.1f}, selectivity {cost.estimated_selectivity:.2f})"
+                for cost, _, _ in table_costs
+            )
+            + Fore.RESET
+        )
+    order.extend(idx for idx in range(len(calls)) if idx not in set(order))
+    return order, costs
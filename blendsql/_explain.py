@@ -0,0 +1,528 @@
+"""Explains how `blend()` would execute a query, without calling any models.
+
+Before executing ingredients, `blend()` materializes the rows of each table which could
+possibly contribute to the query result (see `SubqueryContextManager.abstracted_table_selects()`).
+Beyond the predicates written against a table directly, these selects may contain rewrites:
+semi-joins onto the tables it's joined with, and superset conditions derived from `OR`s and `CASE`s
+containing ingredients. `explain()` runs the same preprocessing, along with cheap `COUNT` queries,
+to show how many rows and distinct ingredient values each rewrite eliminated.
+
+It then fetches the values each ingredient would receive, and asks the ingredient
+(via `Ingredient.estimate()`) how many prompts and prompt tokens it would send to its model.
+"""
+import inspect
+from typing import Any, Collection, Dict, Iterator, List, Optional, Tuple, Type
+
+from attr import attrs, attrib
+from sqlglot import exp
+
+from ._constants import IngredientKwarg, IngredientType
+from .blend import (
+    Kitchen,
+    preprocess_blendsql,
+    autowrap_query,
+    get_subquery_str,
+    get_sorted_grammar_matches,
+)
+from .db import Database
+from .db.utils import double_quote_escape
+from .ingredients import Ingredient, IngredientEstimate
+from .ingredients.utils import unpack_options
+from .models import Model
+from .parse import SubqueryContextManager, get_dialect, _parse_one, check
+from .parse import transform, get_reversed_subqueries, PushdownRewrite
+from .utils import get_tablename_colname
+
+
+@attrs
+class RewriteExplanation:
+    rewrite: PushdownRewrite = attrib()
+    # Number of rows the rewrite eliminated, on top of all other conditions
+    rows_eliminated: Optional[int] = attrib(default=None)
+    # Per ingredient column, the number of distinct values no longer passed to the ingredient
+    values_eliminated: Dict[str, int] = attrib(factory=dict)
+
+
+@attrs
+class TableExplanation:
+    tablename: str = attrib()
+    # The query materializing the rows passed to ingredients
+    abstracted_query: str = attrib()
+    # None if the table doesn't exist before execution (e.g. a CTE)
+    num_rows: Optional[int] = attrib(default=None)
+    # Per ingredient column, the number of distinct values passed to the ingredient
+    num_values: Dict[str, int] = attrib(factory=dict)
+    rewrites: List[RewriteExplanation] = attrib(factory=list)
+
+
+@attrs
+class IngredientExplanation:
+    # The alias the ingredient has in `Explanation.query`, e.g. `{{A()}}`
+    alias: str = attrib()
+    # The ingredient call, as written in the original query
+    raw: str = attrib()
+    ingredient: str = attrib()
+    ingredient_type: str = attrib()
+    # None if the values only exist during execution (e.g. they come from a CTE)
+    num_values: Optional[int] = attrib(default=None)
+    estimate: IngredientEstimate = attrib(factory=IngredientEstimate)
+    # Explanations of BlendSQL queries passed to this ingredient as `context` or `options`
+    children: List["Explanation"] = attrib(factory=list)
+    # The arguments `Ingredient.estimate()` was called with, as `run()` would be
+    call_kwargs: Dict[str, Any] = attrib(factory=dict, repr=False)
+
+
+@attrs
+class SubqueryExplanation:
+    subquery: str = attrib()
+    tables: List[TableExplanation] = attrib(factory=list)
+    # In order of execution
+    ingredients: List[IngredientExplanation] = attrib(factory=list)
+
+
+def _format_estimate(ingredient: IngredientExplanation) -> str:
+    s = f"values: {ingredient.num_values if ingredient.num_values is not None else '?'}"
+    estimate = ingredient.estimate
+    if estimate.num_cached_values is not None:
+        s += f" ({estimate.num_cached_values} cached)"
+    if estimate.num_prompts is not None:
+        s += f", prompts: {estimate.num_prompts}"
+    if estimate.prompt_tokens is not None:
+        s += f", prompt tokens: ~{estimate.prompt_tokens}"
+    return s
+
+
+@attrs
+class Explanation:
+    query: str = attrib()
+    subqueries: List[SubqueryExplanation] = attrib(factory=list)
+
+    @property
+    def tables(self) -> List[TableExplanation]:
+        return [t for subquery in self.subqueries for t in subquery.tables]
+
+    @property
+    def ingredients(self) -> List[IngredientExplanation]:
+        """All ingredient calls, including those in nested BlendSQL queries."""
+        return list(self._iter_ingredients())
+
+    def _iter_ingredients(self) -> Iterator[IngredientExplanation]:
+        for subquery in self.subqueries:
+            for ingredient in subquery.ingredients:
+                yield ingredient
+                for child in ingredient.children:
+                    yield from child._iter_ingredients()
+
+    def _total(self, name: str) -> int:
+        # Ingredients which can't estimate themselves aren't counted
+        return sum(
+            getattr(i.estimate, name)
+            for i in self.ingredients
+            if getattr(i.estimate, name) is not None
+        )
+
+    @property
+    def num_prompts(self) -> int:
+        return self._total("num_prompts")
+
+    @property
+    def prompt_tokens(self) -> int:
+        return self._total("prompt_tokens")
+
+    @property
+    def num_cached_values(self) -> int:
+        return self._total("num_cached_values")
+
+    def _lines(self, indent: str = "") -> List[str]:
+        lines = [indent + self.query]
+        for subquery in self.subqueries:
+            lines.append(f"{indent}  subquery: {subquery.subquery}")
+            for table in subquery.tables:
+                lines.append(f"{indent}    {table.tablename}: {table.abstracted_query}")
+                if table.num_rows is not None:
+                    lines.append(f"{indent}      rows: {table.num_rows}")
+                for column, num_values in table.num_values.items():
+                    lines.append(
+                        f"{indent}      distinct values of `{column}`: {num_values}"
+                    )
+                for r in table.rewrites:
+                    lines.append(
+                        f"{indent}      {r.rewrite.kind}: {r.rewrite.condition}"
+                    )
+                    if r.rows_eliminated is not None:
+                        lines.append(
+                            f"{indent}        eliminated rows: {r.rows_eliminated}"
+                        )
+                    for column, num_values in r.values_eliminated.items():
+                        lines.append(
+                            f"{indent}        eliminated values of `{column}`: {num_values}"
+                        )
+            for ingredient in subquery.ingredients:
+                lines.append(
+                    f"{indent}    {ingredient.ingredient_type} {ingredient.raw}: {_format_estimate(ingredient)}"
+                )
+                for child in ingredient.children:
+                    lines.extend(child._lines(indent=indent + "      "))
+        return lines
+
+    def __str__(self):
+        return "\n".join(
+            self._lines()
+            + [
+                f"total prompts: {self.num_prompts}, prompt tokens: ~{self.prompt_tokens}, cached values: {self.num_cached_values}"
+            ]
+        )
+
+
+def _count(db: Database, query: str, columns: List[str]) -> Tuple[int, Dict[str, int]]:
+    """Returns the number of rows, and distinct values in each of `columns`, selected by `query`."""
+    count_exprs = ["COUNT(*)"] + [
+        f'COUNT(DISTINCT "{double_quote_escape(c)}")' for c in columns
+    ]
+    counts = db.execute_to_df(
+        f'SELECT {", ".join(count_exprs)} FROM ({query.rstrip(";")}) AS "_explain"'
+    ).iloc[0]
+    return int(counts.iloc[0]), {c: int(n) for c, n in zip(columns, counts.iloc[1:])}
+
+
+def _fetch_values(
+    db: Database,
+    value_queries: Dict[str, str],
+    tablename: str,
+    colname: str,
+    **kwargs,
+) -> Optional[list]:
+    """Fetches the distinct values of `colname` an ingredient would receive.
+    These come from the materialized rows of the current subquery, if there are any.
+    """
+    if tablename in value_queries:
+        source = f'({value_queries[tablename].rstrip(";")}) AS "_explain"'
+    elif db.has_table(tablename):
+        source = f'"{double_quote_escape(tablename)}"'
+    else:
+        return None
+    return db.execute_to_list(
+        f'SELECT DISTINCT "{double_quote_escape(colname)}" FROM {source}', **kwargs
+    )
+
+
+def _bind_arguments(ingredient: Ingredient, args: list, kwargs_dict: dict) -> dict:
+    """Maps the arguments of an ingredient call onto the parameters of `Ingredient.__call__()`."""
+    arguments = dict(
+        inspect.signature(ingredient.__call__)
+        .bind_partial(*args, **kwargs_dict)
+        .arguments
+    )
+    arguments.pop("args", None)
+    return arguments | arguments.pop("kwargs", {})
+
+
+def _explain_ingredient(
+    db: Database,
+    alias: str,
+    parsed_results_dict: dict,
+    kwargs_dict: dict,
+    ingredient: Ingredient,
+    aliases_to_tablenames: Dict[str, str],
+    value_queries: Dict[str, str],
+    **explain_kwargs,
+) -> IngredientExplanation:
+    explanation = IngredientExplanation(
+        alias=alias,
+        raw=parsed_results_dict["raw"],
+        ingredient=ingredient.name,
+        ingredient_type=ingredient.ingredient_type,
+    )
+    args = parsed_results_dict["args"]
+    # As in `_blend()`, BlendSQL queries passed as `context` or `options` are executed first
+    for i, unpack_kwarg in enumerate(
+        [IngredientKwarg.CONTEXT, IngredientKwarg.OPTIONS]
+    ):
+        unpack_value = kwargs_dict.get(
+            unpack_kwarg,
+            (args[i + 1] if len(args) > i + 1 else (args[i] if len(args) > i else "")),
+        )
+        if not (
+            isinstance(unpack_value, str) and check.is_blendsql_query(unpack_value)
+        ):
+            continue
+        child = explain(query=unpack_value, db=db, **explain_kwargs)
+        if len(child.ingredients) > 0:
+            # The result depends on the model, so we can't know it before execution
+            explanation.children.append(child)
+            subtable = None
+        else:
+            subtable = db.execute_to_df(child.query)
+        if unpack_kwarg == IngredientKwarg.OPTIONS:
+            kwargs_dict[unpack_kwarg] = (
+                list(subtable.values.flat) if subtable is not None else None
+            )
+        else:
+            kwargs_dict[unpack_kwarg] = subtable
+            args = args[:1]
+    arguments = _bind_arguments(ingredient, args, kwargs_dict)
+    options = arguments.get(IngredientKwarg.OPTIONS)
+    if options is not None:
+        options = list(
+            unpack_options(
+                options=options, aliases_to_tablenames=aliases_to_tablenames, db=db
+            )
+        )
+    call_kwargs: Dict[str, Any] = ingredient.__dict__ | arguments
+    if ingredient.ingredient_type == IngredientType.MAP:
+        tablename, colname = get_tablename_colname(arguments[IngredientKwarg.CONTEXT])
+        tablename = aliases_to_tablenames.get(tablename, tablename)
+        values = _fetch_values(db, value_queries, tablename, colname)
+        if values is None:
+            return explanation
+        explanation.num_values = len(values)
+        call_kwargs |= {
+            IngredientKwarg.VALUES: values,
+            IngredientKwarg.OPTIONS: options,
+            "tablename": tablename,
+            "colname": colname,
+        }
+    elif ingredient.ingredient_type == IngredientType.QA:
+        context = arguments.get(IngredientKwarg.CONTEXT)
+        if isinstance(context, str):
+            tablename, colname = get_tablename_colname(context)
+            context = None
+            if db.has_table(tablename):
+                context = db.execute_to_df(
+                    f'SELECT "{double_quote_escape(colname)}" FROM "{double_quote_escape(tablename)}"'
+                )
+        if context is not None:
+            explanation.num_values = len(context)
+        call_kwargs |= {
+            IngredientKwarg.CONTEXT: context,
+            IngredientKwarg.OPTIONS: options,
+        }
+    elif ingredient.ingredient_type == IngredientType.JOIN:
+        lr_values = []
+        for on_arg in [arguments.get("left_on"), arguments.get("right_on")]:
+            tablename, colname = get_tablename_colname(on_arg)
+            tablename = aliases_to_tablenames.get(tablename, tablename)
+            values = _fetch_values(db, value_queries, tablename, colname, to_type=str)
+            if values is None:
+                return explanation
+            lr_values.append(values)
+        left_values, right_values = sorted(lr_values, key=len)
+        if arguments.get(IngredientKwarg.QUESTION) is None:
+            # Values which align exactly aren't passed to the model
+            matches = set(left_values) & set(right_values)
+            left_values = [v for v in left_values if v not in matches]
+            right_values = [v for v in right_values if v not in matches]
+        explanation.num_values = len(left_values) + len(right_values)
+        call_kwargs |= {"left_values": left_values, "right_values": right_values}
+    explanation.call_kwargs = call_kwargs
+    explanation.estimate = ingredient.estimate(**call_kwargs)
+    return explanation
+
+
+def explain(
+    query: str,
+    db: Database,
+    ingredients: Optional[Collection[Type[Ingredient]]] = None,
+    default_model: Optional[Model] = None,
+    schema_qualify: bool = True,
+    infer_gen_constraints: bool = True,
+) -> Explanation:
+    '''Shows how `blend()` would execute a query, without calling any models.
+
+    For each subquery, this includes which rows of each table get passed to ingredients,
+    and how many each predicate pushdown rewrite eliminated. For each ingredient call,
+    this includes the number of distinct values it receives, along with the prompts, prompt tokens
+    and model cache hits it predicts (see `Ingredient.estimate()`).
+
+    Value counts are upper bounds: during execution, ingredient predicates may filter
+    the values passed to those run after them (see `blendsql._cost`).
+
+    Args:
+        query: The BlendSQL query to explain
+        db: Database connector object
+        ingredients: Collection of ingredient objects, as passed to `blend()`
+        default_model: As in `blend()`. Used to count tokens and check the model's cache.
+            Without a model, tokens are estimated with a heuristic and no cache hits are predicted.
+        schema_qualify: As in `blend()`
+        infer_gen_constraints: As in `blend()`. This changes the arguments ingredients are called with
+            (e.g. the `output_type` of an `LLMMap` call), so should match the `blend()` call being explained.
+
+    Returns:
+        Explanation, with one entry per subquery
+
+    Examples:
+        ```python
+        from blendsql import explain
+        from blendsql.ingredients import LLMMap
+
+        query = """
+        SELECT * FROM account_history JOIN constituents
+        ON account_history.Symbol = constituents.Symbol
+        WHERE constituents.Sector = 'Information Technology'
+        AND {{LLMMap('Is this a dividend payment?', 'account_history::Action')}} = TRUE
+        """
+        explanation = explain(query, db=db, ingredients={LLMMap}, default_model=model)
+        print(explanation)
+        print(explanation.num_prompts, explanation.prompt_tokens)
+        ```
+    '''
+    dialect = get_dialect(db.__class__.__name__)
+    explain_kwargs = dict(
+        ingredients=ingredients,
+        default_model=default_model,
+        schema_qualify=schema_qualify,
+        infer_gen_constraints=infer_gen_constraints,
+    )
+    kitchen = Kitchen(db=db, session_uuid="explain")
+    kitchen.extend(ingredients or [])
+    (
+        query,
+        ingredient_alias_to_parsed_dict,
+        tables_in_ingredients,
+        kitchen,
+        ingredients,
+    ) = preprocess_blendsql(
+        query=query,
+        kitchen=kitchen,
+        ingredients=ingredients or [],
+        default_model=default_model,
+    )
+    query = autowrap_query(
+        query=query,
+        kitchen=kitchen,
+        ingredient_alias_to_parsed_dict=ingredient_alias_to_parsed_dict,
+    )
+    explanation = Explanation(query=query)
+    if len(ingredient_alias_to_parsed_dict) == 0:
+        return explanation
+    node = _parse_one(
+        query, dialect=dialect, schema=db.sqlglot_schema if schema_qualify else None
+    )
+    # CTEs are only materialized during execution
+    lazy_tablenames = {cte.alias for cte in node.find_all(exp.CTE)}
+    prev_subquery_has_ingredient = False
+    for subquery in get_reversed_subqueries(node):
+        if subquery.find(exp.With) is not None:
+            subquery = subquery.transform(transform.remove_ctes)
+        subquery_str = get_subquery_str(subquery, dialect=dialect)
+        if subquery_str is None:
+            continue
+        in_cte, table_alias_name = check.in_cte(subquery, return_name=True)
+
+        scm_kwargs = dict(
+            dialect=dialect,
+            prev_subquery_has_ingredient=prev_subquery_has_ingredient,
+            alias_to_subquery={table_alias_name: subquery} if in_cte else {},
+            tables_in_ingredients=tables_in_ingredients,
+            lazy_tablenames=lazy_tablenames,
+        )
+        scm = SubqueryContextManager(
+            node=_parse_one(subquery_str, dialect=dialect), **scm_kwargs
+        )
+        abstracted_selects = list(scm.abstracted_table_selects())
+        subquery_aliases = [
+            alias for alias in ingredient_alias_to_parsed_dict if alias in subquery_str
+        ]
+        subquery_explanation = SubqueryExplanation(subquery=subquery_str)
+        # Tablename to the query materializing its rows, if we can execute it
+        value_queries: Dict[str, str] = {}
+        for tablename, _, abstracted_query in abstracted_selects:
+            table_aliasname = scm.tablename_to_alias.get(tablename, None)
+            if (tablename not in tables_in_ingredients) and (
+                table_aliasname not in tables_in_ingredients
+            ):
+                continue
+            table_explanation = TableExplanation(
+                tablename=tablename, abstracted_query=abstracted_query
+            )
+            subquery_explanation.tables.append(table_explanation)
+            columns = []
+            for alias in subquery_aliases:
+                parsed_results_dict = ingredient_alias_to_parsed_dict[alias]
+                args = parsed_results_dict["args"]
+                context_arg = parsed_results_dict["kwargs_dict"].get(
+                    IngredientKwarg.CONTEXT, args[1] if len(args) > 1 else None
+                )
+                if context_arg is None or check.is_blendsql_query(context_arg):
+                    continue
+                arg_tablename, colname = get_tablename_colname(context_arg)
+                if arg_tablename in (tablename, table_aliasname) and (
+                    colname not in columns
+                ):
+                    columns.append(colname)
+            if any(
+                t.name in lazy_tablenames or t.name in scm.alias_to_subquery
+                for t in _parse_one(abstracted_query, dialect=dialect).find_all(
+                    exp.Table
+                )
+            ):
+                continue
+            value_queries[tablename] = abstracted_query
+            table_explanation.num_rows, table_explanation.num_values = _count(
+                db, abstracted_query, columns
+            )
+            for rewrite in scm.rewrites:
+                if rewrite.tablename != tablename:
+                    continue
+                query_without_rewrite = next(
+                    (
+                        q
+                        for t, _, q in SubqueryContextManager(
+                            node=_parse_one(subquery_str, dialect=dialect),
+                            skip_rewrites={rewrite.condition},
+                            **scm_kwargs,
+                        ).abstracted_table_selects()
+                        if t == tablename
+                    ),
+                    f'SELECT * FROM "{double_quote_escape(tablename)}"',
+                )
+                num_rows, num_values = _count(db, query_without_rewrite, columns)
+                table_explanation.rewrites.append(
+                    RewriteExplanation(
+                        rewrite=rewrite,
+                        rows_eliminated=num_rows - table_explanation.num_rows,
+                        values_eliminated={
+                            c: num_values[c] - table_explanation.num_values[c]
+                            for c in columns
+                        },
+                    )
+                )
+        if prev_subquery_has_ingredient:
+            scm.set_node(scm.node.transform(transform.maybe_set_subqueries_to_true))
+        explained_aliases = set()
+        for (
+            start,
+            end,
+            alias,
+            parsed_results_dict,
+            ingredient,
+        ) in get_sorted_grammar_matches(
+            q=scm.sql(),
+            ingredient_alias_to_parsed_dict=ingredient_alias_to_parsed_dict,
+            kitchen=kitchen,
+        ):
+            prev_subquery_has_ingredient = True
+            if alias in explained_aliases:
+                continue
+            explained_aliases.add(alias)
+            kwargs_dict = dict(parsed_results_dict["kwargs_dict"])
+            if infer_gen_constraints:
+                kwargs_dict = (
+                    scm.infer_gen_constraints(start=start, end=end) | kwargs_dict
+                )
+            if getattr(ingredient, "model", None) is not None:
+                kwargs_dict[IngredientKwarg.MODEL] = ingredient.model
+            subquery_explanation.ingredients.append(
+                _explain_ingredient(
+                    db=db,
+                    alias=alias,
+                    parsed_results_dict=parsed_results_dict,
+                    kwargs_dict=kwargs_dict,
+                    ingredient=ingredient,
+                    aliases_to_tablenames=scm.alias_to_tablename,
+                    value_queries=value_queries,
+                    **explain_kwargs,
+                )
+            )
+        explanation.subqueries.append(subquery_explanation)
+    return explanation
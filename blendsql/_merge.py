@@ -0,0 +1,125 @@
+"""Combines the outputs of `MapIngredient` calls with the table they were applied to.
+
+Each `MapIngredient` returns a narrow table, mapping each distinct value of the column it
+was applied to onto its output. Rather than merging these into a full copy of the original
+table, we write each to its own small (indexed) 'side table', and expose the session table
+as a view which looks up each new column in its side table:
+
+```sql
+CREATE TEMP VIEW "{session_uuid}_{tablename}" AS
+SELECT "t".*, (
+    SELECT "s"."Is this a pizza shop?" FROM "{session_uuid}_{tablename}_map0" AS "s"
+    WHERE "s"."merchant" = "t"."merchant"
+) AS "Is this a pizza shop?"
+FROM "{tablename}" AS "t"
+```
+
+This way, adding a column costs O(distinct values), instead of O(rows x columns).
+The lookups are only executed lazily, as part of the queries reading the session table.
+We use scalar subqueries rather than a `LEFT JOIN`, since these keep the rows in the order of
+the original table: with a join, both SQLite and DuckDB are free to reorder them.
+"""
+from typing import Dict, List, Optional
+
+import pandas as pd
+from attr import attrs, attrib
+from colorama import Fore
+
+from ._logger import logger
+from .db import Database
+from .db.utils import double_quote_escape, select_all_from_table_query
+
+
+@attrs
+class SideTable:
+    """A single `MapIngredient` output, stored in the temp table `tablename`."""
+
+    tablename: str = attrib()
+    # Column of the original table the ingredient was applied to
+    key: str = attrib()
+    # The new column holding the ingredient outputs
+    column: str = attrib()
+    has_null_key: bool = attrib(default=False)
+    is_empty: bool = attrib(default=False)
+
+
+def add_ingredient_columns(
+    db: Database,
+    tablename: str,
+    session_tablename: str,
+    ingredient_outputs: List[pd.DataFrame],
+    side_tables: List[SideTable],
+    created_by: Optional[str] = None,
+) -> None:
+    """Writes `ingredient_outputs` to side tables, and (re)creates the session view over them.
+
+    Args:
+        db: Database connector object
+        tablename: The original table the ingredients were applied to
+        session_tablename: Name of the view combining `tablename` with all ingredient outputs
+        ingredient_outputs: The `(key, new_column)` tables returned from each `MapIngredient` call
+        side_tables: The side tables previously added to `session_tablename`.
+            Extended in-place with those for `ingredient_outputs`.
+        created_by: Optional name of the ingredient(s) creating these columns
+    """
+    for output in ingredient_outputs:
+        key, column = output.columns
+        side_table = SideTable(
+            tablename=f"{session_tablename}_map{len(side_tables)}",
+            key=key,
+            column=column,
+            has_null_key=bool(output[key].isnull().any()),
+            is_empty=bool(output[key].notnull().sum() == 0),
+        )
+        db.to_temp_table(output, side_table.tablename, created_by=created_by)
+        if not side_table.is_empty:
+            db.index_temp_table(side_table.tablename, key)
+        side_tables.append(side_table)
+    original_columns = list(
+        db.execute_to_df(
+            select_all_from_table_query(tablename).rstrip(";") + " LIMIT 0"
+        ).columns
+    )
+    view_query = get_session_view_query(tablename, side_tables)
+    logger.debug(
+        Fore.LIGHTBLACK_EX
+        + f"Creating session view `{session_tablename}`:\n{view_query}"
+        + Fore.RESET
+    )
+    db.create_temp_view(
+        session_tablename,
+        view_query,
+        columns=original_columns
+        + sorted(set(s.column for s in side_tables) - set(original_columns)),
+        depends_on=[tablename] + [s.tablename for s in side_tables],
+        created_by=created_by,
+    )
+
+
+def get_session_view_query(tablename: str, side_tables: List[SideTable]) -> str:
+    """Builds the query adding the columns of all `side_tables` onto `tablename`.
+    If multiple side tables hold the same column (e.g. the same `LLMMap` call in two subqueries,
+    where the second only mapped the values the first didn't get to), the most recent non-null output wins.
+    """
+
+    def q(name: str) -> str:
+        return f'"{double_quote_escape(name)}"'
+
+    column_to_exprs: Dict[str, List[str]] = {}
+    for side_table in side_tables:
+        lookup = f'SELECT "s".{q(side_table.column)} FROM {q(side_table.tablename)} AS "s" WHERE "s".{q(side_table.key)}'
+        if side_table.is_empty:
+            # Nothing to look up. Don't, since the key type may not match the original column
+            expr = "NULL"
+        else:
+            expr = f'({lookup} = "t".{q(side_table.key)})'
+        if side_table.has_null_key:
+            # NULL never equals NULL, so look up the output for NULL separately
+            expr = f'CASE WHEN "t".{q(side_table.key)} IS NULL THEN ({lookup} IS NULL) ELSE {expr} END'
+        column_to_exprs.setdefault(side_table.column, []).append(expr)
+    select_exprs = ['"t".*']
+    for column in sorted(column_to_exprs):
+        exprs = column_to_exprs[column][::-1]
+        expr = exprs[0] if len(exprs) == 1 else f"COALESCE({', '.join(exprs)})"
+        select_exprs.append(f"{expr} AS {q(column)}")
+    return f'SELECT {", ".join(select_exprs)} FROM {q(tablename)} AS "t"'
@@ -0,0 +1,220 @@
+"""Caches the compiled, model-independent parts of a BlendSQL query.
+
+Parsing a BlendSQL query (pyparsing grammar, `sqlglot` parsing, column qualification
+and the construction of abstracted table selects) is deterministic given the query text,
+the ingredients available, the database backend and its schema. Since many applications
+issue the same templated queries over and over, we store these compiled artifacts in an
+in-process LRU cache and re-use them on subsequent `blend()` calls.
+"""
+import copy
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple, Type, Hashable
+from collections.abc import Collection
+
+from attr import attrs, attrib
+from sqlglot import exp
+
+from ._constants import IngredientKwarg
+from ._configure import PLAN_CACHE_SIZE_KEY, DEFAULT_PLAN_CACHE_SIZE
+
+# A quoted string literal or identifier (with doubled quotes as escapes), a `--` comment
+#   along with the newline ending it, or a run of whitespace
+_QUOTED_OR_WHITESPACE = re.compile(
+    r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|--[^\n]*\n?)|\s+"
+)
+
+
+def normalize_query(query: str) -> str:
+    """Collapses runs of whitespace in `query` to a single space, for use in cache keys.
+    Whitespace inside quoted literals (e.g. `'a  b'`, or ingredient arguments) is left alone,
+    since it changes the meaning of the query. So is the newline ending a `--` comment.
+    """
+    return _QUOTED_OR_WHITESPACE.sub(lambda m: m.group(1) or " ", query).strip()
+
+
+@attrs
+class SubqueryPlan:
+    """The compiled state of a single subquery, as consumed by `_blend()`."""
+
+    node: exp.Expression = attrib()
+    abstracted_selects: List[Tuple[str, bool, Optional[str]]] = attrib()
+    alias_to_tablename: Dict[str, str] = attrib()
+    tablename_to_alias: Dict[str, str] = attrib()
+
+
+@attrs
+class QueryPlan:
+    """The compiled state of a BlendSQL query, prior to any ingredient execution.
+
+    Everything stored here is treated as immutable: `PlanCache.get()` hands out copies,
+    since `_blend()` mutates both the parsed ingredient dicts and the sqlglot AST.
+    """
+
+    query: str = attrib()
+    ingredient_alias_to_parsed_dict: Dict[str, dict] = attrib()
+    tables_in_ingredients: Set[str] = attrib()
+    ingredients: Set[Type] = attrib()
+    node: exp.Expression = attrib()
+    contains_ingredient: bool = attrib()
+    subqueries: Dict[int, SubqueryPlan] = attrib(factory=dict)
+
+    def copy(self, default_model=None) -> "QueryPlan":
+        ingredient_alias_to_parsed_dict = copy.deepcopy(
+            self.ingredient_alias_to_parsed_dict
+        )
+        for parsed_results_dict in ingredient_alias_to_parsed_dict.values():
+            parsed_results_dict["kwargs_dict"][IngredientKwarg.MODEL] = default_model
+        return QueryPlan(
+            query=self.query,
+            ingredient_alias_to_parsed_dict=ingredient_alias_to_parsed_dict,
+            tables_in_ingredients=set(self.tables_in_ingredients),
+            ingredients=set(self.ingredients),
+            node=self.node.copy(),
+            contains_ingredient=self.contains_ingredient,
+            subqueries=self.subqueries,
+        )
+
+    def add_subquery(
+        self,
+        subquery_idx: int,
+        node: exp.Expression,
+        abstracted_selects: List[Tuple[str, bool, Optional[str]]],
+        alias_to_tablename: Dict[str, str],
+        tablename_to_alias: Dict[str, str],
+    ) -> None:
+        self.subqueries[subquery_idx] = SubqueryPlan(
+            node=node,
+            abstracted_selects=list(abstracted_selects),
+            alias_to_tablename=dict(alias_to_tablename),
+            tablename_to_alias=dict(tablename_to_alias),
+        )
+
+
+def strip_model(ingredient_alias_to_parsed_dict: Dict[str, dict]) -> Dict[str, dict]:
+    """Returns a deep copy of the parsed ingredient dicts, without the attached `Model`.
+    The model is re-attached on retrieval, since it is not part of the cache key.
+    """
+    memo = {}
+    for parsed_results_dict in ingredient_alias_to_parsed_dict.values():
+        model = parsed_results_dict["kwargs_dict"].get(IngredientKwarg.MODEL)
+        if model is not None:
+            memo[id(model)] = None
+    return copy.deepcopy(ingredient_alias_to_parsed_dict, memo)
+
+
+@attrs
+class PlanCache:
+    """Thread-safe LRU cache mapping BlendSQL queries to their `QueryPlan`.
+
+    The maximum number of stored plans is read from the `BLENDSQL_PLAN_CACHE_SIZE`
+    environment variable (see `blendsql.config.set_plan_cache_size()`). A size of 0
+    disables plan caching entirely.
+
+    Examples:
+        ```python
+        from blendsql import blend, plan_cache
+
+        for _ in range(10):
+            smoothie = blend(query=blendsql, db=db, ingredients={LLMMap})
+        print(plan_cache.hits, plan_cache.misses)
+        # 9 1
+        ```
+    """
+
+    hits: int = attrib(default=0)
+    misses: int = attrib(default=0)
+    evictions: int = attrib(default=0)
+
+    _plans: "OrderedDict[Hashable, QueryPlan]" = attrib(init=False, factory=OrderedDict)
+    _schema_fingerprints: Dict[int, Tuple[dict, int]] = attrib(init=False, factory=dict)
+    _lock: threading.Lock = attrib(init=False, factory=threading.Lock)
+
+    @property
+    def maxsize(self) -> int:
+        return int(os.getenv(PLAN_CACHE_SIZE_KEY, DEFAULT_PLAN_CACHE_SIZE))
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._plans
+
+    def schema_fingerprint(self, schema: Optional[dict]) -> Optional[int]:
+        """Hashes the sqlglot schema of a database.
+        Since `Database.sqlglot_schema` is cached on the database object, we memoize
+        on the identity of the schema dict to avoid re-hashing large schemas every call.
+        """
+        if schema is None:
+            return None
+        with self._lock:
+            cached = self._schema_fingerprints.get(id(schema))
+            if cached is not None and cached[0] is schema:
+                return cached[1]
+        fingerprint = hash(
+            tuple(
+                (tablename, tuple(columns.items()))
+                for tablename, columns in sorted(schema.items())
+            )
+        )
+        with self._lock:
+            if len(self._schema_fingerprints) >= max(self.maxsize, 1):
+                self._schema_fingerprints.pop(next(iter(self._schema_fingerprints)))
+            self._schema_fingerprints[id(schema)] = (schema, fingerprint)
+        return fingerprint
+
+    def key(
+        self,
+        query: str,
+        ingredients: Collection[Type],
+        db,
+        schema_qualify: bool,
+    ) -> Hashable:
+        return (
+            normalize_query(query),
+            frozenset(ingredients),
+            type(db).__name__,
+            str(db.db_url),
+            self.schema_fingerprint(db.sqlglot_schema) if schema_qualify else None,
+        )
+
+    def get(self, key: Hashable, default_model=None) -> Optional[QueryPlan]:
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is None:
+                self.misses += 1
+                return None
+            self._plans.move_to_end(key)
+            self.hits += 1
+        return plan.copy(default_model=default_model)
+
+    def put(self, key: Hashable, plan: QueryPlan) -> None:
+        maxsize = self.maxsize
+        if maxsize <= 0:
+            return
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > maxsize:
+                self._plans.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Removes all stored plans, e.g. after altering the schema of a database."""
+        with self._lock:
+            self._plans.clear()
+            self._schema_fingerprints.clear()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+
+# Process-wide plan cache used by `blend()`
+plan_cache = PlanCache()
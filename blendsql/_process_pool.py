@@ -0,0 +1,229 @@
+"""Executes `blend()` calls on a pool of worker processes.
+
+`blend()` mutates state on both the `Database` (temp tables, lazy tables, a single connection)
+and the `Model` (prompt logs, token counters), so concurrent calls can't share them.
+Much of its work (parsing, merging dataframes, local inference) is also bound by the GIL.
+
+Instead, each worker process creates its own `Database` and `Model` once, from picklable
+factories, and executes queries sent to it one at a time. Results are sent back as Arrow IPC
+streams when `pyarrow` is installed, with the `SmoothieMeta` in the schema metadata.
+
+Since each worker has its own connection, the database should be read-only: writes made
+by one worker (other than to its own temp tables) wouldn't be seen consistently by the others.
+"""
+import json
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.context import BaseContext
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Type
+from collections.abc import Collection
+
+import attr
+import pandas as pd
+from attr import attrs, attrib
+
+from ._cost import IngredientCost
+from ._smoothie import Smoothie, SmoothieMeta
+from .blend import blend
+from .db import Database
+from .db._database import _has_pyarrow
+from .ingredients import Ingredient
+from .models import Model
+
+# Key of the serialized `SmoothieMeta` in the Arrow schema metadata
+_META_KEY = b"blendsql.meta"
+
+# State of the current worker process, set by `_init_worker()`
+_worker_db: Optional[Database] = None
+_worker_model: Optional[Model] = None
+_worker_ingredients: Collection[Type[Ingredient]] = []
+
+
+def _init_worker(
+    db: Callable[[], Database],
+    ingredients: Collection[Type[Ingredient]],
+    default_model: Optional[Callable[[], Model]],
+) -> None:
+    global _worker_db, _worker_model, _worker_ingredients
+    _worker_db = db()
+    _worker_model = default_model() if default_model is not None else None
+    _worker_ingredients = ingredients
+
+
+def _meta_to_dict(meta: SmoothieMeta) -> Dict[str, Any]:
+    return {
+        "num_values_passed": meta.num_values_passed,
+        "prompt_tokens": meta.prompt_tokens,
+        "completion_tokens": meta.completion_tokens,
+        "prompts": meta.prompts,
+        "raw_prompts": meta.raw_prompts,
+        "ingredients": [
+            getattr(ingredient, "__name__", str(ingredient))
+            for ingredient in meta.ingredients
+        ],
+        "query": meta.query,
+        "db_url": str(meta.db_url),
+        "contains_ingredient": meta.contains_ingredient,
+        "batch_sizes": meta.batch_sizes,
+        "ingredient_costs": [attr.asdict(cost) for cost in meta.ingredient_costs],
+        "process_time_seconds": meta.process_time_seconds,
+    }
+
+
+def _meta_from_dict(
+    d: Dict[str, Any], ingredients: Collection[Type[Ingredient]]
+) -> SmoothieMeta:
+    name_to_ingredient = {ingredient.__name__: ingredient for ingredient in ingredients}
+    process_time_seconds = d.pop("process_time_seconds")
+    meta = SmoothieMeta(
+        **d
+        | {
+            "ingredients": [
+                name_to_ingredient.get(name, name) for name in d["ingredients"]
+            ],
+            "ingredient_costs": [
+                IngredientCost(**cost) for cost in d["ingredient_costs"]
+            ],
+        }
+    )
+    meta.process_time_seconds = process_time_seconds
+    return meta
+
+
+def _blend_in_worker(query: str, blend_kwargs: Dict[str, Any]):
+    smoothie = blend(
+        query=query,
+        db=_worker_db,
+        default_model=_worker_model,
+        ingredients=_worker_ingredients,
+        **blend_kwargs,
+    )
+    df, meta = pd.DataFrame(smoothie.df), _meta_to_dict(smoothie.meta)
+    if not _has_pyarrow:
+        return (df, meta)
+    import pyarrow as pa
+
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # E.g. an object column of mixed types, which we can still pickle
+        return (df, meta)
+    table = table.replace_schema_metadata(
+        (table.schema.metadata or {}) | {_META_KEY: json.dumps(meta, default=str)}
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _to_smoothie(result, ingredients: Collection[Type[Ingredient]]) -> Smoothie:
+    if isinstance(result, tuple):
+        df, meta = result
+    else:
+        import pyarrow as pa
+
+        table = pa.ipc.open_stream(result).read_all()
+        meta = json.loads(table.schema.metadata[_META_KEY])
+        df = table.to_pandas()
+    return Smoothie(df=df, meta=_meta_from_dict(meta, ingredients))
+
+
+@attrs
+class BlendProcessPool:
+    """A pool of worker processes executing `blend()` calls in parallel,
+    each against its own read-only `Database` connection and `Model`.
+
+    `db` and `default_model` are callables run once in each worker to create these,
+    and must be picklable (e.g. module-level functions, or `functools.partial` objects).
+    Likewise, `ingredients` are sent to workers by reference, so must be importable.
+    Pass models via `default_model`, rather than binding them with `from_args()`.
+
+    Args:
+        db: Creates the worker's database connection. Should open it read-only, e.g. `SQLite(path, read_only=True)`
+        ingredients: Collection of ingredient objects, as passed to `blend()`
+        default_model: Optionally, creates the worker's default model
+        max_workers: Number of worker processes. Defaults to the number of CPUs
+        mp_context: The multiprocessing context to start workers with.
+            Defaults to 'spawn', since models may hold threads which don't survive a fork.
+
+    Examples:
+        ```python
+        from functools import partial
+        from blendsql import BlendProcessPool, LLMMap
+        from blendsql.db import SQLite
+        from blendsql.models import OpenaiLLM
+
+        with BlendProcessPool(
+            db=partial(SQLite, "./path/to/database.db", read_only=True),
+            ingredients={LLMMap},
+            default_model=partial(OpenaiLLM, "gpt-4o-mini"),
+            max_workers=4,
+        ) as pool:
+            smoothies = pool.map(queries)
+        ```
+    """
+
+    db: Callable[[], Database] = attrib()
+    ingredients: Collection[Type[Ingredient]] = attrib(factory=list)
+    default_model: Optional[Callable[[], Model]] = attrib(default=None)
+    max_workers: Optional[int] = attrib(default=None)
+    mp_context: Optional[BaseContext] = attrib(default=None)
+
+    _executor: ProcessPoolExecutor = attrib(init=False)
+
+    def __attrs_post_init__(self):
+        self.ingredients = list(self.ingredients or [])
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=self.mp_context or multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.db, self.ingredients, self.default_model),
+        )
+
+    def submit(self, query: str, **blend_kwargs) -> "Future[Smoothie]":
+        """Schedules a `blend()` call on a worker.
+
+        Args:
+            query: The BlendSQL query to execute
+            **blend_kwargs: Any other arguments to `blend()`, besides `db`, `default_model` and `ingredients`.
+                Streaming isn't supported.
+
+        Returns:
+            A future resolving to the `Smoothie`
+        """
+        if blend_kwargs.get("stream"):
+            raise ValueError("`stream=True` isn't supported by `BlendProcessPool`")
+        future: "Future[Smoothie]" = Future()
+
+        def _done(worker_future: Future):
+            try:
+                future.set_result(
+                    _to_smoothie(worker_future.result(), self.ingredients)
+                )
+            except BaseException as e:
+                future.set_exception(e)
+
+        self._executor.submit(_blend_in_worker, query, blend_kwargs).add_done_callback(
+            _done
+        )
+        return future
+
+    def imap(self, queries: Iterable[str], **blend_kwargs) -> Iterator[Smoothie]:
+        """Executes `queries` in parallel, yielding each `Smoothie` in the order of `queries`."""
+        futures = [self.submit(query, **blend_kwargs) for query in queries]
+        for future in futures:
+            yield future.result()
+
+    def map(self, queries: Iterable[str], **blend_kwargs) -> List[Smoothie]:
+        """Executes `queries` in parallel, returning one `Smoothie` per query, in order."""
+        return list(self.imap(queries, **blend_kwargs))
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self) -> "BlendProcessPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
@@ -1,5 +1,6 @@
 from __future__ import annotations
 from typing import Tuple, Type, List, Union
+import asyncio
 import inspect
 import ast
 import textwrap
@@ -7,6 +8,8 @@ from abc import abstractmethod
 
 from typing import TYPE_CHECKING
 
+from ._steps import run_steps, arun_steps
+
 if TYPE_CHECKING:
     from .models import Model
 
@@ -44,6 +47,16 @@ class Program:
         def summary_program(model: Model, context: pd.DataFrame) -> Tuple[str, str]:
             ...
         ```
+        For a `RemoteModel`, instead of calling `generate()`, a program can `yield` the keyword arguments
+        it would call `generate()` with, and receive the responses back. Then, `Model.apredict()`
+        can await the request on the running event loop, via `agenerate()`.
+        ```python
+        class SummaryProgram(Program):
+            def __call__(self, model: Model, context: pd.DataFrame) -> Tuple[str, str]:
+                prompt = f"Summarize the following table. {context.to_string()}"
+                responses = yield {"messages_list": [[{"role": "user", "content": prompt}]]}
+                return (responses[0], prompt)
+        ```
     """
 
     def __new__(
@@ -51,7 +64,30 @@ class Program:
         model: Model,
         **kwargs,
     ):
-        return self.__call__(self, model, **kwargs)
+        response = self.__call__(self, model, **kwargs)
+        if inspect.isgenerator(response):
+            from .ingredients.generate import generate
+
+            response = run_steps(response, lambda request: generate(model, **request))
+        return response
+
+    @classmethod
+    async def acall(cls, model: Model, **kwargs) -> Tuple[Union[str, List[str]], str]:
+        """Awaitable version of calling the program, used by `Model.apredict()`.
+        If the program yields its requests to `generate()`, they're awaited via `agenerate()`.
+        Otherwise, or if a `LocalModel` generates in this process, the program runs on a worker thread.
+        """
+        from .models import LocalModel
+        from .ingredients.generate import agenerate
+
+        if isinstance(model, LocalModel) or not inspect.isgeneratorfunction(
+            cls.__call__
+        ):
+            return await asyncio.to_thread(cls, model=model, **kwargs)
+        return await arun_steps(
+            cls.__call__(cls, model, **kwargs),
+            lambda request: agenerate(model, **request),
+        )
 
     @abstractmethod
     def __call__(
@@ -0,0 +1,181 @@
+"""Caches the results of entire `blend()` calls.
+
+Even when every model call hits the `Model` cache, `blend()` still executes all SQL
+and merges ingredient outputs into temp tables. For applications re-issuing identical queries
+against unchanged data (e.g. dashboards), we can instead return the stored `Smoothie` directly.
+
+Results are only valid as long as the data they were computed from is unchanged,
+so the key includes a fingerprint of the database contents (see `Database.fingerprint()`).
+Databases which can't be fingerprinted cheaply are never cached.
+
+Since model outputs may be non-deterministic, this cache is opt-in.
+"""
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple, Type
+from collections.abc import Collection
+
+from attr import attrs, attrib
+
+from ._configure import (
+    RESULT_CACHE_SIZE_KEY,
+    DEFAULT_RESULT_CACHE_SIZE,
+    RESULT_CACHE_TTL_KEY,
+)
+from ._plan_cache import normalize_query
+from ._smoothie import Smoothie
+
+
+def model_identity(model) -> Optional[Tuple[str, str]]:
+    # Same identity the `Model` cache uses
+    if model is None:
+        return None
+    return (type(model).__name__, str(model.model_name_or_path))
+
+
+@attrs
+class ResultCache:
+    """Thread-safe LRU cache mapping `blend()` calls to their `Smoothie`.
+
+    The maximum number of stored results is read from the `BLENDSQL_RESULT_CACHE_SIZE`
+    environment variable (see `blendsql.config.set_result_cache_size()`), and defaults to 0,
+    which disables result caching. Optionally, results expire after `BLENDSQL_RESULT_CACHE_TTL`
+    seconds (see `blendsql.config.set_result_cache_ttl()`).
+
+    Results are keyed on the query, the ingredient classes, the default model, the other
+    `blend()` arguments affecting the result, and a fingerprint of the database contents.
+    Ingredients created with `from_args()` are distinct classes, so create them once and re-use them.
+
+    Examples:
+        ```python
+        from blendsql import blend, config, result_cache
+
+        config.set_result_cache_size(256)
+        config.set_result_cache_ttl(60 * 60)
+        for _ in range(10):
+            smoothie = blend(query=blendsql, db=db, ingredients={LLMMap}, default_model=model)
+        print(result_cache.hits, result_cache.misses)
+        # 9 1
+
+        # After changes the fingerprint can't see, e.g. to an ingredient's external data source
+        result_cache.invalidate(db)
+        ```
+    """
+
+    hits: int = attrib(default=0)
+    misses: int = attrib(default=0)
+    evictions: int = attrib(default=0)
+
+    # Mapping from key to (time stored, db_url, result)
+    _results: "OrderedDict[Hashable, Tuple[float, str, Smoothie]]" = attrib(
+        init=False, factory=OrderedDict
+    )
+    _lock: threading.Lock = attrib(init=False, factory=threading.Lock)
+
+    @property
+    def maxsize(self) -> int:
+        return int(os.getenv(RESULT_CACHE_SIZE_KEY, DEFAULT_RESULT_CACHE_SIZE))
+
+    @property
+    def ttl(self) -> Optional[float]:
+        ttl = os.getenv(RESULT_CACHE_TTL_KEY)
+        return float(ttl) if ttl else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._results
+
+    def key(
+        self,
+        query: str,
+        db,
+        default_model,
+        ingredients: Optional[Collection[Type]],
+        infer_gen_constraints: bool,
+        table_to_title: Optional[Dict[str, str]],
+    ) -> Optional[Hashable]:
+        """Returns None if the result can't be cached, since `db` can't be fingerprinted."""
+        fingerprint = db.fingerprint()
+        if fingerprint is None:
+            return None
+        return (
+            normalize_query(query),
+            frozenset(ingredients or []),
+            model_identity(default_model),
+            infer_gen_constraints,
+            tuple(sorted(table_to_title.items())) if table_to_title else None,
+            type(db).__name__,
+            str(db.db_url),
+            fingerprint,
+        )
+
+    def get(self, key: Hashable) -> Optional[Smoothie]:
+        ttl = self.ttl
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None and ttl is not None and time.time() - entry[0] > ttl:
+                del self._results[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+        smoothie = entry[2]
+        # Callers may modify the result, so we hand out copies
+        return Smoothie(
+            df=smoothie.df.copy(),
+            meta=copy.deepcopy(smoothie.meta),
+        )
+
+    def put(self, key: Hashable, smoothie: Smoothie) -> None:
+        maxsize = self.maxsize
+        if maxsize <= 0:
+            return
+        with self._lock:
+            self._results[key] = (
+                time.time(),
+                str(smoothie.meta.db_url),
+                Smoothie(df=smoothie.df.copy(), meta=copy.deepcopy(smoothie.meta)),
+            )
+            self._results.move_to_end(key)
+            while len(self._results) > maxsize:
+                self._results.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, db=None) -> int:
+        """Removes the stored results computed from `db`, or all results if no `db` is given.
+
+        Returns:
+            The number of results removed
+        """
+        with self._lock:
+            keys = [
+                key
+                for key, (_, db_url, _) in self._results.items()
+                if db is None or db_url == str(db.db_url)
+            ]
+            for key in keys:
+                del self._results[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        self.invalidate()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+
+# Process-wide result cache used by `blend()`
+result_cache = ResultCache()
@@ -0,0 +1,194 @@
+"""Dependency-aware execution of the ingredient calls within a subquery.
+
+Each `IngredientCall` declares the resources (tables, new columns, models) it reads
+and writes. Two calls conflict if one writes a resource the other reads or writes,
+or if either is `exclusive`. Calls are started in their original order as soon as every
+earlier conflicting call has finished, so that a query like
+
+    SELECT {{LLMMap('q1', 'a::x')}}, {{LLMMap('q2', 'b::y')}} FROM a JOIN b ...
+
+issues both model round-trips at once. Results are returned in the original call order,
+which keeps the downstream merge into `tablename_to_map_out` deterministic.
+
+`run_ingredient_calls()` runs calls on a thread pool, as in `blend()`.
+`arun_ingredient_calls()` runs them as tasks on the running event loop, as in `blend_async()`.
+"""
+import os
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, Future
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from attr import attrs, attrib
+from colorama import Fore
+
+from ._logger import logger
+from ._configure import INGREDIENT_CONCURRENCY_KEY, DEFAULT_INGREDIENT_CONCURRENCY
+
+
+@attrs
+class IngredientCall:
+    """A single, prepared ingredient invocation.
+
+    Args:
+        name: Human-readable identifier used in logging (e.g. the ingredient alias)
+        fn: Zero-argument callable which executes the ingredient
+        afn: Optional zero-argument coroutine function which executes the ingredient.
+            Used by `arun_ingredient_calls()`, which otherwise calls `fn` on a worker thread.
+        reads: Resources this call reads from (e.g. tablenames)
+        writes: Resources this call creates or modifies
+        exclusive: If True, this call acts as a barrier and never runs alongside another call.
+            Used for calls with side effects we can't track, such as materializing a CTE.
+    """
+
+    name: str = attrib()
+    fn: Callable[[], Any] = attrib()
+    reads: Set[str] = attrib(factory=set)
+    writes: Set[str] = attrib(factory=set)
+    exclusive: bool = attrib(default=False)
+    afn: Optional[Callable[[], Awaitable[Any]]] = attrib(default=None)
+
+    async def acall(self) -> Any:
+        if self.afn is None:
+            return await asyncio.to_thread(self.fn)
+        return await self.afn()
+
+    def conflicts_with(self, other: "IngredientCall") -> bool:
+        if self.exclusive or other.exclusive:
+            return True
+        return bool(
+            self.writes & (other.reads | other.writes) or other.writes & self.reads
+        )
+
+
+def get_max_concurrency() -> int:
+    return max(
+        int(os.getenv(INGREDIENT_CONCURRENCY_KEY, DEFAULT_INGREDIENT_CONCURRENCY)), 1
+    )
+
+
+def build_dependencies(calls: List[IngredientCall]) -> Dict[int, Set[int]]:
+    """Returns mapping from call index to the indices of earlier calls it must wait on."""
+    return {
+        j: {i for i in range(j) if calls[i].conflicts_with(calls[j])}
+        for j in range(len(calls))
+    }
+
+
+def run_ingredient_calls(
+    calls: List[IngredientCall], max_concurrency: int = None
+) -> List[Any]:
+    """Executes the given calls, respecting their dependencies.
+
+    Args:
+        calls: The prepared ingredient calls, in the order they appear in the query
+        max_concurrency: Maximum number of calls to run at once.
+            Defaults to the value set via `blendsql.config.set_ingredient_concurrency()`.
+
+    Returns:
+        List containing the output of each call, in the same order as `calls`
+    """
+    if max_concurrency is None:
+        max_concurrency = get_max_concurrency()
+    if max_concurrency <= 1 or len(calls) <= 1:
+        return [call.fn() for call in calls]
+    dependencies = build_dependencies(calls)
+    results: Dict[int, Any] = {}
+    errors: Dict[int, BaseException] = {}
+    pending: List[int] = list(range(len(calls)))
+    running: Dict[Future, int] = {}
+    done: Set[int] = set()
+    with ThreadPoolExecutor(
+        max_workers=min(max_concurrency, len(calls)),
+        thread_name_prefix="blendsql-ingredient",
+    ) as executor:
+        while pending or running:
+            if not errors:
+                for idx in list(pending):
+                    if len(running) >= max_concurrency:
+                        break
+                    if dependencies[idx] <= done:
+                        pending.remove(idx)
+                        logger.debug(
+                            Fore.CYAN
+                            + f"Scheduling `{calls[idx].name}` ({len(running) + 1} in flight)"
+                            + Fore.RESET
+                        )
+                        # Copy context, so any context-local state follows the call onto the worker thread
+                        ctx = contextvars.copy_context()
+                        running[executor.submit(ctx.run, calls[idx].fn)] = idx
+            elif not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                idx = running.pop(future)
+                done.add(idx)
+                try:
+                    results[idx] = future.result()
+                except BaseException as e:
+                    errors[idx] = e
+    if errors:
+        # Raise the error of the earliest failing call, as sequential execution would
+        raise errors[min(errors)]
+    return [results[idx] for idx in range(len(calls))]
+
+
+async def arun_ingredient_calls(
+    calls: List[IngredientCall], max_concurrency: int = None
+) -> List[Any]:
+    """Awaitable version of `run_ingredient_calls()`, with the same ordering and error semantics.
+    Independent calls run as concurrent tasks on the running event loop.
+
+    Args:
+        calls: The prepared ingredient calls, in the order they appear in the query
+        max_concurrency: Maximum number of calls to run at once.
+            Defaults to the value set via `blendsql.config.set_ingredient_concurrency()`.
+
+    Returns:
+        List containing the output of each call, in the same order as `calls`
+    """
+    if max_concurrency is None:
+        max_concurrency = get_max_concurrency()
+    if max_concurrency <= 1 or len(calls) <= 1:
+        return [await call.acall() for call in calls]
+    dependencies = build_dependencies(calls)
+    results: Dict[int, Any] = {}
+    errors: Dict[int, BaseException] = {}
+    pending: List[int] = list(range(len(calls)))
+    running: Dict[asyncio.Task, int] = {}
+    done: Set[int] = set()
+    try:
+        while pending or running:
+            if not errors:
+                for idx in list(pending):
+                    if len(running) >= max_concurrency:
+                        break
+                    if dependencies[idx] <= done:
+                        pending.remove(idx)
+                        logger.debug(
+                            Fore.CYAN
+                            + f"Scheduling `{calls[idx].name}` ({len(running) + 1} in flight)"
+                            + Fore.RESET
+                        )
+                        # Tasks run in a copy of the current context
+                        running[asyncio.create_task(calls[idx].acall())] = idx
+            elif not running:
+                break
+            finished, _ = await asyncio.wait(
+                running, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in finished:
+                idx = running.pop(task)
+                done.add(idx)
+                try:
+                    results[idx] = task.result()
+                except BaseException as e:
+                    errors[idx] = e
+    finally:
+        # Only reached with calls still running if we were cancelled
+        for task in running:
+            task.cancel()
+    if errors:
+        # Raise the error of the earliest failing call, as sequential execution would
+        raise errors[min(errors)]
+    return [results[idx] for idx in range(len(calls))]
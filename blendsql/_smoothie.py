@@ -1,8 +1,9 @@
 from dataclasses import dataclass, field
-from typing import List, Iterable, Type
+from typing import List, Iterable, Iterator, Optional, Type
 import pandas as pd
 
 from .ingredients import Ingredient
+from ._cost import IngredientCost
 from .utils import tabulate
 from .db.utils import truncate_df_content
 
@@ -26,16 +27,46 @@ class SmoothieMeta:
     query: str
     db_url: str
     contains_ingredient: bool = True
+    batch_sizes: List[int] = field(
+        default_factory=list
+    )  # Number of values in each batched model request
+    # Estimated vs. actual cost of each `MapIngredient` predicate we reordered
+    ingredient_costs: List[IngredientCost] = field(default_factory=list)
     process_time_seconds: float = field(init=False)
 
 
 @dataclass
 class Smoothie:
-    df: pd.DataFrame
+    df: Optional[pd.DataFrame]
     meta: SmoothieMeta
+    # Only populated when `blend(..., stream=True)` is used. Then, `df` is None,
+    #   and the final result is lazily yielded as dataframes of at most `chunksize` rows.
+    chunks: Optional[Iterator[pd.DataFrame]] = None
 
     def __post_init__(self):
-        self.df = PrettyDataFrame(self.df)
+        if self.df is not None:
+            self.df = PrettyDataFrame(self.df)
+
+    def close(self) -> None:
+        """Releases the database connection and temp tables held by a streamed result,
+        without consuming the rest of `chunks`. Otherwise, they are released once `chunks`
+        is exhausted, or garbage collected.
+
+        Examples:
+            ```python
+            with blend(query=query, db=db, stream=True) as smoothie:
+                first_chunk = next(smoothie.chunks)
+            ```
+        """
+        close = getattr(self.chunks, "close", None)
+        if close is not None:
+            close()
+
+    def __enter__(self) -> "Smoothie":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
 
     def summary(self):
         s = "-------------------------------- SUMMARY --------------------------------\n"
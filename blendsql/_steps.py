@@ -0,0 +1,75 @@
+"""Drivers for code written as a generator of requests, which runs both synchronously and asynchronously.
+
+Some logic interleaves synchronous work (e.g. database calls) with requests that can be awaited
+(e.g. model calls). Rather than writing it twice, we write it once as a generator, which `yield`s
+each request and receives its response. For example, `MapIngredient` yields the arguments to `_run()`:
+
+    def _call_steps(self, question, context, **kwargs):
+        values = self.db.execute_to_list(...)
+        mapped_values = yield ((), kwargs | {"values": values})
+        return pd.DataFrame(...)
+
+`run_steps()` fulfils each request with a blocking call, as in `blend()`.
+`arun_steps()` awaits each request instead, as in `blend_async()`, and can move the synchronous work
+in between requests onto a worker thread, so that it doesn't block the event loop.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Generator, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def _resume(steps: Generator[Any, Any, T], response: Any) -> Tuple[bool, Any]:
+    """Sends `response` to `steps`, returning (True, return value) once `steps` finishes,
+    and (False, next request) otherwise.
+    StopIteration can't be raised through an `asyncio.Future`, so we catch it here.
+    """
+    try:
+        return (False, steps.send(response))
+    except StopIteration as e:
+        return (True, e.value)
+
+
+def run_steps(steps: Generator[Any, Any, T], fn: Callable[[Any], Any]) -> T:
+    """Runs `steps` to completion, sending back `fn(request)` for each request it yields.
+
+    Args:
+        steps: The generator to run
+        fn: Function fulfilling a single request
+
+    Returns:
+        The return value of `steps`
+    """
+    response = None
+    while True:
+        done, value = _resume(steps, response)
+        if done:
+            return value
+        response = fn(value)
+
+
+async def arun_steps(
+    steps: Generator[Any, Any, T],
+    afn: Callable[[Any], Awaitable[Any]],
+    offload: bool = False,
+) -> T:
+    """Awaitable version of `run_steps()`, sending back `await afn(request)` for each request.
+
+    Args:
+        steps: The generator to run
+        afn: Coroutine function fulfilling a single request
+        offload: If True, the synchronous code in between requests runs on a worker thread
+            via `asyncio.to_thread()`. Use this when it blocks, e.g. on database calls.
+
+    Returns:
+        The return value of `steps`
+    """
+    response = None
+    while True:
+        if offload:
+            done, value = await asyncio.to_thread(_resume, steps, response)
+        else:
+            done, value = _resume(steps, response)
+        if done:
+            return value
+        response = await afn(value)
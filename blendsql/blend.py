@@ -1,3 +1,4 @@
+import asyncio
 import copy
 import logging
 import time
@@ -5,14 +6,17 @@ import uuid
 import pandas as pd
 import re
 from typing import (
+    Any,
     Dict,
     List,
     Set,
     Tuple,
     Generator,
+    Iterator,
     Optional,
     Callable,
     Type,
+    Hashable,
 )
 from collections.abc import Collection, Iterable
 
@@ -32,7 +36,12 @@ from .utils import (
 )
 from ._exceptions import InvalidBlendSQL
 from .db import Database, DuckDB
-from .db.utils import double_quote_escape, select_all_from_table_query, LazyTable
+from .db.utils import (
+    double_quote_escape,
+    select_all_from_table_query,
+    LazyTable,
+    ClosingIterator,
+)
 from .parse import (
     get_dialect,
     QueryContextManager,
@@ -47,9 +56,17 @@ from .parse import (
 from .parse._constants import MODIFIERS
 from .grammars._peg_grammar import grammar
 from .ingredients.ingredient import Ingredient, IngredientException
-from ._smoothie import Smoothie, SmoothieMeta
+from ._smoothie import Smoothie, SmoothieMeta, PrettyDataFrame
+from ._plan_cache import plan_cache, QueryPlan, strip_model, normalize_query
+from ._result_cache import result_cache
+from ._context import ExecutionContext, current_context, use_context
 from ._constants import IngredientType, IngredientKwarg
-from .models._model import Model
+from .models._model import Model, LocalModel
+from ._scheduler import IngredientCall, run_ingredient_calls, arun_ingredient_calls
+from ._steps import run_steps, arun_steps
+from ._cost import IngredientCost, order_ingredient_calls
+from ._merge import add_ingredient_columns, SideTable
+from .db._database import _has_pyarrow
 
 
 @attrs
@@ -195,7 +212,7 @@ def preprocess_blendsql(
     ingredient_alias_to_parsed_dict: Dict[str, dict] = {}
     ingredient_str_to_alias: Dict[str, str] = {}
     tables_in_ingredients: Set[str] = set()
-    query = re.sub(r"(\s+)", " ", query)
+    query = normalize_query(query)
     reversed_scan_res = [scan_res for scan_res in grammar.scanString(query)][::-1]
     for idx, (parse_results, start, end) in enumerate(reversed_scan_res):
         original_ingredient_string = query[start:end]
@@ -406,6 +423,73 @@ def get_sorted_grammar_matches(
         parse_results = remaining_parse_results
 
 
+def get_ingredient_call_resources(
+    ingredient: Ingredient,
+    args: list,
+    kwargs_dict: dict,
+    aliases_to_tablenames: Dict[str, str],
+    db: Database,
+) -> dict:
+    """Determines which resources an ingredient call reads from and writes to.
+    Used to decide which ingredient calls can safely be executed concurrently.
+
+    Returns:
+        dict containing `reads`, `writes` and `exclusive` kwargs for an `IngredientCall`
+    """
+    reads, writes = set(), set()
+    # Joins modify the query context after execution, so we treat them as a barrier
+    exclusive = ingredient.ingredient_type == IngredientType.JOIN
+    for value in list(args) + list(kwargs_dict.values()):
+        if (
+            not isinstance(value, str)
+            or "::" not in value
+            or check.is_blendsql_query(value)
+        ):
+            continue
+        try:
+            tablename, _ = get_tablename_colname(value)
+        except ValueError:
+            continue
+        if tablename in db.lazy_tables or (
+            aliases_to_tablenames.get(tablename, tablename) in db.lazy_tables
+        ):
+            # Materializing a CTE calls `_blend()` again, and modifies our query context
+            exclusive = True
+        reads.add(aliases_to_tablenames.get(tablename, tablename))
+    if ingredient.ingredient_type == IngredientType.MAP:
+        # The name of the new column is derived from the question
+        question = kwargs_dict.get(
+            IngredientKwarg.QUESTION, args[0] if len(args) > 0 else None
+        )
+        writes.add(f"column::{question}")
+    model = kwargs_dict.get(IngredientKwarg.MODEL)
+    if isinstance(model, LocalModel):
+        # Local model weights aren't safe to share across threads
+        writes.add(f"model::{id(model)}")
+    return {"reads": reads, "writes": writes, "exclusive": exclusive}
+
+
+def _execute_ingredient(ingredient: Ingredient, *args, **kwargs):
+    function_out = ingredient(*args, **kwargs)
+    _track_map_column(ingredient, function_out, kwargs["prev_subquery_map_columns"])
+    return function_out
+
+
+async def _aexecute_ingredient(ingredient: Ingredient, *args, **kwargs):
+    function_out = await ingredient._acall(*args, **kwargs)
+    _track_map_column(ingredient, function_out, kwargs["prev_subquery_map_columns"])
+    return function_out
+
+
+def _track_map_column(
+    ingredient: Ingredient, function_out: Any, prev_subquery_map_columns: Set[str]
+) -> None:
+    if ingredient.ingredient_type == IngredientType.MAP:
+        # Track the new column as soon as it's created,
+        #   so subsequent `MapIngredient` calls don't re-use the name
+        prev_subquery_map_columns.add(function_out[0])
+
+
 def disambiguate_and_submit_blend(
     ingredient_alias_to_parsed_dict: Dict[str, dict],
     query: str,
@@ -423,7 +507,157 @@ def disambiguate_and_submit_blend(
     return _blend(query=query, **kwargs)
 
 
-def _blend(
+def get_subquery_str(
+    subquery: exp.Expression, dialect: sqlglot.Dialect
+) -> Optional[str]:
+    """Returns the `SELECT` statement we process a subquery from `get_reversed_subqueries()` as,
+    or None if we can't.
+    """
+    if isinstance(subquery, exp.Select):
+        return subquery.sql(dialect=dialect)
+    # We need to create a select query from this subquery
+    # So we find the parent select, and grab that table
+    parent_select_tablenames = [
+        i.name for i in subquery.find_ancestor(exp.Select).find_all(exp.Table)
+    ]
+    if len(parent_select_tablenames) == 1:
+        return f"SELECT * FROM {parent_select_tablenames[0]} WHERE " + get_first_child(
+            subquery
+        ).sql(dialect=dialect)
+    logger.debug(
+        Fore.YELLOW
+        + "Encountered subquery without `SELECT`, and more than 1 table!\nCannot optimize yet, skipping this step."
+    )
+    return None
+
+
+def select_first_columns(
+    query: str, db: Database, dialect: sqlglot.Dialect
+) -> Optional[str]:
+    """Rewrites the `SELECT *` over a join in `query`, so that it selects each column name once.
+    Like `SELECT *`, columns are ordered by table, and we keep the first occurrence of each name.
+    This way, the DBMS can write the result to a temp table without duplicate column names.
+
+    Returns:
+        The rewritten query, or None if we can't resolve the columns of every joined table
+            (e.g. one is a subquery)
+    """
+    node = _parse_one(query, dialect=dialect)
+    if not (
+        isinstance(node, exp.Select)
+        and len(node.expressions) == 1
+        and isinstance(node.expressions[0], exp.Star)
+        and node.args.get("from") is not None
+    ):
+        return None
+    sources = [node.args["from"].this] + [j.this for j in node.args.get("joins") or []]
+    projections, seen = [], set()
+    for source in sources:
+        if not isinstance(source, exp.Table) or not db.has_table(source.name):
+            return None
+        columns = list(db.iter_columns(source.name))
+        if len(columns) == 0:
+            return None
+        for column in columns:
+            if column in seen:
+                continue
+            seen.add(column)
+            projections.append(
+                exp.alias_(
+                    exp.column(column, table=source.alias_or_name, quoted=True),
+                    column,
+                    quoted=True,
+                )
+            )
+    return node.select(*projections, append=False).sql(dialect=dialect)
+
+
+def _start_session(db: Database) -> ExecutionContext:
+    """Checks out a connection from `db`, on which the `blend()` call creates its temp tables."""
+    return ExecutionContext(db=db, connection=db.open_connection())
+
+
+def _end_session(context: ExecutionContext) -> None:
+    """Drops the temp tables created by the `blend()` call, and returns its connection.
+    Other calls on the same database (e.g. via `blend_async()`) use their own connections,
+    so their temp tables are unaffected.
+    """
+    context.db.close_connection(context.connection, context.temp_tables)
+
+
+def _usage_meta() -> Dict[str, Any]:
+    """The model usage of the running `blend()` call, as `SmoothieMeta` fields."""
+    context = current_context()
+    if context is None:
+        # `_blend()` was called directly
+        return {
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "prompts": [],
+            "raw_prompts": [],
+            "batch_sizes": [],
+        }
+    return {
+        "prompt_tokens": context.prompt_tokens,
+        "completion_tokens": context.completion_tokens,
+        "prompts": list(context.prompts),
+        "raw_prompts": list(context.raw_prompts),
+        "batch_sizes": list(context.batch_sizes),
+    }
+
+
+def _make_smoothie(
+    db: Database, query: str, meta: SmoothieMeta, chunksize: Optional[int] = None
+) -> Smoothie:
+    """Executes the final query. If `chunksize` is given, results are not fetched here,
+    and the returned `Smoothie` instead holds a generator over result chunks.
+    """
+    if chunksize is None:
+        return Smoothie(df=db.execute_to_df(query), meta=meta)
+    return Smoothie(
+        df=None, meta=meta, chunks=db.execute_to_chunks(query, chunksize=chunksize)
+    )
+
+
+def _stream_chunks(
+    context: ExecutionContext, chunks: Iterator[pd.DataFrame]
+) -> ClosingIterator[pd.DataFrame]:
+    """Iterates over `chunks`, ending the session once they are exhausted, closed
+    (e.g. via `Smoothie.close()`) or garbage collected, since the final query may read from our temp tables.
+    """
+    return ClosingIterator(
+        map(PrettyDataFrame, chunks), on_close=partial(_close_stream, context, chunks)
+    )
+
+
+def _close_stream(context: ExecutionContext, chunks: Iterator[pd.DataFrame]) -> None:
+    # The database may hold an open cursor on the session's connection, so close that first
+    close = getattr(chunks, "close", None)
+    if close is not None:
+        close()
+    _end_session(context)
+
+
+def _blend(query: str, db: Database, **kwargs) -> Smoothie:
+    """Invoked from blend(), this contains the recursive logic to execute
+    a BlendSQL query and return a `Smoothie` object.
+    """
+    return run_steps(_blend_steps(query=query, db=db, **kwargs), run_ingredient_calls)
+
+
+async def _ablend(query: str, db: Database, **kwargs) -> Smoothie:
+    """Awaitable version of `_blend()`, invoked from `blend_async()`.
+    Ingredient calls are awaited on the running event loop, while everything in between
+    (parsing, and executing SQL) runs on a worker thread.
+    """
+    return await arun_steps(
+        _blend_steps(query=query, db=db, **kwargs),
+        arun_ingredient_calls,
+        offload=True,
+    )
+
+
+def _blend_steps(
     query: str,
     db: Database,
     default_model: Optional[Model] = None,
@@ -432,10 +666,11 @@ def _blend(
     infer_gen_constraints: bool = True,
     table_to_title: Optional[Dict[str, str]] = None,
     schema_qualify: bool = True,
+    chunksize: Optional[int] = None,
     _prev_passed_values: int = 0,
-) -> Smoothie:
-    """Invoked from blend(), this contains the recursive logic to execute
-    a BlendSQL query and return a `Smoothie` object.
+) -> Generator[List[IngredientCall], list, Smoothie]:
+    """The logic of `_blend()`, yielding the `IngredientCall`s of each subquery
+    to be executed, and receiving their outputs.
     """
     # The QueryContextManager class is used to track all manipulations done to
     # the original query, prior to the final execution on the underlying DBMS.
@@ -450,57 +685,94 @@ def _blend(
     # Create our Kitchen
     kitchen = Kitchen(db=db, session_uuid=session_uuid)
     kitchen.extend(ingredients)
-    # Replace ingredient calls with short aliases (e.g. '{{A()}}'),
-    # and use _peg_grammar to extract ingredient types
-    (
-        query,
-        ingredient_alias_to_parsed_dict,
-        tables_in_ingredients,
-        kitchen,
-        ingredients,
-    ) = preprocess_blendsql(
-        query=query,
-        kitchen=kitchen,
-        ingredients=ingredients,
-        default_model=default_model,
-    )
-    query = autowrap_query(
-        query=query,
-        kitchen=kitchen,
-        ingredient_alias_to_parsed_dict=ingredient_alias_to_parsed_dict,
-    )
-    # Parse to our QueryContextManager object
-    query_context.parse(query)
+    # Check to see if we've already compiled this query before
+    plan_key, plan = None, None
+    if plan_cache.enabled:
+        plan_key = plan_cache.key(
+            query=query, ingredients=ingredients, db=db, schema_qualify=schema_qualify
+        )
+        plan = plan_cache.get(plan_key, default_model=default_model)
+    if plan is not None:
+        logger.debug(Fore.YELLOW + "Using cached query plan" + Fore.RESET)
+        # Add any ingredients that our alias ingredients depend on
+        kitchen.extend(
+            [i for i in plan.ingredients if i not in set(ingredients)],
+            flag_duplicates=False,
+        )
+        query = plan.query
+        ingredient_alias_to_parsed_dict = plan.ingredient_alias_to_parsed_dict
+        tables_in_ingredients = plan.tables_in_ingredients
+        ingredients = plan.ingredients
+        query_context.node = plan.node
+        query_context._query = query
+    else:
+        # Replace ingredient calls with short aliases (e.g. '{{A()}}'),
+        # and use _peg_grammar to extract ingredient types
+        (
+            query,
+            ingredient_alias_to_parsed_dict,
+            tables_in_ingredients,
+            kitchen,
+            ingredients,
+        ) = preprocess_blendsql(
+            query=query,
+            kitchen=kitchen,
+            ingredients=ingredients,
+            default_model=default_model,
+        )
+        query = autowrap_query(
+            query=query,
+            kitchen=kitchen,
+            ingredient_alias_to_parsed_dict=ingredient_alias_to_parsed_dict,
+        )
+        # Parse to our QueryContextManager object
+        query_context.parse(query)
+
+        # Preliminary check - we can't have anything that modifies database state
+        if query_context.node.find(MODIFIERS):
+            raise InvalidBlendSQL("BlendSQL query cannot have `DELETE` clause!")
 
-    # Preliminary check - we can't have anything that modifies database state
-    if query_context.node.find(MODIFIERS):
-        raise InvalidBlendSQL("BlendSQL query cannot have `DELETE` clause!")
+        contains_ingredient = not (
+            len(ingredients) == 0 or len(ingredient_alias_to_parsed_dict) == 0
+        )
+        if contains_ingredient:
+            schema = None
+            if schema_qualify:
+                # Only construct sqlglot schema if we need to
+                schema = db.sqlglot_schema
+            query_context.parse(query, schema=schema)
+        if plan_key is not None:
+            plan = QueryPlan(
+                query=query,
+                ingredient_alias_to_parsed_dict=strip_model(
+                    ingredient_alias_to_parsed_dict
+                ),
+                tables_in_ingredients=set(tables_in_ingredients),
+                ingredients=set(ingredients),
+                node=query_context.node.copy(),
+                contains_ingredient=contains_ingredient,
+            )
+            if not contains_ingredient:
+                plan_cache.put(plan_key, plan)
 
     # If we don't have any ingredient calls, execute as normal SQL
     if len(ingredients) == 0 or len(ingredient_alias_to_parsed_dict) == 0:
         # Check to see if there is a table we haven't materialized yet
         for tablename in [i.name for i in query_context.node.find_all(exp.Table)]:
-            if tablename not in db.tables():
+            if not db.has_table(tablename):
                 db.lazy_tables.pop(tablename).collect()
         logger.debug(
             Fore.YELLOW + f"No BlendSQL ingredients found in query:" + Fore.RESET
         )
         logger.debug(Fore.LIGHTYELLOW_EX + query + Fore.RESET)
         logger.debug(Fore.YELLOW + f"Executing as vanilla SQL..." + Fore.RESET)
-        return Smoothie(
-            df=db.execute_to_df(query_context.to_string()),
+        return _make_smoothie(
+            db=db,
+            query=query_context.to_string(),
+            chunksize=chunksize,
             meta=SmoothieMeta(
                 num_values_passed=0,
-                prompt_tokens=default_model.prompt_tokens
-                if default_model is not None
-                else 0,
-                completion_tokens=(
-                    default_model.completion_tokens if default_model is not None else 0
-                ),
-                prompts=default_model.prompts if default_model is not None else [],
-                raw_prompts=default_model.raw_prompts
-                if default_model is not None
-                else [],
+                **_usage_meta(),
                 ingredients=[],
                 query=original_query,
                 db_url=str(db.db_url),
@@ -508,16 +780,15 @@ def _blend(
             ),
         )
 
-    schema = None
-    if schema_qualify:
-        # Only construct sqlglot schema if we need to
-        schema = db.sqlglot_schema
-    query_context.parse(query, schema=schema)
+    schema = db.sqlglot_schema if schema_qualify else None
 
     _get_temp_session_table: Callable = partial(get_temp_session_table, session_uuid)
     # Mapping from {"QA('does this company...', 'constituents::Name')": 'does this company'...})
     function_call_to_res: Dict[str, str] = {}
     session_modified_tables = set()
+    # Mapping from tablename to the side tables holding its `MapIngredient` outputs
+    session_side_tables: Dict[str, List[SideTable]] = {}
+    ingredient_costs: List[IngredientCost] = []
     scm = None
     # TODO: Currently, as we traverse upwards from deepest subquery,
     #   if any lower subqueries have an ingredient, we deem the current
@@ -536,42 +807,46 @@ def _blend(
         _get_temp_subquery_table: Callable = partial(
             get_temp_subquery_table, session_uuid, subquery_idx
         )
-        if not isinstance(subquery, exp.Select):
-            # We need to create a select query from this subquery
-            # So we find the parent select, and grab that table
-            parent_select_tablenames = [
-                i.name for i in subquery.find_ancestor(exp.Select).find_all(exp.Table)
-            ]
-            if len(parent_select_tablenames) == 1:
-                subquery_str = (
-                    f"SELECT * FROM {parent_select_tablenames[0]} WHERE "
-                    + get_first_child(subquery).sql(dialect=dialect)
-                )
-
-            else:
-                logger.debug(
-                    Fore.YELLOW
-                    + "Encountered subquery without `SELECT`, and more than 1 table!\nCannot optimize yet, skipping this step."
-                )
-                continue
-        else:
-            subquery_str = subquery.sql(dialect=dialect)
+        subquery_str = get_subquery_str(subquery, dialect=dialect)
+        if subquery_str is None:
+            continue
 
         in_cte, table_alias_name = check.in_cte(subquery, return_name=True)
+        subquery_plan = plan.subqueries.get(subquery_idx) if plan else None
         scm = SubqueryContextManager(
             dialect=dialect,
-            node=_parse_one(
-                subquery_str, dialect=dialect
+            node=(
+                subquery_plan.node.copy()
+                if subquery_plan is not None
+                else _parse_one(subquery_str, dialect=dialect)
             ),  # Need to do this so we don't track parents into construct_abstracted_selects
             prev_subquery_has_ingredient=prev_subquery_has_ingredient,
             alias_to_subquery={table_alias_name: subquery} if in_cte else {},
             tables_in_ingredients=tables_in_ingredients,
+            lazy_tablenames=set(db.lazy_tables),
         )
+        if subquery_plan is not None:
+            abstracted_selects = subquery_plan.abstracted_selects
+            scm.alias_to_tablename = dict(subquery_plan.alias_to_tablename)
+            scm.tablename_to_alias = dict(subquery_plan.tablename_to_alias)
+        else:
+            initial_node = scm.node.copy() if plan is not None else None
+            abstracted_selects = list(scm.abstracted_table_selects())
+            # Aliased subqueries reference nodes in the current AST,
+            #   so we only store plans for subqueries without them
+            if plan is not None and len(scm.alias_to_subquery) == int(in_cte):
+                plan.add_subquery(
+                    subquery_idx,
+                    node=initial_node,
+                    abstracted_selects=abstracted_selects,
+                    alias_to_tablename=scm.alias_to_tablename,
+                    tablename_to_alias=scm.tablename_to_alias,
+                )
         for (
             tablename,
             postprocess_columns,
             abstracted_query_str,
-        ) in scm.abstracted_table_selects():
+        ) in abstracted_selects:
             # If this table isn't being used in any ingredient calls, there's no
             #   need to create a temporary session table
             if (tablename not in tables_in_ingredients) and (
@@ -617,28 +892,53 @@ def _blend(
                     + Fore.RESET
                 )
                 try:
-                    abstracted_df = db.execute_to_df(abstracted_query_str)
+                    temp_table_query = abstracted_query_str
                     if postprocess_columns:
-                        if isinstance(db, DuckDB):
-                            set_of_column_names = set(
-                                i.strip('"') for i in schema[f'"{tablename}"']
-                            )
-                            # In case of a join, duckdb formats columns with 'column_1'
-                            # But some columns (e.g. 'parent_category') just have underscores in them already
-                            abstracted_df = abstracted_df.rename(
-                                columns=lambda x: re.sub(r"_\d$", "", x)
-                                if x not in set_of_column_names  # noqa: B023
-                                else x
+                        # A join may select duplicate column names, so we select each name once
+                        temp_table_query = select_first_columns(
+                            abstracted_query_str, db=db, dialect=dialect
+                        )
+                    if temp_table_query is not None:
+                        # The DBMS writes the table itself, without passing the rows through Python
+                        db.query_to_temp_table(
+                            temp_table_query,
+                            tablename=_get_temp_subquery_table(tablename),
+                        )
+                    else:
+                        if _has_pyarrow:
+                            abstracted_df = db.execute_to_arrow(abstracted_query_str)
+                            # Arrow keeps the original names of duplicate columns from a join
+                            #   so we only need to drop all but the first occurrence
+                            column_names = abstracted_df.column_names
+                            abstracted_df = abstracted_df.select(
+                                [
+                                    idx
+                                    for idx, name in enumerate(column_names)
+                                    if name not in column_names[:idx]
+                                ]
                             )
-                        # In case of a join, we could have duplicate column names in our pandas dataframe
-                        # This will throw an error when we try to write to the database
-                        abstracted_df = abstracted_df.loc[
-                            :, ~abstracted_df.columns.duplicated()
-                        ]
-                    db.to_temp_table(
-                        df=abstracted_df,
-                        tablename=_get_temp_subquery_table(tablename),
-                    )
+                        else:
+                            abstracted_df = db.execute_to_df(abstracted_query_str)
+                            if isinstance(db, DuckDB):
+                                set_of_column_names = set(
+                                    i.strip('"') for i in schema[f'"{tablename}"']
+                                )
+                                # In case of a join, duckdb formats columns with 'column_1'
+                                # But some columns (e.g. 'parent_category') just have underscores in them already
+                                abstracted_df = abstracted_df.rename(
+                                    columns=lambda x: re.sub(r"_\d$", "", x)
+                                    if x not in set_of_column_names  # noqa: B023
+                                    else x
+                                )
+                            # In case of a join, we could have duplicate column names in our pandas dataframe
+                            # This will throw an error when we try to write to the database
+                            abstracted_df = abstracted_df.loc[
+                                :, ~abstracted_df.columns.duplicated()
+                            ]
+                        db.to_temp_table(
+                            df=abstracted_df,
+                            tablename=_get_temp_subquery_table(tablename),
+                        )
                 except Exception as e:
                     # Fallback to naive execution
                     logger.debug(Fore.RED + str(e) + Fore.RESET)
@@ -678,6 +978,11 @@ def _blend(
         # 2) Track when we've created a new table from a MapIngredient call
         #   only at the end of parsing a subquery, we can merge to the original session_uuid table
         tablename_to_map_out: Dict[str, List[pd.DataFrame]] = {}
+        tablename_to_map_ingredients: Dict[str, List[str]] = {}
+        # First, prepare all ingredient calls in this subquery.
+        #   Then, we can execute those which don't depend on each other concurrently.
+        ingredient_calls: List[IngredientCall] = []
+        prepared_calls: List[Tuple[str, Ingredient, list, dict]] = []
         for (
             start,
             end,
@@ -737,7 +1042,7 @@ def _blend(
                 if isinstance(unpack_value, str) and check.is_blendsql_query(
                     unpack_value
                 ):
-                    _smoothie = _blend(
+                    _smoothie = yield from _blend_steps(
                         query=unpack_value,
                         db=db,
                         default_model=default_model,
@@ -763,29 +1068,81 @@ def _blend(
                         parsed_results_dict["args"] = parsed_results_dict["args"][:1]
             if getattr(ingredient, "model", None) is not None:
                 kwargs_dict["model"] = ingredient.model
-            # Execute our ingredient function
-            function_out = ingredient(
-                *parsed_results_dict["args"],
-                **kwargs_dict
-                | {
-                    "get_temp_subquery_table": _get_temp_subquery_table,
-                    "get_temp_session_table": _get_temp_session_table,
-                    "aliases_to_tablenames": scm.alias_to_tablename,
-                    "prev_subquery_map_columns": prev_subquery_map_columns,
-                },
+            ingredient_kwargs = kwargs_dict | {
+                "get_temp_subquery_table": _get_temp_subquery_table,
+                "get_temp_session_table": _get_temp_session_table,
+                "aliases_to_tablenames": scm.alias_to_tablename,
+                "prev_subquery_map_columns": prev_subquery_map_columns,
+            }
+            ingredient_calls.append(
+                IngredientCall(
+                    name=alias_function_str,
+                    fn=partial(
+                        _execute_ingredient,
+                        ingredient,
+                        *parsed_results_dict["args"],
+                        **ingredient_kwargs,
+                    ),
+                    afn=partial(
+                        _aexecute_ingredient,
+                        ingredient,
+                        *parsed_results_dict["args"],
+                        **ingredient_kwargs,
+                    ),
+                    **get_ingredient_call_resources(
+                        ingredient=ingredient,
+                        args=parsed_results_dict["args"],
+                        kwargs_dict=kwargs_dict,
+                        aliases_to_tablenames=scm.alias_to_tablename,
+                        db=db,
+                    ),
+                )
+            )
+            prepared_calls.append(
+                (
+                    alias_function_str,
+                    ingredient,
+                    parsed_results_dict["args"],
+                    kwargs_dict,
+                )
             )
+            if naive_execution:
+                break
+        if not naive_execution:
+            # Run the cheapest, most selective `MapIngredient` predicates first,
+            #   so that later ones only see the rows which survived them
+            call_order, subquery_costs = order_ingredient_calls(
+                db=db,
+                node=scm.node,
+                dialect=dialect,
+                calls=ingredient_calls,
+                prepared=prepared_calls,
+                get_temp_subquery_table=_get_temp_subquery_table,
+                get_temp_session_table=_get_temp_session_table,
+                aliases_to_tablenames=scm.alias_to_tablename,
+            )
+            ingredient_calls = [ingredient_calls[idx] for idx in call_order]
+            prepared_calls = [prepared_calls[idx] for idx in call_order]
+            ingredient_costs.extend(subquery_costs)
+        # Execute our ingredient functions
+        function_outs: list = yield ingredient_calls
+        for (alias_function_str, ingredient, _, _), function_out in zip(
+            prepared_calls, function_outs
+        ):
             # Check how to handle output, depending on ingredient type
             if ingredient.ingredient_type == IngredientType.MAP:
                 # Parse so we replace this function in blendsql with 1st arg
                 #   (new_col, which is the question we asked)
                 #  But also update our underlying table, so we can execute correctly at the end
                 (new_col, tablename, colname, new_table) = function_out
-                prev_subquery_map_columns.add(new_col)
                 new_table[new_table[new_col].notnull()]
                 if tablename in tablename_to_map_out:
                     tablename_to_map_out[tablename].append(new_table)
                 else:
                     tablename_to_map_out[tablename] = [new_table]
+                tablename_to_map_ingredients.setdefault(tablename, []).append(
+                    ingredient.name
+                )
                 session_modified_tables.add(tablename)
                 function_call_to_res[
                     alias_function_str
@@ -846,8 +1203,6 @@ def _blend(
                 raise ValueError(
                     f"Not sure what to do with ingredient_type '{ingredient.ingredient_type}' yet\n(Also, we should have never hit this error....)"
                 )
-            if naive_execution:
-                break
         # Combine all the retrieved ingredient outputs
         for tablename, ingredient_outputs in tablename_to_map_out.items():
             if len(ingredient_outputs) > 0:
@@ -859,55 +1214,21 @@ def _blend(
                 # Once we finish parsing this subquery, write to our session_uuid table
                 # Below, we differ from Binder, which seems to replace the old table
                 # On their left join merge command: https://github.com/HKUNLP/Binder/blob/9eede69186ef3f621d2a50572e1696bc418c0e77/nsql/database.py#L196
-                # We create a new temp table to avoid a potentially self-destructive operation
-                base_tablename = tablename
-                _base_table: pd.DataFrame = db.execute_to_df(
-                    select_all_from_table_query(base_tablename)
-                )
-                base_table = _base_table
-                if db.has_temp_table(_get_temp_session_table(tablename)):
-                    base_tablename = _get_temp_session_table(tablename)
-                    base_table: pd.DataFrame = db.execute_to_df(
-                        select_all_from_table_query(base_tablename)
-                    )
-                previously_added_columns = base_table.columns.difference(
-                    _base_table.columns
-                )
-                assert len(set([len(x) for x in ingredient_outputs])) == 1
-                llm_out_df = pd.concat(ingredient_outputs, axis=1)
-                llm_out_df = llm_out_df.loc[:, ~llm_out_df.columns.duplicated()]
-                # Handle duplicate columns, e.g. in test_nested_duplicate_ingredient_calls()
-                for column in previously_added_columns:
-                    if all(
-                        column in x for x in [llm_out_df.columns, base_table.columns]
-                    ):
-                        # Fill nan in llm_out_df with those values in base_table
-                        try:
-                            pd.testing.assert_index_equal(
-                                base_table.index, llm_out_df.index
-                            )
-                        except AssertionError:
-                            logger.debug(
-                                Fore.RED + "pd.testing.assert_index_equal error"
-                            )
-                        llm_out_df[column] = llm_out_df[column].fillna(
-                            base_table[column]
-                        )
-                        base_table = base_table.drop(columns=column)
-                llm_out_df = llm_out_df[
-                    llm_out_df.columns.difference(base_table.columns)
-                ]
-                try:
-                    pd.testing.assert_index_equal(base_table.index, llm_out_df.index)
-                except AssertionError:
-                    logger.debug(Fore.RED + "pd.testing.assert_index_equal error")
-                merged = base_table.merge(
-                    llm_out_df, how="left", right_index=True, left_index=True
-                )
-                db.to_temp_table(
-                    df=merged, tablename=_get_temp_session_table(tablename)
+                # Instead of rewriting the full table, we store the new columns in side tables,
+                #   and make our session_uuid table a view joining them onto the original
+                add_ingredient_columns(
+                    db=db,
+                    tablename=tablename,
+                    session_tablename=_get_temp_session_table(tablename),
+                    ingredient_outputs=ingredient_outputs,
+                    side_tables=session_side_tables.setdefault(tablename, []),
+                    created_by=", ".join(
+                        dict.fromkeys(tablename_to_map_ingredients[tablename])
+                    ),
                 )
                 session_modified_tables.add(tablename)
+    if plan_key is not None and plan_key not in plan_cache:
+        plan_cache.put(plan_key, plan)
     # Now insert the function outputs to the original query
     # We need to re-sync if we did some operation on the underlying query,
     #   like with a JoinIngredient
@@ -937,10 +1258,10 @@ def _blend(
 
     logger.debug(Fore.LIGHTGREEN_EX + f"Final Query:\n{query}" + Fore.RESET)
 
-    df = db.execute_to_df(query)
-
-    return Smoothie(
-        df=df,
+    return _make_smoothie(
+        db=db,
+        query=query,
+        chunksize=chunksize,
         meta=SmoothieMeta(
             num_values_passed=sum(
                 [
@@ -950,17 +1271,11 @@ def _blend(
                 ]
             )
             + _prev_passed_values,
-            prompt_tokens=default_model.prompt_tokens
-            if default_model is not None
-            else 0,
-            completion_tokens=default_model.completion_tokens
-            if default_model is not None
-            else 0,
-            prompts=default_model.prompts if default_model is not None else [],
-            raw_prompts=default_model.raw_prompts if default_model is not None else [],
+            **_usage_meta(),
             ingredients=ingredients,
             query=original_query,
             db_url=str(db.db_url),
+            ingredient_costs=ingredient_costs,
         ),
     )
 
@@ -974,6 +1289,8 @@ def blend(
     infer_gen_constraints: bool = True,
     table_to_title: Optional[Dict[str, str]] = None,
     schema_qualify: bool = True,
+    stream: bool = False,
+    chunksize: int = 10_000,
 ) -> Smoothie:
     '''The `blend()` function is used to execute a BlendSQL query against a database and
     return the final result, in addition to the intermediate reasoning steps taken.
@@ -996,6 +1313,13 @@ def blend(
             This enables us to write BlendSQL scripts over multi-table databases without manually qualifying columns ourselves
             However, we need to call `db.sqlglot_schema` if schema_qualify=True, which may add some latency.
             With single-table queries, we can set this to False.
+        stream: If True, the final query result is not loaded into memory at once.
+            Instead, `smoothie.df` is None, and `smoothie.chunks` is a generator yielding
+            dataframes of at most `chunksize` rows, fetched from a database cursor.
+            Temp tables created during execution are kept until the chunks are exhausted, `smoothie.close()`
+            is called (or the `with blend(...) as smoothie:` block exits), or the chunks are garbage collected.
+            Streamed results aren't stored in `blendsql.result_cache`.
+        chunksize: Maximum number of rows per chunk, if `stream=True`
 
     Returns:
         smoothie: `Smoothie` dataclass containing pd.DataFrame output and execution metadata
@@ -1078,22 +1402,138 @@ def blend(
         for handler in logger.handlers:
             handler.setLevel(logging.DEBUG)
     start = time.time()
-    try:
-        smoothie = _blend(
+    result_key = None
+    if result_cache.enabled and not stream:
+        result_key = result_cache.key(
             query=query,
             db=db,
             default_model=default_model,
             ingredients=ingredients,
             infer_gen_constraints=infer_gen_constraints,
             table_to_title=table_to_title,
-            schema_qualify=schema_qualify,
         )
+        if result_key is not None:
+            smoothie = result_cache.get(result_key)
+            if smoothie is not None:
+                logger.debug(Fore.YELLOW + "Using cached query result" + Fore.RESET)
+                smoothie.meta.process_time_seconds = time.time() - start
+                return smoothie
+    smoothie = None
+    context = _start_session(db)
+    try:
+        with use_context(context):
+            smoothie = _blend(
+                query=query,
+                db=db,
+                default_model=default_model,
+                ingredients=ingredients,
+                infer_gen_constraints=infer_gen_constraints,
+                table_to_title=table_to_title,
+                schema_qualify=schema_qualify,
+                chunksize=chunksize if stream else None,
+            )
     except Exception as error:
         raise error
     finally:
         # In the case of a recursive `_blend()` call,
         #   this logic allows temp tables to persist until
         #   the final base case is fulfilled.
-        db._reset_connection()
+        # When streaming, this is deferred until all chunks have been consumed.
+        if smoothie is None or smoothie.chunks is None:
+            _end_session(context)
+    return _finish_smoothie(smoothie, context, start=start, result_key=result_key)
+
+
+def _finish_smoothie(
+    smoothie: Smoothie,
+    context: ExecutionContext,
+    start: float,
+    result_key: Optional[Hashable],
+) -> Smoothie:
+    """Shared by `blend()` and `blend_async()`, once the session has been ended (or handed to the stream)."""
+    if smoothie.chunks is not None:
+        smoothie.chunks = _stream_chunks(context, smoothie.chunks)
     smoothie.meta.process_time_seconds = time.time() - start
+    if result_key is not None:
+        result_cache.put(result_key, smoothie)
     return smoothie
+
+
+async def blend_async(
+    query: str,
+    db: Database,
+    default_model: Optional[Model] = None,
+    ingredients: Optional[Collection[Type[Ingredient]]] = None,
+    verbose: bool = False,
+    infer_gen_constraints: bool = True,
+    table_to_title: Optional[Dict[str, str]] = None,
+    schema_qualify: bool = True,
+    stream: bool = False,
+    chunksize: int = 10_000,
+) -> Smoothie:
+    """Awaitable version of `blend()`, taking the same arguments.
+
+    Model requests made by ingredients are awaited on the running event loop
+    (see `Model.apredict()`), so that many BlendSQL queries can run concurrently
+    from an async application (e.g. a FastAPI service), including ones against the same `db`.
+    Only the synchronous steps, such as parsing the query and executing SQL, run on worker threads
+    via `asyncio.to_thread()`. The exceptions are ingredients without an awaitable `arun()`,
+    and CTEs which are materialized lazily by an ingredient: these run synchronously on a worker thread.
+
+    Examples:
+        ```python
+        import asyncio
+        from blendsql import blend_async, LLMMap
+
+        async def main():
+            return await asyncio.gather(
+                *[
+                    blend_async(query=q, db=db, ingredients={LLMMap}, default_model=model)
+                    for q in queries
+                ]
+            )
+
+        smoothies = asyncio.run(main())
+        ```
+    """
+    if verbose:
+        logger.setLevel(logging.DEBUG)
+        for handler in logger.handlers:
+            handler.setLevel(logging.DEBUG)
+    start = time.time()
+    result_key = None
+    if result_cache.enabled and not stream:
+        # Fingerprinting the database may hit the filesystem, or the database itself
+        result_key = await asyncio.to_thread(
+            result_cache.key,
+            query=query,
+            db=db,
+            default_model=default_model,
+            ingredients=ingredients,
+            infer_gen_constraints=infer_gen_constraints,
+            table_to_title=table_to_title,
+        )
+        if result_key is not None:
+            smoothie = result_cache.get(result_key)
+            if smoothie is not None:
+                logger.debug(Fore.YELLOW + "Using cached query result" + Fore.RESET)
+                smoothie.meta.process_time_seconds = time.time() - start
+                return smoothie
+    smoothie = None
+    context = await asyncio.to_thread(_start_session, db)
+    try:
+        with use_context(context):
+            smoothie = await _ablend(
+                query=query,
+                db=db,
+                default_model=default_model,
+                ingredients=ingredients,
+                infer_gen_constraints=infer_gen_constraints,
+                table_to_title=table_to_title,
+                schema_qualify=schema_qualify,
+                chunksize=chunksize if stream else None,
+            )
+    finally:
+        if smoothie is None or smoothie.chunks is None:
+            await asyncio.to_thread(_end_session, context)
+    return _finish_smoothie(smoothie, context, start=start, result_key=result_key)
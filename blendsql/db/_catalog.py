@@ -0,0 +1,208 @@
+"""Cached schema metadata for `SQLAlchemyDatabase`.
+
+`tables()` and `iter_columns()` are called in hot paths (e.g. once per table in `_blend()`,
+and in a loop for each `MapIngredient` call), and each used to build a fresh SQLAlchemy `Inspector`,
+issuing catalog queries every time. Construction also reflected every table up front.
+
+Instead, the `SchemaCatalog` answers these from memory, and reflects tables lazily as they're needed.
+To notice schema changes made elsewhere, it compares a cheap schema version
+(e.g. SQLite's `PRAGMA schema_version`) against the one its entries were cached under.
+Within a `blend()` call, the version is only checked once, so lookups are dictionary hits.
+Any catalog queries a `blend()` call does need are issued on its own connection, rather than
+checking out a second one from the pool.
+
+The schema used to qualify columns (`Database.sqlglot_schema`) is fetched with a single bulk
+catalog query, rather than one query per table, and cached alongside the other entries.
+"""
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import (
+    Callable,
+    Dict,
+    Generator,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+from collections.abc import Collection
+
+from attr import attrs, attrib
+from sqlalchemy import inspect, MetaData, Table
+from sqlalchemy.engine import Engine, Connection, Inspector
+
+from .utils import to_sqlglot_schema
+from .. import _context
+
+_UNKNOWN = object()
+
+
+@attrs
+class SchemaCatalog:
+    """Caches the table and column names of a database, along with reflected `Table` objects.
+
+    Args:
+        engine: The engine to query the database catalog with
+        get_version: Given a connection, returns an identifier of the current schema version.
+            If None, cached entries are only dropped via `invalidate()`.
+        get_schema_rows: Given a connection, returns `(tablename, columnname, type)` rows for
+            every column of every table in `tables()`, ordered by table, then column position.
+            If None, `sqlglot_schema()` returns None.
+    """
+
+    engine: Engine = attrib()
+    get_version: Optional[Callable[[Connection], Hashable]] = attrib(default=None)
+    get_schema_rows: Optional[
+        Callable[[Connection], Iterable[Tuple[str, str, str]]]
+    ] = attrib(default=None)
+
+    # Number of lookups answered from memory, and those which queried the database catalog
+    hits: int = attrib(default=0)
+    misses: int = attrib(default=0)
+
+    _version: Hashable = attrib(init=False, default=_UNKNOWN)
+    _tables: Optional[List[str]] = attrib(init=False, default=None)
+    _table_set: Set[str] = attrib(init=False, factory=set)
+    _columns: Dict[str, List[str]] = attrib(init=False, factory=dict)
+    _metadata: MetaData = attrib(init=False, factory=MetaData)
+    _sqlglot_schema: Optional[Dict[str, Dict[str, str]]] = attrib(
+        init=False, default=None
+    )
+    # The `ExecutionContext` we last checked the schema version in
+    _checked_in: Optional[weakref.ref] = attrib(init=False, default=None)
+    _lock: threading.RLock = attrib(init=False, factory=threading.RLock)
+
+    def invalidate(self) -> None:
+        """Drops all cached entries, e.g. after changing the schema in a way `get_version` can't see."""
+        with self._lock:
+            self._tables = None
+            self._table_set = set()
+            self._columns = {}
+            self._metadata = MetaData()
+            self._sqlglot_schema = None
+
+    def _validate(self) -> None:
+        """Drops cached entries if the schema version changed since they were cached."""
+        if self.get_version is None:
+            return
+        context = _context.current_context()
+        if (
+            context is not None
+            and self._checked_in is not None
+            and self._checked_in() is context
+        ):
+            return
+        with self._connect() as con:
+            version = self.get_version(con)
+        if version != self._version:
+            self.invalidate()
+            self._version = version
+        self._checked_in = weakref.ref(context) if context is not None else None
+
+    @contextmanager
+    def _connect(self) -> Generator[Connection, None, None]:
+        """Yields the connection of the running `blend()` call, if it's on our engine.
+        Otherwise, checks one out from the pool.
+        """
+        context = _context.current_context()
+        con = context.connection if context is not None else None
+        if isinstance(con, Connection) and con.engine is self.engine:
+            with context.lock:
+                yield con
+        else:
+            with self.engine.connect() as con:
+                yield con
+
+    def _inspect(self, f: Callable[[Inspector], object]):
+        with self._connect() as con:
+            return f(inspect(con))
+
+    def _load_tables(self) -> None:
+        if self._tables is None:
+            self.misses += 1
+            self._tables = self._inspect(lambda i: i.get_table_names())
+            self._table_set = set(self._tables)
+        else:
+            self.hits += 1
+
+    def tables(self) -> List[str]:
+        with self._lock:
+            self._validate()
+            self._load_tables()
+            return list(self._tables)
+
+    def has_table(self, tablename: str) -> bool:
+        with self._lock:
+            self._validate()
+            self._load_tables()
+            return tablename in self._table_set
+
+    def columns(self, tablename: str) -> List[str]:
+        """Returns the column names of `tablename`, or an empty list if it doesn't exist."""
+        with self._lock:
+            self._validate()
+            self._load_tables()
+            if tablename not in self._table_set:
+                return []
+            columns = self._columns.get(tablename)
+            if columns is None:
+                self.misses += 1
+                columns = [
+                    c["name"] for c in self._inspect(lambda i: i.get_columns(tablename))
+                ]
+                self._columns[tablename] = columns
+            else:
+                self.hits += 1
+            return list(columns)
+
+    def reflect(self, tablenames: Optional[Collection[str]] = None) -> List[Table]:
+        """Returns reflected `Table` objects, sorted by foreign key dependency,
+        only reflecting those we haven't yet.
+
+        Args:
+            tablenames: The tables to return. Defaults to all tables.
+        """
+        with self._lock:
+            self._validate()
+            self._load_tables()
+            tablenames = [
+                t
+                for t in (self._tables if tablenames is None else tablenames)
+                if t in self._table_set
+            ]
+            missing = [t for t in tablenames if t not in self._metadata.tables]
+            if missing:
+                self.misses += 1
+                with self._connect() as con:
+                    self._metadata.reflect(bind=con, only=missing)
+            wanted = set(tablenames)
+            return [t for t in self._metadata.sorted_tables if t.name in wanted]
+
+    def sqlglot_schema(self) -> Optional[Dict[str, Dict[str, str]]]:
+        """Returns the schema in the format sqlglot.optimizer expects.
+        The same dictionary is returned until the schema changes.
+
+        Since the bulk query returns every column anyway, the columns of each table are cached too.
+        """
+        with self._lock:
+            self._validate()
+            if self.get_schema_rows is None:
+                return None
+            if self._sqlglot_schema is not None:
+                self.hits += 1
+                return self._sqlglot_schema
+            self.misses += 1
+            self._load_tables()
+            with self._connect() as con:
+                rows = list(self.get_schema_rows(con))
+            table_to_columns: Dict[str, List[str]] = {}
+            for tablename, columnname, _ in rows:
+                table_to_columns.setdefault(tablename, []).append(columnname)
+            for tablename, columns in table_to_columns.items():
+                if tablename in self._table_set:
+                    self._columns.setdefault(tablename, columns)
+            self._sqlglot_schema = to_sqlglot_schema(rows)
+            return self._sqlglot_schema
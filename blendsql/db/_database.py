@@ -1,4 +1,6 @@
-from typing import Generator, Union, List, Callable, Optional
+import importlib.util
+import threading
+from typing import Generator, Union, List, Callable, Optional, Hashable, Any
 from collections.abc import Collection
 import pandas as pd
 from attr import attrib
@@ -6,11 +8,27 @@ from sqlalchemy.engine import URL
 from abc import abstractmethod, ABC
 
 from .utils import LazyTables
+from ._temp_tables import TempTableRegistry
+from .. import _context
+
+_has_pyarrow = importlib.util.find_spec("pyarrow") is not None
 
 
 class Database(ABC):
+    """Base class of all database connectors.
+
+    Each `blend()` call executes on its own connection, checked out via `open_connection()`
+    and stored on the call's `ExecutionContext`, along with the temp tables and lazy tables it creates.
+    So, concurrent calls on the same database never see (or drop) each other's temp tables.
+    Outside of a `blend()` call, the properties below fall back to the database's own connection and registries.
+    """
+
     db_url: Union[URL, str] = attrib()
-    lazy_tables: LazyTables = LazyTables()
+    # Set per-instance by subclasses
+    _con: Any
+    _temp_tables: TempTableRegistry
+    _lazy_tables: LazyTables
+    _db_lock: threading.RLock
 
     def __str__(self):
         return f"{self.__class__} @ {self.db_url}"
@@ -18,19 +36,56 @@ class Database(ABC):
     def __repr__(self):
         return f"{self.__class__} @ {self.db_url}"
 
+    @property
+    def con(self) -> Any:
+        """The connection of the running `blend()` call, or the database's own connection."""
+        context = _context.current_context(self)
+        if context is not None and context.connection is not None:
+            return context.connection
+        return self._con
+
+    @property
+    def temp_tables(self) -> TempTableRegistry:
+        """The temp tables which currently exist on `con`."""
+        context = _context.current_context(self)
+        return context.temp_tables if context is not None else self._temp_tables
+
+    @property
+    def lazy_tables(self) -> LazyTables:
+        context = _context.current_context(self)
+        return context.lazy_tables if context is not None else self._lazy_tables
+
+    @property
+    def _lock(self) -> threading.RLock:
+        """Serializes use of `con` across threads (see `synchronized`)."""
+        context = _context.current_context(self)
+        return context.lock if context is not None else self._db_lock
+
     @abstractmethod
-    def _reset_connection(self) -> None:
-        """Reset connection, so that temp tables are cleared."""
+    def open_connection(self) -> Any:
+        """Returns a new connection to the database, for use by a single `blend()` call."""
         ...
 
     @abstractmethod
+    def close_connection(self, connection: Any, temp_tables: TempTableRegistry) -> None:
+        """Drops the temp tables recorded in `temp_tables` from `connection`, and closes it."""
+        ...
+
+    @abstractmethod
+    def _reset_connection(self) -> None:
+        """Reset the database's own connection, so that temp tables are cleared."""
+        ...
+
     def has_temp_table(self, tablename: str) -> bool:
         """Temp tables are stored in different locations, depending on
         the DBMS. For example, sqlite puts them in `sqlite_temp_master`,
         and postgres goes in the main `information_schema.tables` with a
         'pg_temp' prefix.
+
+        Since all temp tables are created via `to_temp_table()`, we answer this
+        from the in-memory `temp_tables` registry instead, without a round trip to the database.
         """
-        ...
+        return self.temp_tables.lookup(tablename)
 
     @property
     @abstractmethod
@@ -46,11 +101,22 @@ class Database(ABC):
         """
         ...
 
+    @abstractmethod
+    def invalidate_schema(self) -> None:
+        """Drops any cached schema metadata (e.g. `sqlglot_schema`), so it's fetched again on next use.
+        Only needed after schema changes the database can't detect itself.
+        """
+        ...
+
     @abstractmethod
     def tables(self) -> List[str]:
         """Get all table names associated with a database."""
         ...
 
+    def has_table(self, tablename: str) -> bool:
+        """Checks whether `tablename` is one of `tables()`."""
+        return tablename in self.tables()
+
     @abstractmethod
     def iter_columns(self, tablename: str) -> Generator[str, None, None]:
         """Yield all column names associated with a tablename."""
@@ -61,10 +127,82 @@ class Database(ABC):
         """Converts the database to a series of 'CREATE TABLE' statements."""
 
     @abstractmethod
-    def to_temp_table(self, df: pd.DataFrame, tablename: str):
-        """Write the given pandas dataframe as a temp table 'tablename'."""
+    def to_temp_table(
+        self,
+        df: Union[pd.DataFrame, "pa.Table"],
+        tablename: str,
+        created_by: Optional[str] = None,
+    ):
+        """Write the given pandas dataframe or Arrow table as a temp table 'tablename',
+        and record it in `temp_tables`.
+
+        Args:
+            df: The data to write
+            tablename: Name of the temp table. Replaced if it already exists.
+            created_by: Optional name of the ingredient(s) whose outputs the table holds
+        """
+        ...
+
+    @abstractmethod
+    def query_to_temp_table(
+        self, query: str, tablename: str, created_by: Optional[str] = None
+    ):
+        """Write the results of `query` to the temp table 'tablename' with a
+        `CREATE TEMP TABLE ... AS` statement, so the rows never leave the database.
+        Records the new table in `temp_tables`.
+
+        Args:
+            query: The `SELECT` statement to execute
+            tablename: Name of the temp table. Replaced if it already exists.
+            created_by: Optional name of the ingredient(s) whose outputs the table holds
+        """
+        ...
+
+    @abstractmethod
+    def create_temp_view(
+        self,
+        tablename: str,
+        query: str,
+        columns: List[str],
+        depends_on: List[str],
+        created_by: Optional[str] = None,
+    ):
+        """Create (or replace) the temp view 'tablename' selecting `query`,
+        and record it in `temp_tables`.
+
+        Args:
+            tablename: Name of the temp view
+            query: The `SELECT` statement defining the view
+            columns: The column names `query` returns
+            depends_on: The temp tables `query` selects from
+            created_by: Optional name of the ingredient(s) whose outputs the view holds
+        """
+        ...
+
+    @abstractmethod
+    def delete_from_temp_table(self, tablename: str, keep_condition: str):
+        """Deletes the rows of the temp table 'tablename' for which `keep_condition` isn't true.
+
+        Args:
+            tablename: Name of the temp table
+            keep_condition: SQL condition over the columns of 'tablename'
+        """
         ...
 
+    def index_temp_table(self, tablename: str, column: str) -> None:
+        """Create an index on `column` of the temp table 'tablename', if the DBMS benefits from one
+        for point lookups. By default, does nothing.
+        """
+        return None
+
+    def fingerprint(self) -> Optional[Hashable]:
+        """Identifies the current contents of the database, so that query results
+        computed from it can be re-used until it changes (see `blendsql.result_cache`).
+
+        Returns None if the contents can't be identified cheaply. By default, nothing is.
+        """
+        return None
+
     @abstractmethod
     def execute_to_df(self, query: str, params: Optional[dict] = None) -> pd.DataFrame:
         """
@@ -87,6 +225,47 @@ class Database(ABC):
         """
         ...
 
+    def execute_to_arrow(self, query: str, params: Optional[dict] = None) -> "pa.Table":
+        """
+        Execute the given query and return results as an Arrow table.
+        Requires `pyarrow` to be installed.
+
+        Subclasses should override this to avoid the conversion through pandas
+        done by the default implementation.
+        """
+        if not _has_pyarrow:
+            raise ImportError(
+                "Please install pyarrow with `pip install pyarrow`!"
+            ) from None
+        import pyarrow as pa
+
+        return pa.Table.from_pandas(
+            self.execute_to_df(query, params), preserve_index=False
+        )
+
+    def execute_to_chunks(
+        self, query: str, chunksize: int, params: Optional[dict] = None
+    ) -> Generator[pd.DataFrame, None, None]:
+        """
+        Execute the given query and lazily yield results as dataframes of at most
+        `chunksize` rows. At least one (possibly empty) dataframe is always yielded.
+
+        Subclasses should override this to pull rows from a cursor. The default
+        implementation materializes the full result with `execute_to_df()`.
+        Either way, the query is executed on the current `con` when this is called, not when
+        the generator is first advanced, since that may happen after the `blend()` call's context has exited.
+
+        Examples:
+            ```python
+            for chunk in db.execute_to_chunks("SELECT * FROM t", chunksize=1000):
+                chunk.to_csv("out.csv", mode="a", header=False)
+            ```
+        """
+        df = self.execute_to_df(query, params)
+        return (
+            df.iloc[i : i + chunksize] for i in range(0, max(len(df), 1), chunksize)
+        )
+
     @abstractmethod
     def execute_to_list(self, query: str, to_type: Callable = lambda x: x) -> list:
         """A lower-level execute method that doesn't use the pandas processing logic.
@@ -1,18 +1,28 @@
 import importlib.util
-from typing import Dict, Optional, List, Generator, Set, Union, Callable
+import threading
+from typing import Dict, Optional, List, Generator, Union, Callable, Tuple, ClassVar
 from collections.abc import Collection
 import pandas as pd
 from colorama import Fore
 from attr import attrs, attrib
 from pathlib import Path
-from functools import cached_property
 
-from .utils import double_quote_escape
+from .utils import (
+    double_quote_escape,
+    synchronized,
+    file_fingerprint,
+    LazyTables,
+    to_sqlglot_schema,
+)
 from ._database import Database
+from ._temp_tables import TempTableRegistry
 from .._logger import logger
 
 _has_duckdb = importlib.util.find_spec("duckdb") is not None
 
+# Name under which dataframes are registered on the connection in `to_temp_table()`
+_REGISTERED_VIEW_NAME = "__blendsql_registered_df"
+
 
 @attrs
 class DuckDB(Database):
@@ -52,11 +62,41 @@ class DuckDB(Database):
 
     # Can be either a dict from name -> pd.DataFrame
     # or, a single pd.DataFrame object
-    con: "DuckDBPyConnection" = attrib()
+    _con: "DuckDBPyConnection" = attrib()
     db_url: str = attrib()
+    # Statements to run on each new connection (see `open_connection()`), e.g. to select the default catalog
+    connection_setup: List[str] = attrib(factory=list)
 
-    # We use below to track which tables we should drop on '_reset_connection'
-    temp_tables: Set[str] = set()
+    # Any DDL on a table or view gives it a new oid.
+    #   Temp tables live in the separate `temp` catalog, so are excluded.
+    schema_version_query: ClassVar[
+        str
+    ] = """
+    SELECT hash(list(oid ORDER BY oid)) FROM (
+        SELECT table_oid AS oid FROM duckdb_tables()
+        WHERE database_name = current_database() AND schema_name = current_schema()
+        UNION ALL
+        SELECT view_oid FROM duckdb_views()
+        WHERE database_name = current_database() AND schema_name = current_schema()
+        AND NOT internal
+    )
+    """
+    sqlglot_schema_query: ClassVar[
+        str
+    ] = """
+    SELECT table_name, column_name, data_type FROM duckdb_columns()
+    WHERE database_name = current_database() AND schema_name = current_schema()
+    AND NOT internal
+    ORDER BY table_name, column_index
+    """
+
+    def __attrs_post_init__(self):
+        self._db_lock = threading.RLock()
+        self._lazy_tables = LazyTables()
+        # We use below to track which tables we should drop on '_reset_connection'
+        self._temp_tables = TempTableRegistry()
+        self._sqlglot_schema: Optional[Dict[str, Dict[str, str]]] = None
+        self._sqlglot_schema_version = None
 
     @classmethod
     def from_pandas(
@@ -105,68 +145,209 @@ class DuckDB(Database):
         con.sql("LOAD sqlite;")
         con.sql(f"ATTACH '{db_url}' AS sqlite_db (TYPE sqlite);")
         con.sql("USE sqlite_db")
-        return cls(con=con, db_url=db_url)
+        return cls(con=con, db_url=db_url, connection_setup=["USE sqlite_db"])
 
-    def _reset_connection(self):
-        """Reset connection, so that temp tables are cleared."""
-        for tablename in self.temp_tables:
-            self.con.execute(f'DROP TABLE IF EXISTS "{tablename}"')
-        self.temp_tables = set()
+    @staticmethod
+    def _drop_temp_tables(con: "DuckDBPyConnection", temp_tables: TempTableRegistry):
+        for info in temp_tables.clear():
+            con.execute(
+                f'DROP {"VIEW" if info.is_view else "TABLE"} IF EXISTS "{double_quote_escape(info.name)}"'
+            )
+
+    def open_connection(self) -> "DuckDBPyConnection":
+        """Opens a cursor, i.e. a new connection to the same database.
+        Temp tables are local to the connection which created them.
+        """
+        with self._db_lock:
+            con = self._con.cursor()
+        for statement in self.connection_setup:
+            con.execute(statement)
+        return con
 
-    def has_temp_table(self, tablename: str) -> bool:
-        return tablename in self.execute_to_list("SHOW TABLES")
+    def close_connection(
+        self, connection: "DuckDBPyConnection", temp_tables: TempTableRegistry
+    ) -> None:
+        self._drop_temp_tables(connection, temp_tables)
+        connection.close()
 
-    @cached_property
+    def _reset_connection(self):
+        """Reset the database's own connection, so that temp tables are cleared."""
+        with self._db_lock:
+            self._drop_temp_tables(self._con, self._temp_tables)
+
+    @property
+    @synchronized
     def sqlglot_schema(self) -> dict:
         """Returns database schema as a dictionary, in the format that
-        sqlglot.optimizer expects.
+        sqlglot.optimizer expects. Fetched with a single `duckdb_columns()` query,
+        and cached until the schema version changes.
 
         Examples:
             ```python
             db.sqlglot_schema
-            > {"x": {"A": "INT", "B": "INT", "C": "INT", "D": "INT", "Z": "STRING"}}
+            > {'"x"': {'"A"': "INT", '"B"': "INT", '"C"': "INT", '"D"': "INT", '"Z"': "STRING"}}
             ```
         """
-        schema: Dict[str, dict] = {}
-        for tablename in self.tables():
-            schema[f'"{double_quote_escape(tablename)}"'] = {}
-            for column_name, column_type in self.con.execute(
-                f"SELECT column_name, column_type FROM (DESCRIBE {tablename})"
-            ).fetchall():
-                schema[f'"{double_quote_escape(tablename)}"'][
-                    '"' + column_name + '"'
-                ] = column_type
-        return schema
+        (version,) = self.con.execute(self.schema_version_query).fetchone()
+        if self._sqlglot_schema is None or version != self._sqlglot_schema_version:
+            self._sqlglot_schema = to_sqlglot_schema(
+                self.con.execute(self.sqlglot_schema_query).fetchall()
+            )
+            self._sqlglot_schema_version = version
+        return self._sqlglot_schema
+
+    def invalidate_schema(self) -> None:
+        self._sqlglot_schema = None
 
     def tables(self) -> List[str]:
         return self.execute_to_list("SHOW TABLES;")
 
+    @synchronized
+    def fingerprint(self) -> Tuple:
+        """Identifies the contents of the database.
+        If it was loaded from a file (e.g. via `from_sqlite()`), this is the modification time and size of the file,
+        along with its write-ahead log.
+        Otherwise, we checksum the rows of each table.
+        """
+        fingerprint = file_fingerprint(self.db_url)
+        if fingerprint is not None:
+            return fingerprint
+        return tuple(
+            (
+                tablename,
+                *self.con.execute(
+                    f'SELECT COUNT(*), SUM(hash(t)) FROM "{double_quote_escape(tablename)}" AS t'
+                ).fetchone(),
+            )
+            for tablename in sorted(self.tables())
+        )
+
     def iter_columns(self, tablename: str) -> Generator[str, None, None]:
-        for row in self.con.execute(
+        yield from self.execute_to_list(
             f"SELECT column_name FROM (DESCRIBE {tablename})"
-        ).fetchall():
-            yield row[0]
+        )
 
     def schema_string(self, use_tables: Optional[Collection[str]] = None) -> str:
         """Converts the database to a series of 'CREATE TABLE' statements."""
         # TODO
         return None
 
-    def to_temp_table(self, df: pd.DataFrame, tablename: str):
+    @synchronized
+    def to_temp_table(
+        self,
+        df: Union[pd.DataFrame, "pa.Table"],
+        tablename: str,
+        created_by: Optional[str] = None,
+    ):
         """Technically, when duckdb is run in-memory (as is the default),
         all created tables are temporary tables (since they expire at the
         end of the session). So, we don't really need to insert 'TEMP' keyword here?
+
+        Both pandas dataframes and Arrow tables are registered as a view on the connection,
+        which DuckDB scans directly without converting to Python objects.
         """
         # DuckDB has this cool 'CREATE OR REPLACE' syntax
         # https://duckdb.org/docs/sql/statements/create_table.html#create-or-replace
-        self.con.sql(f'CREATE OR REPLACE TEMP TABLE "{tablename}" AS SELECT * FROM df')
-        self.temp_tables.add(tablename)
+        self._drop_dependent_views(tablename)
+        self.con.register(_REGISTERED_VIEW_NAME, df)
+        try:
+            self.con.sql(
+                f'CREATE OR REPLACE TEMP TABLE "{tablename}" AS SELECT * FROM {_REGISTERED_VIEW_NAME}'
+            )
+        finally:
+            self.con.unregister(_REGISTERED_VIEW_NAME)
+        self.temp_tables.register(tablename, df, created_by=created_by)
         logger.debug(Fore.CYAN + f"Created temp table {tablename}" + Fore.RESET)
 
+    @synchronized
+    def query_to_temp_table(
+        self, query: str, tablename: str, created_by: Optional[str] = None
+    ):
+        self._drop_dependent_views(tablename)
+        escaped_tablename = double_quote_escape(tablename)
+        (num_rows,) = self.con.execute(
+            f'CREATE OR REPLACE TEMP TABLE "{escaped_tablename}" AS {query.rstrip(";")}'
+        ).fetchone()
+        columns = [
+            c[0]
+            for c in self.con.execute(
+                f'SELECT * FROM "{escaped_tablename}" LIMIT 0'
+            ).description
+        ]
+        self.temp_tables.register_query_table(
+            tablename, columns, num_rows=num_rows, created_by=created_by
+        )
+        logger.debug(Fore.CYAN + f"Created temp table {tablename}" + Fore.RESET)
+
+    def _drop_dependent_views(self, tablename: str):
+        """DuckDB refuses to replace a table while views select from it."""
+        for info in self.temp_tables.pop_dependent_views(tablename):
+            self.con.execute(f'DROP VIEW IF EXISTS "{double_quote_escape(info.name)}"')
+
+    @synchronized
+    def create_temp_view(
+        self,
+        tablename: str,
+        query: str,
+        columns: List[str],
+        depends_on: List[str],
+        created_by: Optional[str] = None,
+    ):
+        self.con.execute(
+            f'CREATE OR REPLACE TEMP VIEW "{double_quote_escape(tablename)}" AS {query}'
+        )
+        self.temp_tables.register_view(
+            tablename, columns, depends_on=depends_on, created_by=created_by
+        )
+
+    @synchronized
+    def delete_from_temp_table(self, tablename: str, keep_condition: str):
+        (num_deleted,) = self.con.execute(
+            f'DELETE FROM "{double_quote_escape(tablename)}" WHERE NOT COALESCE(({keep_condition}), FALSE)'
+        ).fetchone()
+        info = self.temp_tables.get(tablename)
+        if info.num_rows is not None:
+            info.num_rows -= num_deleted
+
+    @synchronized
     def execute_to_df(self, query: str, params: Optional[dict] = None) -> pd.DataFrame:
         """On params with duckdb: https://github.com/duckdb/duckdb/issues/9853#issuecomment-1832732933"""
         return self.con.sql(query).df()
 
+    def execute_to_chunks(
+        self, query: str, chunksize: int, params: Optional[dict] = None
+    ) -> Generator[pd.DataFrame, None, None]:
+        """Execute the given query, and yield results as dataframes of at most `chunksize` rows.
+        Since temp tables are local to a DuckDB connection, this streams from the current `con`.
+        So, no other queries should be issued on that connection until the generator is exhausted.
+        """
+        con, lock = self.con, self._lock
+        with lock:
+            con.execute(query)
+            columns = [d[0] for d in con.description]
+        return self._iter_chunks(con, columns, chunksize, lock)
+
+    @staticmethod
+    def _iter_chunks(
+        con: "DuckDBPyConnection",
+        columns: List[str],
+        chunksize: int,
+        lock: threading.RLock,
+    ) -> Generator[pd.DataFrame, None, None]:
+        yielded = False
+        while True:
+            with lock:
+                rows = con.fetchmany(chunksize)
+            if not rows and yielded:
+                break
+            yielded = True
+            yield pd.DataFrame.from_records(rows, columns=columns)
+
+    @synchronized
+    def execute_to_arrow(self, query: str, params: Optional[dict] = None) -> "pa.Table":
+        return self.con.sql(query).arrow()
+
+    @synchronized
     def execute_to_list(
         self, query: str, to_type: Optional[Callable] = lambda x: x
     ) -> list:
@@ -1,18 +1,93 @@
 import importlib.util
+import io
+from typing import Iterator, Optional
+import pandas as pd
+from sqlalchemy import Table
 from sqlalchemy.engine import make_url, URL
 from colorama import Fore
 import logging
-from functools import cached_property
 
 from ._sqlalchemy import SQLAlchemyDatabase
+from ._database import _has_pyarrow
+from .utils import double_quote_escape
+from .._logger import logger
 
 _has_psycopg2 = importlib.util.find_spec("psycopg2") is not None
 
+# Number of rows encoded as CSV at a time while streaming a `COPY`
+COPY_BATCH_SIZE = 65536
+# Number of bytes psycopg2 reads from the stream per message sent to the server
+COPY_READ_SIZE = 1 << 20
+
+
+def _is_copyable(table: "pa.Table") -> bool:
+    """Whether the Arrow CSV writer can encode every column of `table`,
+    in a format PostgreSQL parses back into the temp table's column types."""
+    import pyarrow as pa
+
+    return all(
+        any(
+            f(field.type)
+            for f in [
+                pa.types.is_boolean,
+                pa.types.is_integer,
+                pa.types.is_floating,
+                pa.types.is_decimal,
+                pa.types.is_string,
+                pa.types.is_large_string,
+                pa.types.is_timestamp,
+                pa.types.is_date,
+                pa.types.is_null,
+            ]
+        )
+        for field in table.schema
+    )
+
+
+class _CsvStream(io.RawIOBase):
+    """A read-only file over the CSV encoding of an Arrow table, as read by `COPY ... FROM STDIN`.
+    Record batches are encoded one at a time, so the full CSV is never held in memory.
+
+    Every valid value is quoted, and nulls are left unquoted and empty.
+    So PostgreSQL's CSV format reads nulls as NULL, while empty strings stay empty strings.
+    """
+
+    def __init__(self, table: "pa.Table", batch_size: int = COPY_BATCH_SIZE):
+        import pyarrow.csv
+
+        self._write_options = pyarrow.csv.WriteOptions(
+            include_header=False, quoting_style="all_valid"
+        )
+        self._batches: Iterator["pa.RecordBatch"] = iter(
+            table.to_batches(max_chunksize=batch_size)
+        )
+        self._buffer = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        import pyarrow as pa
+        import pyarrow.csv
+
+        while len(self._buffer) == 0:
+            batch = next(self._batches, None)
+            if batch is None:
+                return 0
+            sink = pa.BufferOutputStream()
+            pyarrow.csv.write_csv(batch, sink, self._write_options)
+            self._buffer = memoryview(sink.getvalue()).cast("B")
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
 
 class PostgreSQL(SQLAlchemyDatabase):
     """A PostgreSQL database connection.
     Can be initialized via the SQLAlchemy input string.
     https://docs.sqlalchemy.org/en/20/core/engines.html#postgresql
+    `pool_size` and `max_overflow` size the pool of connections `blend()` calls check out (see `SQLAlchemyDatabase`).
 
     Examples:
         ```python
@@ -21,7 +96,33 @@ class PostgreSQL(SQLAlchemyDatabase):
         ```
     """
 
-    def __init__(self, db_path: str):
+    # Any DDL on a table (including `ALTER TABLE`) rewrites its `pg_class` row, changing its `xmin`.
+    #   Temp tables live in `pg_temp` schemas, which `current_schemas(false)` excludes.
+    schema_version_query = """
+    SELECT md5(string_agg(c.oid::text || ':' || c.xmin::text, ',' ORDER BY c.oid))
+    FROM pg_catalog.pg_class c
+    JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = ANY(current_schemas(false))
+    AND c.relkind IN ('r', 'v', 'm', 'p', 'f')
+    """
+    # Matches the tables SQLAlchemy's `get_table_names()` reports: those in the default schema.
+    #   User-defined types (e.g. enums) and arrays are reported by their type name.
+    sqlglot_schema_query = """
+    SELECT c.table_name, c.column_name,
+        CASE WHEN c.data_type IN ('USER-DEFINED', 'ARRAY') THEN c.udt_name ELSE c.data_type END
+    FROM information_schema.columns c
+    JOIN information_schema.tables t
+        ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+    WHERE c.table_schema = current_schema() AND t.table_type = 'BASE TABLE'
+    ORDER BY c.table_name, c.ordinal_position
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        pool_size: Optional[int] = None,
+        max_overflow: Optional[int] = None,
+    ):
         if not _has_psycopg2:
             raise ImportError(
                 "Please install psycopg2 with `pip install psycopg2-binary`!"
@@ -32,14 +133,37 @@ class PostgreSQL(SQLAlchemyDatabase):
                 Fore.RED
                 + "Connecting to postgreSQL database without specifying user!\nIt is strongly encouraged to create a `blendsql` user with read-only permissions and temp table creation privileges."
             )
-        super().__init__(db_url=db_url)
+        super().__init__(db_url=db_url, pool_size=pool_size, max_overflow=max_overflow)
 
-    def has_temp_table(self, tablename: str) -> bool:
-        return tablename in self.execute_to_list(
-            "SELECT table_name FROM information_schema.tables WHERE table_schema LIKE 'pg_temp_%'"
-        )
+    def _copy_arrow(self, table: "pa.Table", tablename: str) -> None:
+        """Streams the rows of `table` into the temp table `tablename` with a single `COPY ... FROM STDIN`."""
+        columns = ", ".join(f'"{double_quote_escape(c)}"' for c in table.column_names)
+        copy_stmt = f'COPY "{double_quote_escape(tablename)}" ({columns}) FROM STDIN WITH (FORMAT csv)'
+        logger.debug(Fore.LIGHTBLACK_EX + copy_stmt + Fore.RESET)
+        # Runs on the same DBAPI connection (and transaction) the temp table was created on
+        cursor = self.con.connection.cursor()
+        try:
+            cursor.copy_expert(copy_stmt, _CsvStream(table), size=COPY_READ_SIZE)
+        finally:
+            cursor.close()
+
+    def _insert_df(self, df: pd.DataFrame, tablename: str):
+        """Loads `df` with `COPY`, rather than batches of `INSERT` statements.
+        Falls back to `INSERT` if pyarrow isn't installed, or `df` can't be encoded as CSV.
+        """
+        if _has_pyarrow and len(df) > 0:
+            import pyarrow as pa
+
+            try:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # E.g. an object column of mixed types
+                table = None
+            if table is not None and _is_copyable(table):
+                return self._copy_arrow(table, tablename)
+        return super()._insert_df(df, tablename)
 
-    @cached_property
-    def sqlglot_schema(self) -> dict:
-        # TODO
-        return None
+    def _insert_arrow(self, table: "pa.Table", temp_table: Table):
+        if _is_copyable(table):
+            return self._copy_arrow(table, temp_table.name)
+        return super()._insert_arrow(table, temp_table)
@@ -1,54 +1,183 @@
-from typing import Generator, List, Callable, Optional, Union
+from typing import Generator, Iterator, List, Callable, Optional, Union, ClassVar
 from collections.abc import Collection
 import pandas as pd
 from colorama import Fore
+import os
 import re
+import threading
 from attr import attrib, attrs
 from sqlalchemy.schema import CreateTable
-from sqlalchemy import create_engine, inspect, MetaData
+from sqlalchemy import create_engine, MetaData, Table, Column
 from sqlalchemy.sql import text
-from sqlalchemy.engine import Engine, Connection, URL
+from sqlalchemy.engine import Engine, Connection, URL, make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import QueuePool
 from pandas.io.sql import get_schema
 
 from ._database import Database
+from ._temp_tables import TempTableRegistry
+from ._catalog import SchemaCatalog
 from .._logger import logger
-from .utils import double_quote_escape, truncate_df_content, LazyTables
+from .._configure import POOL_SIZE_KEY, MAX_OVERFLOW_KEY
+from .utils import (
+    double_quote_escape,
+    truncate_df_content,
+    LazyTables,
+    synchronized,
+    arrow_to_sqlalchemy_type,
+    ClosingIterator,
+)
 from .bridge_content_encoder import get_database_matches
 
 
 @attrs(auto_detect=True)
 class SQLAlchemyDatabase(Database):
+    """Base class of databases connected to via SQLAlchemy.
+
+    Each `blend()` call checks out a connection from the engine's pool, and returns it once done.
+    Its temp tables are session-local, so they're only visible on that connection,
+    and dropped before it's returned.
+
+    Args:
+        db_url: The SQLAlchemy URL of the database
+        pool_size: The number of connections kept open in the pool.
+            Defaults to `config.set_pool_size()`, or SQLAlchemy's default of 5
+        max_overflow: The number of connections which may be opened beyond `pool_size`, and closed once returned.
+            Defaults to `config.set_max_overflow()`, or SQLAlchemy's default of 10
+    """
+
     db_url: URL = attrib()
+    pool_size: Optional[int] = attrib(default=None)
+    max_overflow: Optional[int] = attrib(default=None)
 
     engine: Engine = attrib(init=False)
-    con: Connection = attrib(init=False)
+    catalog: SchemaCatalog = attrib(init=False)
+
+    # Cheap query returning an identifier of the current schema version, used to invalidate `catalog`
+    schema_version_query: ClassVar[Optional[str]] = None
+    # Single query returning `(tablename, columnname, type)` rows for every column, used for `sqlglot_schema`
+    sqlglot_schema_query: ClassVar[Optional[str]] = None
 
     def __attrs_post_init__(self):
-        self.lazy_tables = LazyTables()
-        self.engine = create_engine(self.db_url)
-        self.con = self.engine.connect()
-        self.metadata = MetaData()
-        self.metadata.reflect(bind=self.engine)
+        self._db_lock = threading.RLock()
+        self._lazy_tables = LazyTables()
+        self._temp_tables = TempTableRegistry()
+        self.engine = create_engine(self.db_url, **self._pool_kwargs())
+        # Only checked out once used outside of a `blend()` call
+        self._own_con: Optional[Connection] = None
+        # Tables are reflected lazily, as they're needed
+        self.catalog = SchemaCatalog(
+            self.engine,
+            get_version=self._get_schema_version
+            if self.schema_version_query is not None
+            else None,
+            get_schema_rows=self._get_schema_rows
+            if self.sqlglot_schema_query is not None
+            else None,
+        )
+
+    def _pool_kwargs(self) -> dict:
+        db_url = make_url(self.db_url)
+        # E.g. in-memory SQLite databases use a `SingletonThreadPool`, which can't overflow
+        if not issubclass(db_url.get_dialect().get_pool_class(db_url), QueuePool):
+            return {}
+        kwargs = {}
+        pool_size = self.pool_size
+        if pool_size is None and os.getenv(POOL_SIZE_KEY) is not None:
+            pool_size = int(os.getenv(POOL_SIZE_KEY))
+        if pool_size is not None:
+            kwargs["pool_size"] = pool_size
+        max_overflow = self.max_overflow
+        if max_overflow is None and os.getenv(MAX_OVERFLOW_KEY) is not None:
+            max_overflow = int(os.getenv(MAX_OVERFLOW_KEY))
+        if max_overflow is not None:
+            kwargs["max_overflow"] = max_overflow
+        return kwargs
+
+    @property
+    def _con(self) -> Connection:
+        """The database's own connection, used outside of `blend()` calls."""
+        with self._db_lock:
+            if self._own_con is None:
+                self._own_con = self.engine.connect()
+            return self._own_con
+
+    def _get_schema_version(self, con: Connection):
+        return con.execute(text(self.schema_version_query)).scalar()
+
+    def _get_schema_rows(self, con: Connection) -> List[tuple]:
+        return [tuple(row) for row in con.execute(text(self.sqlglot_schema_query))]
+
+    @property
+    def sqlglot_schema(self) -> Optional[dict]:
+        """Returns database schema as a dictionary, in the format that
+        sqlglot.optimizer expects. Fetched with a single catalog query, and cached on `catalog`.
+
+        Examples:
+            ```python
+            db.sqlglot_schema
+            > {'"x"': {'"A"': "INT", '"B"': "INT", '"C"': "INT", '"D"': "INT", '"Z"': "STRING"}}
+            ```
+        """
+        return self.catalog.sqlglot_schema()
+
+    def invalidate_schema(self) -> None:
+        self.catalog.invalidate()
+
+    @staticmethod
+    def _drop_temp_tables(con: Connection, temp_tables: TempTableRegistry):
+        for info in temp_tables.clear():
+            con.execute(
+                text(
+                    f'DROP {"VIEW" if info.is_view else "TABLE"} IF EXISTS "{double_quote_escape(info.name)}"'
+                )
+            )
+        con.commit()
+
+    def open_connection(self) -> Connection:
+        """Checks out a connection from the engine's pool."""
+        return self.engine.connect()
+
+    def close_connection(
+        self, connection: Connection, temp_tables: TempTableRegistry
+    ) -> None:
+        """Since the engine pools its DBAPI connections, closing ours returns the underlying
+        session to the pool, rather than ending it. So, we explicitly drop the temp tables we created first.
+        If that fails, the connection is invalidated instead, so the pool never hands out a session still holding them.
+        """
+        try:
+            # E.g. after a failed statement, PostgreSQL rejects all others until rolled back
+            connection.rollback()
+            self._drop_temp_tables(connection, temp_tables)
+        except SQLAlchemyError as e:
+            logger.debug(
+                Fore.YELLOW
+                + f"Invalidating connection after failing to drop temp tables: {e}"
+                + Fore.RESET
+            )
+            connection.invalidate()
+        finally:
+            connection.close()
 
     def _reset_connection(self):
-        """Reset connection, so that temp tables are cleared."""
-        self.con.close()
-        self.con = self.engine.connect()
+        """Drop the temp tables on the database's own connection, and return it to the pool."""
+        with self._db_lock:
+            if self._own_con is not None:
+                self.close_connection(self._own_con, self._temp_tables)
+                self._own_con = None
 
     def tables(self) -> List[str]:
-        return inspect(self.engine).get_table_names()
+        return self.catalog.tables()
+
+    def has_table(self, tablename: str) -> bool:
+        return self.catalog.has_table(tablename)
 
     def iter_columns(self, tablename: str) -> Generator[str, None, None]:
-        if tablename in self.tables():
-            for column_data in inspect(self.engine).get_columns(tablename):
-                yield column_data["name"]
+        yield from self.catalog.columns(tablename)
 
     def schema_string(self, use_tables: Optional[Collection[str]] = None) -> str:
         create_table_stmts = []
-        for table in self.metadata.sorted_tables:
-            if use_tables:
-                if table.name not in use_tables:
-                    continue
+        for table in self.catalog.reflect(use_tables or None):
             create_table_stmts.append(str(CreateTable(table)).strip())
         return "\n\n".join(create_table_stmts)
 
@@ -117,18 +246,122 @@ class SQLAlchemyDatabase(Database):
                     )
         return "\n".join(serialized_db).strip()
 
-    def to_temp_table(self, df: pd.DataFrame, tablename: str):
+    @synchronized
+    def to_temp_table(
+        self,
+        df: Union[pd.DataFrame, "pa.Table"],
+        tablename: str,
+        created_by: Optional[str] = None,
+    ):
+        self._drop_temp_table(tablename)
+        if isinstance(df, pd.DataFrame):
+            create_table_stmt = get_schema(df, name=tablename, con=self.con).strip()
+            # Insert 'TEMP' keyword
+            create_table_stmt = re.sub(
+                r"^CREATE TABLE", "CREATE TEMP TABLE", create_table_stmt
+            )
+            logger.debug(Fore.LIGHTBLACK_EX + create_table_stmt + Fore.RESET)
+            self.con.execute(text(create_table_stmt))
+            self._insert_df(df, tablename)
+        else:
+            self._arrow_to_temp_table(df, tablename)
+        self.temp_tables.register(tablename, df, created_by=created_by)
+
+    @synchronized
+    def query_to_temp_table(
+        self, query: str, tablename: str, created_by: Optional[str] = None
+    ):
+        self._drop_temp_table(tablename)
+        escaped_tablename = double_quote_escape(tablename)
+        self.con.execute(
+            text(f'CREATE TEMP TABLE "{escaped_tablename}" AS {query.rstrip(";")}')
+        )
+        columns = list(
+            self.con.execute(
+                text(f'SELECT * FROM "{escaped_tablename}" LIMIT 0')
+            ).keys()
+        )
+        # The DBAPI rowcount of a 'CREATE TABLE ... AS' isn't reliable, so leave it unknown
+        self.temp_tables.register_query_table(tablename, columns, created_by=created_by)
+
+    def _drop_temp_table(self, tablename: str):
+        """Drops the temp table 'tablename' if it exists, along with the views selecting from it."""
+        for info in self.temp_tables.pop_dependent_views(tablename):
+            self.con.execute(
+                text(f'DROP VIEW IF EXISTS "{double_quote_escape(info.name)}"')
+            )
         if self.has_temp_table(tablename):
-            self.con.execute(text(f'DROP TABLE "{tablename}"'))
-        create_table_stmt = get_schema(df, name=tablename, con=self.con).strip()
-        # Insert 'TEMP' keyword
-        create_table_stmt = re.sub(
-            r"^CREATE TABLE", "CREATE TEMP TABLE", create_table_stmt
+            self.con.execute(text(f'DROP TABLE "{double_quote_escape(tablename)}"'))
+
+    @synchronized
+    def create_temp_view(
+        self,
+        tablename: str,
+        query: str,
+        columns: List[str],
+        depends_on: List[str],
+        created_by: Optional[str] = None,
+    ):
+        # SQLite has no 'CREATE OR REPLACE VIEW'
+        # And postgres only allows replacing a view with one which appends columns
+        self.con.execute(
+            text(f'DROP VIEW IF EXISTS "{double_quote_escape(tablename)}"')
+        )
+        self.con.execute(
+            text(f'CREATE TEMP VIEW "{double_quote_escape(tablename)}" AS {query}')
+        )
+        self.temp_tables.register_view(
+            tablename, columns, depends_on=depends_on, created_by=created_by
         )
-        logger.debug(Fore.LIGHTBLACK_EX + create_table_stmt + Fore.RESET)
-        self.con.execute(text(create_table_stmt))
+
+    @synchronized
+    def delete_from_temp_table(self, tablename: str, keep_condition: str):
+        self.con.execute(
+            text(
+                f'DELETE FROM "{double_quote_escape(tablename)}" WHERE NOT COALESCE(({keep_condition}), FALSE)'
+            )
+        )
+        self.temp_tables.get(tablename).num_rows = None
+
+    @synchronized
+    def index_temp_table(self, tablename: str, column: str) -> None:
+        self.con.execute(
+            text(
+                f'CREATE INDEX "{double_quote_escape(tablename)}_idx" ON "{double_quote_escape(tablename)}" ("{double_quote_escape(column)}")'
+            )
+        )
+
+    def _insert_df(self, df: pd.DataFrame, tablename: str):
+        """Inserts the rows of `df` into the (already created) temp table `tablename`."""
         df.to_sql(name=tablename, con=self.con, if_exists="append", index=False)
 
+    def _insert_arrow(self, table: "pa.Table", temp_table: Table):
+        """Inserts the rows of `table` into `temp_table` with a single `executemany()`,
+        without building an intermediate dataframe.
+        """
+        self.con.execute(temp_table.insert(), table.to_pylist())
+
+    def _arrow_to_temp_table(self, table: "pa.Table", tablename: str):
+        """Creates the temp table from the Arrow schema, and bulk inserts its rows."""
+        temp_table = Table(
+            tablename,
+            MetaData(),
+            *[
+                Column(field.name, arrow_to_sqlalchemy_type(field.type))
+                for field in table.schema
+            ],
+            prefixes=["TEMPORARY"],
+        )
+        logger.debug(
+            Fore.LIGHTBLACK_EX
+            + str(CreateTable(temp_table).compile(self.engine)).strip()
+            + Fore.RESET
+        )
+        temp_table.create(self.con)
+        if table.num_rows > 0:
+            self._insert_arrow(table, temp_table)
+
+    @synchronized
     def execute_to_df(self, query: str, params: Optional[dict] = None) -> pd.DataFrame:
         """
         Execute the given query and return results as dataframe.
@@ -150,6 +383,60 @@ class SQLAlchemyDatabase(Database):
         """
         return pd.read_sql(text(query), self.con, params=params)
 
+    def execute_to_chunks(
+        self, query: str, chunksize: int, params: Optional[dict] = None
+    ) -> Iterator[pd.DataFrame]:
+        """Execute the given query, and yield results as dataframes of at most `chunksize` rows.
+        Uses `stream_results`, so that drivers which support it (e.g. psycopg2) fetch
+        rows from a server-side cursor instead of buffering the full result client-side.
+        """
+        # The result is tied to the current connection, so we also hold on to its lock
+        lock = self._lock
+        with lock:
+            result = self.con.execute(
+                text(query), params, execution_options={"stream_results": True}
+            )
+        # Close `result` even if the chunks are never iterated
+        return ClosingIterator(
+            self._iter_chunks(result, chunksize, lock), on_close=result.close
+        )
+
+    @staticmethod
+    def _iter_chunks(
+        result, chunksize: int, lock: threading.RLock
+    ) -> Generator[pd.DataFrame, None, None]:
+        columns = list(result.keys())
+        yielded = False
+        while True:
+            with lock:
+                rows = result.fetchmany(chunksize)
+            if not rows and yielded:
+                break
+            yielded = True
+            yield pd.DataFrame.from_records(rows, columns=columns)
+
+    @synchronized
+    def execute_to_arrow(self, query: str, params: Optional[dict] = None) -> "pa.Table":
+        """Execute the given query and return results as an Arrow table.
+        Requires `pyarrow` to be installed.
+
+        This is not zero-copy: the DBAPI driver returns Python objects, which are then converted to Arrow.
+        Where possible, prefer `query_to_temp_table()`, which keeps the rows in the database.
+        """
+        import pyarrow as pa
+
+        result = self.con.execute(text(query), params)
+        columns = list(result.keys())
+        rows = result.fetchall()
+        return pa.table(
+            {
+                # Use positional access, since column names may be duplicated
+                str(idx): [row[idx] for row in rows]
+                for idx in range(len(columns))
+            }
+        ).rename_columns(columns)
+
+    @synchronized
     def execute_to_list(self, query: str, to_type: Callable = lambda x: x) -> list:
         """A lower-level execute method that doesn't use the pandas processing logic.
         Returns results as a tuple.
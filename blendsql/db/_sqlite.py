@@ -1,15 +1,18 @@
 from pathlib import Path
+from urllib.parse import quote
 from sqlalchemy.engine import make_url, URL
-from functools import cached_property
-from typing import Dict
+from typing import Optional, Tuple
 
-from .utils import double_quote_escape
+from .utils import file_fingerprint
 from ._sqlalchemy import SQLAlchemyDatabase
 
 
 class SQLite(SQLAlchemyDatabase):
     """A SQLite database connection.
     Can be initialized via a path to the database file.
+    With `read_only=True`, the file is opened in SQLite's read-only mode.
+    `pool_size` and `max_overflow` size the pool of connections `blend()` calls check out (see `SQLAlchemyDatabase`).
+    BlendSQL's temp tables live in the connection's separate `temp` schema, so can still be created.
 
     Examples:
         ```python
@@ -18,34 +21,36 @@ class SQLite(SQLAlchemyDatabase):
         ```
     """
 
-    def __init__(self, db_path: str):
-        db_url: URL = make_url(f"sqlite:///{Path(db_path).resolve()}")
-        super().__init__(db_url=db_url)
-
-    def has_temp_table(self, tablename: str) -> bool:
-        return tablename in self.execute_to_list(
-            "SELECT name FROM sqlite_temp_master WHERE type='table';"
-        )
-
-    @cached_property
-    def sqlglot_schema(self) -> dict:
-        """Returns database schema as a dictionary, in the format that
-        sqlglot.optimizer expects.
+    schema_version_query = "PRAGMA schema_version"
+    # Matches the tables SQLAlchemy's `get_table_names()` reports
+    sqlglot_schema_query = """
+    SELECT m.name, p.name, p.type
+    FROM sqlite_master m
+    JOIN pragma_table_info(m.name) p
+    WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite~_%' ESCAPE '~'
+    ORDER BY m.name, p.cid
+    """
 
-        Examples:
-            >>> db.sqlglot_schema
-            {"x": {"A": "INT", "B": "INT", "C": "INT", "D": "INT", "Z": "STRING"}}
-        """
-        schema: Dict[str, dict] = {}
-        for tablename in self.tables():
-            schema[f'"{double_quote_escape(tablename)}"'] = {}
-            for _, row in self.execute_to_df(
-                f"""
-            SELECT name, type FROM pragma_table_info(:t)
-            """,
-                {"t": tablename},
-            ).iterrows():
-                schema[f'"{double_quote_escape(tablename)}"'][
-                    '"' + row["name"] + '"'
-                ] = row["type"]
-        return schema
+    def __init__(
+        self,
+        db_path: str,
+        read_only: bool = False,
+        pool_size: Optional[int] = None,
+        max_overflow: Optional[int] = None,
+    ):
+        self.db_path = str(Path(db_path).resolve())
+        if read_only:
+            # SQLite decodes the path of a URI filename, so characters like `?`, `#` and `%` need escaping.
+            #   `URL.create()` takes the path as-is, where `make_url()` would decode it first
+            db_url: URL = URL.create(
+                "sqlite",
+                database=f"file:{quote(self.db_path)}",
+                query={"mode": "ro", "uri": "true"},
+            )
+        else:
+            db_url = make_url(f"sqlite:///{self.db_path}")
+        super().__init__(db_url=db_url, pool_size=pool_size, max_overflow=max_overflow)
+
+    def fingerprint(self) -> Optional[Tuple[int, ...]]:
+        """Identifies the contents of the database by the modification time and size of its file."""
+        return file_fingerprint(self.db_path)
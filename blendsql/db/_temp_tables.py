@@ -0,0 +1,135 @@
+"""In-memory registry of the temp tables BlendSQL creates on a database connection.
+
+Every temp table goes through `Database.to_temp_table()`, so we know exactly which ones exist.
+This lets `Database.has_temp_table()` answer without querying the DBMS catalog
+(`sqlite_temp_master`, `SHOW TABLES`, `information_schema.tables`), which
+`Ingredient.maybe_get_temp_table()` would otherwise do several times per ingredient call.
+It also tells `Database._reset_connection()` exactly which tables to drop.
+"""
+import threading
+from typing import Dict, List, Optional, Union
+
+import pandas as pd
+from attr import attrs, attrib
+
+
+@attrs
+class TempTableInfo:
+    name: str = attrib()
+    columns: List[str] = attrib()
+    # Unknown for views, and for tables created from a query on some DBMS
+    num_rows: Optional[int] = attrib()
+    # Name of the ingredient(s) whose outputs the table holds, if any
+    created_by: Optional[str] = attrib(default=None)
+    is_view: bool = attrib(default=False)
+    # For views, the temp tables they select from
+    depends_on: List[str] = attrib(factory=list)
+
+
+@attrs
+class TempTableRegistry:
+    """Tracks the temp tables which currently exist on a database connection."""
+
+    tables: Dict[str, TempTableInfo] = attrib(factory=dict)
+    # Number of `has_temp_table()` calls answered without a DBMS catalog query
+    catalog_queries_avoided: int = attrib(default=0)
+    _lock: threading.Lock = attrib(init=False, factory=threading.Lock)
+
+    def __len__(self) -> int:
+        return len(self.tables)
+
+    def __contains__(self, tablename: str) -> bool:
+        return tablename in self.tables
+
+    def get(self, tablename: str) -> Optional[TempTableInfo]:
+        return self.tables.get(tablename)
+
+    def register(
+        self,
+        tablename: str,
+        df: Union[pd.DataFrame, "pa.Table"],
+        created_by: Optional[str] = None,
+    ) -> TempTableInfo:
+        if isinstance(df, pd.DataFrame):
+            columns, num_rows = [str(c) for c in df.columns], len(df)
+        else:
+            columns, num_rows = list(df.column_names), df.num_rows
+        return self._add(
+            TempTableInfo(
+                name=tablename,
+                columns=columns,
+                num_rows=num_rows,
+                created_by=created_by,
+            )
+        )
+
+    def register_query_table(
+        self,
+        tablename: str,
+        columns: List[str],
+        num_rows: Optional[int] = None,
+        created_by: Optional[str] = None,
+    ) -> TempTableInfo:
+        return self._add(
+            TempTableInfo(
+                name=tablename,
+                columns=columns,
+                num_rows=num_rows,
+                created_by=created_by,
+            )
+        )
+
+    def register_view(
+        self,
+        tablename: str,
+        columns: List[str],
+        depends_on: List[str],
+        created_by: Optional[str] = None,
+    ) -> TempTableInfo:
+        return self._add(
+            TempTableInfo(
+                name=tablename,
+                columns=columns,
+                num_rows=None,
+                created_by=created_by,
+                is_view=True,
+                depends_on=depends_on,
+            )
+        )
+
+    def _add(self, info: TempTableInfo) -> TempTableInfo:
+        with self._lock:
+            # Move to the end, so that dependents are always registered after their dependencies
+            self.tables.pop(info.name, None)
+            self.tables[info.name] = info
+        return info
+
+    def lookup(self, tablename: str) -> bool:
+        """Checks whether `tablename` exists, counting the avoided catalog query."""
+        with self._lock:
+            self.catalog_queries_avoided += 1
+            return tablename in self.tables
+
+    def pop_dependent_views(self, tablename: str) -> List[TempTableInfo]:
+        """Forgets all views selecting (directly or indirectly) from `tablename`,
+        and returns them in the order they should be dropped.
+        Some DBMS (DuckDB, Postgres) refuse to drop or replace a table while views depend on it.
+        """
+        with self._lock:
+            dropped_names = {tablename}
+            dropped: List[TempTableInfo] = []
+            for info in self.tables.values():
+                if info.is_view and dropped_names.intersection(info.depends_on):
+                    dropped_names.add(info.name)
+                    dropped.append(info)
+            for info in dropped:
+                del self.tables[info.name]
+        return dropped[::-1]
+
+    def clear(self) -> List[TempTableInfo]:
+        """Forgets all temp tables, and returns them in the order they should be dropped
+        (i.e. views before the tables they select from)."""
+        with self._lock:
+            infos = list(self.tables.values())[::-1]
+            self.tables.clear()
+        return infos
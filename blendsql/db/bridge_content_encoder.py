@@ -15,14 +15,19 @@ from typing import List, Optional, Tuple
 
 from rapidfuzz import fuzz
 import re
-from diskcache import Cache
 
 
 def double_quote_escape(s):
     return re.sub(r'(?<=[^"])"(?=[^"])', '""', s)
 
 
-cache = Cache()
+@functools.lru_cache(maxsize=None)
+def _get_cache():
+    # Created on first use, since `Cache()` makes a temporary directory
+    from diskcache import Cache
+
+    return Cache()
+
 
 # fmt: off
 _stopwords = {'who', 'ourselves', 'down', 'only', 'were', 'him', 'at', "weren't", 'has', 'few', "it's", 'm', 'again',
@@ -240,6 +245,7 @@ def get_column_picklist_with_db(table_name: str, column_name: str, db) -> list:
     Useful for OTT-QA setting, where we don't want to repeatedly open/close connection
         to a large db.
     """
+    cache = _get_cache()
     key = (table_name, column_name)
     if key in cache:
         return cache[key]
@@ -1,7 +1,19 @@
+import os
 import re
+import weakref
 import pandas as pd
-from typing import Callable, Optional
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+from functools import wraps
 from attr import attrs, attrib
+from sqlalchemy.types import (
+    TypeEngine,
+    Boolean,
+    BigInteger,
+    Float,
+    DateTime,
+    Date,
+    Text,
+)
 
 
 @attrs(frozen=True)
@@ -35,6 +47,105 @@ class LazyTables(dict):
         self[lazy_table.tablename] = lazy_table
 
 
+T = TypeVar("T")
+
+
+class ClosingIterator(Iterator[T]):
+    """Iterator over `iterable`, which calls `on_close` exactly once: when exhausted,
+    when iteration raises, on an explicit `close()`, or once the iterator is garbage collected.
+    Unlike the `finally` block of a generator, this also runs if iteration never started.
+
+    `on_close` must not hold a reference to the iterator itself, or it will never be collected.
+    """
+
+    def __init__(self, iterable: Iterable[T], on_close: Callable[[], None]):
+        self._iterator = iter(iterable)
+        self._finalizer = weakref.finalize(self, on_close)
+
+    @property
+    def closed(self) -> bool:
+        return not self._finalizer.alive
+
+    def __iter__(self) -> "ClosingIterator[T]":
+        return self
+
+    def __next__(self) -> T:
+        if self.closed:
+            raise StopIteration
+        try:
+            return next(self._iterator)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        self._finalizer()
+
+
+def synchronized(f: Callable) -> Callable:
+    """Serializes calls to the decorated `Database` method across threads,
+    since the underlying connection objects aren't thread-safe.
+    Expects the database to define a reentrant `_lock`.
+    """
+
+    @wraps(f)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return f(self, *args, **kwargs)
+
+    return wrapper
+
+
+def file_fingerprint(path: str) -> Optional[Tuple[int, ...]]:
+    """Identifies the contents of a database file by its modification time and size.
+    A write-ahead log next to the file (SQLite's `-wal`, or DuckDB's `.wal`) is included,
+    since committed writes may live there until a checkpoint.
+    Returns None if `path` isn't a file.
+    """
+    if not os.path.isfile(path):
+        return None
+    fingerprint = []
+    for p in [path, f"{path}-wal", f"{path}.wal"]:
+        if os.path.isfile(p):
+            stat = os.stat(p)
+            fingerprint.extend([stat.st_mtime_ns, stat.st_size])
+    return tuple(fingerprint)
+
+
+def arrow_to_sqlalchemy_type(arrow_type: "pa.DataType") -> TypeEngine:
+    """Maps an Arrow datatype to the SQLAlchemy type used when creating temp tables.
+    Mirrors the types `pandas.io.sql.get_schema()` picks for the equivalent dataframe.
+    """
+    import pyarrow as pa
+
+    if pa.types.is_boolean(arrow_type):
+        return Boolean()
+    if pa.types.is_integer(arrow_type):
+        return BigInteger()
+    if pa.types.is_floating(arrow_type) or pa.types.is_decimal(arrow_type):
+        return Float()
+    if pa.types.is_timestamp(arrow_type):
+        return DateTime()
+    if pa.types.is_date(arrow_type):
+        return Date()
+    return Text()
+
+
+def to_sqlglot_schema(
+    rows: Iterable[Tuple[str, str, str]]
+) -> Dict[str, Dict[str, str]]:
+    """Builds the schema dictionary sqlglot.optimizer expects from
+    `(tablename, columnname, type)` rows, e.g. those of a single bulk catalog query.
+    Columns should be ordered as they are in their table.
+    """
+    schema: Dict[str, Dict[str, str]] = {}
+    for tablename, columnname, columntype in rows:
+        schema.setdefault(f'"{double_quote_escape(tablename)}"', {})[
+            f'"{double_quote_escape(columnname)}"'
+        ] = columntype
+    return schema
+
+
 def single_quote_escape(s):
     return re.sub(r"(?<=[^'])'(?=[^'])", "''", s)
 
@@ -9,6 +9,7 @@ from .builtin import (
 )
 from .ingredient import (
     Ingredient,
+    IngredientEstimate,
     MapIngredient,
     JoinIngredient,
     StringIngredient,
@@ -3,13 +3,14 @@ import json
 from colorama import Fore
 from pathlib import Path
 from attr import attrs, attrib
-import guidance
 
 from blendsql.models import Model, LocalModel
+from blendsql.models._rate_limit import count_tokens
 from blendsql._program import Program
+from blendsql._steps import run_steps, arun_steps
 from blendsql._logger import logger
-from blendsql.ingredients.ingredient import JoinIngredient
-from blendsql.ingredients.generate import generate, user, assistant
+from blendsql.ingredients.ingredient import JoinIngredient, IngredientEstimate
+from blendsql.ingredients.generate import user, assistant
 from blendsql.ingredients.utils import initialize_retriever, partialclass
 
 from .examples import AnnotatedJoinExample, JoinExample
@@ -32,6 +33,8 @@ class JoinProgram(Program):
         **kwargs,
     ) -> Tuple[Dict[str, str], str]:
         if isinstance(model, LocalModel):
+            import guidance
+
             lm: guidance.models.Model = model.model_obj
             with guidance.user():
                 lm += MAIN_INSTRUCTION
@@ -78,11 +81,9 @@ class JoinProgram(Program):
                 )
             messages.append(user(current_example.to_string()))
             prompt = "".join([i["content"] for i in messages])
-            response = (
-                generate(model, messages_list=[messages])[0]
-                .removeprefix("```json")
-                .removesuffix("```")
-            )
+            # Yield the request to `generate()`, so that it can also be awaited (see `Program.acall()`)
+            responses: List[str] = yield {"messages_list": [messages]}
+            response = responses[0].removeprefix("```json").removesuffix("```")
             # Post-process language model response
             try:
                 mapping: dict = json.loads(response)
@@ -174,6 +175,46 @@ class LLMJoin(JoinIngredient):
             use_skrub_joiner=use_skrub_joiner,
         )
 
+    def estimate(
+        self,
+        left_values: List[str],
+        right_values: List[str],
+        model: Optional[Model] = None,
+        question: Optional[str] = None,
+        few_shot_retriever: Callable[[str], List[AnnotatedJoinExample]] = None,
+        **kwargs,
+    ) -> IngredientEstimate:
+        """Predicts the single request `run()` would send to the model.
+        Without a model, we count tokens with a heuristic.
+        """
+        if len(left_values) == 0 or len(right_values) == 0:
+            return IngredientEstimate(num_prompts=0, prompt_tokens=0)
+        if question is None:
+            question = "Join to same topics."
+        if few_shot_retriever is None:
+            few_shot_retriever = lambda *_: DEFAULT_JOIN_FEW_SHOT
+        current_example = JoinExample(
+            **{
+                "join_criteria": question,
+                "left_values": left_values,
+                "right_values": right_values,
+            }
+        )
+        prompt = "".join(
+            [MAIN_INSTRUCTION]
+            + [
+                example.to_string() + json.dumps(example.mapping, indent=4)
+                for example in few_shot_retriever(current_example.to_string())
+            ]
+            + [current_example.to_string()]
+        )
+        return IngredientEstimate(
+            num_prompts=1,
+            prompt_tokens=count_tokens(
+                prompt, model.tokenizer if model is not None else None
+            ),
+        )
+
     def run(
         self,
         model: Model,
@@ -183,6 +224,38 @@ class LLMJoin(JoinIngredient):
         few_shot_retriever: Callable[[str], List[AnnotatedJoinExample]] = None,
         **kwargs,
     ) -> dict:
+        return run_steps(
+            self._predict_steps(
+                model=model,
+                left_values=left_values,
+                right_values=right_values,
+                question=question,
+                few_shot_retriever=few_shot_retriever,
+                **kwargs,
+            ),
+            lambda request: model.predict(program=JoinProgram, **request),
+        )
+
+    async def arun(self, model: Model, *args, **kwargs) -> dict:
+        """Awaitable version of `run()`, which awaits `Model.apredict()` on the running event loop.
+        Few-shot retrieval happens on a worker thread.
+        """
+        return await arun_steps(
+            self._predict_steps(model, *args, **kwargs),
+            lambda request: model.apredict(program=JoinProgram, **request),
+            offload=True,
+        )
+
+    def _predict_steps(
+        self,
+        model: Model,
+        left_values: List[str],
+        right_values: List[str],
+        question: Optional[str] = None,
+        few_shot_retriever: Callable[[str], List[AnnotatedJoinExample]] = None,
+        **kwargs,
+    ):
+        """The logic of `run()`, yielding the kwargs to call `Model.predict()` with."""
         if question is None:
             question = "Join to same topics."
         if few_shot_retriever is None:
@@ -197,8 +270,7 @@ class LLMJoin(JoinIngredient):
         few_shot_examples: List[AnnotatedJoinExample] = few_shot_retriever(
             current_example.to_string()
         )
-        mapping = model.predict(
-            program=JoinProgram,
+        mapping = yield dict(
             current_example=JoinExample(
                 **{
                     "join_criteria": question,
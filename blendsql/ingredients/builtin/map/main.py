@@ -1,28 +1,40 @@
 import copy
 import os
-from typing import Union, Iterable, Any, Optional, List, Callable, Tuple
+from typing import (
+    Union,
+    Iterable,
+    Any,
+    Optional,
+    List,
+    Callable,
+    Tuple,
+    Dict,
+    Hashable,
+)
 from collections.abc import Collection
 from pathlib import Path
 import json
 import pandas as pd
 from colorama import Fore
 from attr import attrs, attrib
-import guidance
 
 from blendsql._logger import logger
 from blendsql.models import Model, LocalModel
+from blendsql.models._rate_limit import count_tokens
 from blendsql import _constants as CONST
-from blendsql.ingredients.ingredient import MapIngredient
+from blendsql.ingredients.ingredient import MapIngredient, IngredientEstimate
 from blendsql._program import Program
+from blendsql._steps import run_steps, arun_steps
 from blendsql._exceptions import IngredientException
-from blendsql.ingredients.generate import generate, user, assistant
+from blendsql.ingredients.generate import user, assistant
 from blendsql.ingredients.utils import (
     initialize_retriever,
     cast_responses_to_datatypes,
     prepare_datatype,
     partialclass,
+    get_list_options_in_prompt,
 )
-from blendsql._configure import MAX_OPTIONS_IN_PROMPT_KEY, DEFAULT_MAX_OPTIONS_IN_PROMPT
+from blendsql._configure import MAP_BATCH_TOKEN_BUDGET_KEY
 from blendsql._constants import DataType
 from .examples import AnnotatedMapExample, MapExample
 
@@ -37,6 +49,91 @@ OPTIONS_INSTRUCTION = "Your responses MUST select from one of the following valu
 DEFAULT_MAP_BATCH_SIZE = 5
 
 
+def get_value_batches(
+    values: List[str],
+    batch_size: int,
+    token_budget: Optional[int] = None,
+    prefix_tokens: int = 0,
+    tokenizer: Any = None,
+) -> List[List[str]]:
+    """Splits `values` into the batches passed to the model in a single request.
+
+    Without a `token_budget`, each batch holds `batch_size` values.
+    Otherwise, values are greedily packed into a batch until the prompt
+    (`prefix_tokens`, plus one line per value) would exceed `token_budget`.
+    This way, short values share a request, while long values get a request to themselves.
+    Each batch holds at least one value, even if that value alone exceeds the budget.
+    """
+    if token_budget is None:
+        return [values[i : i + batch_size] for i in range(0, len(values), batch_size)]
+    available_tokens = token_budget - prefix_tokens
+    batches: List[List[str]] = []
+    curr_batch, curr_tokens = [], 0
+    for value in values:
+        # +1 for the newline separating values
+        num_tokens = count_tokens(str(value), tokenizer) + 1
+        if len(curr_batch) > 0 and curr_tokens + num_tokens > available_tokens:
+            batches.append(curr_batch)
+            curr_batch, curr_tokens = [], 0
+        curr_batch.append(value)
+        curr_tokens += num_tokens
+    if len(curr_batch) > 0:
+        batches.append(curr_batch)
+    return batches
+
+
+def get_prefix_tokens(
+    current_example: MapExample,
+    few_shot_examples: List[AnnotatedMapExample],
+    list_options_in_prompt: bool,
+    tokenizer: Any = None,
+) -> int:
+    """Counts the tokens in everything a `MapProgram` prompt holds besides the values themselves."""
+    return count_tokens(
+        "\n".join(
+            [MAIN_INSTRUCTION]
+            + [
+                example.to_string()
+                + CONST.DEFAULT_ANS_SEP.join(example.mapping.values())
+                for example in few_shot_examples
+            ]
+            + [
+                current_example.to_string(
+                    include_values=False, list_options=list_options_in_prompt
+                )
+            ]
+        ),
+        tokenizer,
+    )
+
+
+def get_value_cache_namespace(
+    question: str,
+    options: Optional[Collection[str]],
+    output_type: Optional[DataType],
+    example_outputs: Optional[str],
+    few_shot_examples: List[AnnotatedMapExample],
+    list_options_in_prompt: bool,
+) -> Dict[str, Any]:
+    """Everything besides the value itself which determines an `LLMMap` output.
+    See `Model.fetch_cached_values()`.
+    """
+    return {
+        "program": MapProgram.__name__,
+        "question": question,
+        "options": sorted(options) if options is not None else None,
+        "output_type": output_type.name if output_type is not None else None,
+        "example_outputs": example_outputs,
+        "few_shot_examples": [
+            example.to_string() + CONST.DEFAULT_ANS_SEP.join(example.mapping.values())
+            for example in few_shot_examples
+        ],
+        "list_options_in_prompt": bool(
+            get_list_options_in_prompt(options, list_options_in_prompt)
+        ),
+    }
+
+
 class MapProgram(Program):
     def __call__(
         self,
@@ -47,21 +144,32 @@ class MapProgram(Program):
         batch_size: int,
         list_options_in_prompt: bool = True,
         max_tokens: Optional[int] = None,
+        batch_token_budget: Optional[int] = None,
         **kwargs,
     ) -> Tuple[str, str]:
         regex = None
         if current_example.output_type is not None:
             regex = current_example.output_type.regex
         options = current_example.options
-        if options is not None and list_options_in_prompt:
-            if len(options) > os.getenv(
-                MAX_OPTIONS_IN_PROMPT_KEY, DEFAULT_MAX_OPTIONS_IN_PROMPT
-            ):
-                logger.debug(
-                    Fore.YELLOW
-                    + f"Number of options ({len(options)}) is greater than the configured MAX_OPTIONS_IN_PROMPT.\nWill run inference without explicitly listing these options in the prompt text."
-                )
-                list_options_in_prompt = False
+        list_options_in_prompt = get_list_options_in_prompt(
+            options, list_options_in_prompt
+        )
+        prefix_tokens = 0
+        if batch_token_budget is not None:
+            prefix_tokens = get_prefix_tokens(
+                current_example,
+                few_shot_examples=few_shot_examples,
+                list_options_in_prompt=list_options_in_prompt,
+                tokenizer=model.tokenizer,
+            )
+        value_batches: List[List[str]] = get_value_batches(
+            values,
+            batch_size=batch_size,
+            token_budget=batch_token_budget,
+            prefix_tokens=prefix_tokens,
+            tokenizer=model.tokenizer,
+        )
+        model.log_batch_sizes([len(batch) for batch in value_batches])
         if isinstance(model, LocalModel):
             prompts = []
             if all(x is not None for x in [options, regex]):
@@ -69,6 +177,8 @@ class MapProgram(Program):
                     "MapIngredient exception!\nCan't have both `options` and `regex` argument passed."
                 )
 
+            import guidance
+
             lm: guidance.models.Model = model.model_obj
             with guidance.user():
                 lm += MAIN_INSTRUCTION
@@ -78,6 +188,8 @@ class MapProgram(Program):
                     for k, v in example.mapping.items():
                         lm += f"\n{k} -> {v}"
                     lm += "\n\n---"
+            # The instruction and few-shot examples are shared by all batches
+            model.pin_prefix(lm)
 
             if options is not None:
                 gen_f = lambda: guidance.select(options=options)
@@ -96,8 +208,7 @@ class MapProgram(Program):
                 return lm
 
             mapped_values: List[str] = []
-            for i in range(0, len(values), batch_size):
-                curr_batch_values = values[i : i + batch_size]
+            for curr_batch_values in value_batches:
                 current_batch_example = copy.deepcopy(current_example)
                 current_batch_example.values = [str(i) for i in curr_batch_values]
                 with guidance.user():
@@ -114,11 +225,8 @@ class MapProgram(Program):
                 )
         else:
             messages_list: List[List[dict]] = []
-            batch_sizes: List[int] = []
-            for i in range(0, len(values), batch_size):
+            for curr_batch_values in value_batches:
                 messages = []
-                curr_batch_values = values[i : i + batch_size]
-                batch_sizes.append(len(curr_batch_values))
                 current_batch_example = copy.deepcopy(current_example)
                 current_batch_example.values = curr_batch_values
                 messages.append(user(MAIN_INSTRUCTION))
@@ -138,15 +246,17 @@ class MapProgram(Program):
                 )
                 messages_list.append(messages)
 
-            responses: List[str] = generate(
-                model, messages_list=messages_list, max_tokens=max_tokens or 1000
-            )
+            # Yield the request to `generate()`, so that it can also be awaited (see `Program.acall()`)
+            responses: List[str] = yield {
+                "messages_list": messages_list,
+                "max_tokens": max_tokens or 1000,
+            }
 
             # Post-process language model response
             mapped_values: List[str] = []
             total_missing_values = 0
             for idx, r in enumerate(responses):
-                expected_len = batch_sizes[idx]
+                expected_len = len(value_batches[idx])
                 predictions = r.split(CONST.DEFAULT_ANS_SEP)
                 while len(predictions) < expected_len:
                     total_missing_values += 1
@@ -177,6 +287,7 @@ class LLMMap(MapIngredient):
     )
     list_options_in_prompt: bool = attrib(default=True)
     batch_size: int = attrib(default=DEFAULT_MAP_BATCH_SIZE)
+    batch_token_budget: Optional[int] = attrib(default=None)
 
     @classmethod
     def from_args(
@@ -185,6 +296,7 @@ class LLMMap(MapIngredient):
         few_shot_examples: Optional[List[dict]] = None,
         list_options_in_prompt: bool = True,
         batch_size: Optional[int] = DEFAULT_MAP_BATCH_SIZE,
+        batch_token_budget: Optional[int] = None,
         k: Optional[int] = None,
     ):
         """Creates a partial class with predefined arguments.
@@ -195,6 +307,9 @@ class LLMMap(MapIngredient):
                If not specified, will use [default_examples.json](https://github.com/parkervg/blendsql/blob/main/blendsql/ingredients/builtin/map/default_examples.json) as default.
             list_options_in_prompt: Whether to list options in the prompt. Defaults to True.
             batch_size: The batch size for processing. Defaults to 5.
+            batch_token_budget: Optional maximum number of prompt tokens per request.
+               If specified, values are packed into batches by their token count, and `batch_size` is ignored.
+               Defaults to `blendsql.config.set_map_batch_token_budget()`, if set.
             k: Determines number of few-shot examples to use for each ingredient call.
                Default is None, which will use all few-shot examples on all calls.
                If specified, will initialize a haystack-based embedding retriever to filter examples.
@@ -255,6 +370,193 @@ class LLMMap(MapIngredient):
             few_shot_retriever=few_shot_retriever,
             list_options_in_prompt=list_options_in_prompt,
             batch_size=batch_size,
+            batch_token_budget=batch_token_budget,
+        )
+
+    @staticmethod
+    def _prepare_inputs(
+        values: List[str],
+        options: Optional[Collection[str]],
+        value_limit: Optional[int],
+        output_type: Optional[Union[DataType, str]],
+        batch_token_budget: Optional[int],
+    ) -> Tuple[List[str], DataType, Optional[int]]:
+        if value_limit is not None:
+            values = values[:value_limit]
+        if batch_token_budget is None and os.getenv(MAP_BATCH_TOKEN_BUDGET_KEY):
+            batch_token_budget = int(os.getenv(MAP_BATCH_TOKEN_BUDGET_KEY))
+        values = [value if not pd.isna(value) else "-" for value in values]
+        output_type: DataType = prepare_datatype(
+            output_type=output_type, options=options, modifier=None
+        )
+        return values, output_type, batch_token_budget
+
+    @staticmethod
+    def _retrieve_few_shot_examples(
+        question: str,
+        values: List[str],
+        few_shot_retriever: Optional[Callable[[str], List[AnnotatedMapExample]]],
+        options: Optional[Collection[str]],
+        example_outputs: Optional[str],
+        output_type: Optional[DataType],
+        table_name: Optional[str],
+        column_name: Optional[str],
+    ) -> Tuple[MapExample, List[AnnotatedMapExample]]:
+        """Builds the example we're answering, and retrieves the few-shot examples for it.
+        Retrieval happens before checking the value cache, since the retrieved examples
+        are part of the value cache namespace.
+        """
+        if few_shot_retriever is None:
+            few_shot_retriever = lambda *_: DEFAULT_MAP_FEW_SHOT
+        current_example = MapExample(
+            **{
+                "question": question,
+                "column_name": column_name,
+                "table_name": table_name,
+                "output_type": output_type,
+                "example_outputs": example_outputs,
+                "options": options,
+                # Random subset of values for few-shot example retrieval
+                # these will get replaced during batching later
+                "values": list(dict.fromkeys(values))[:10],
+            }
+        )
+        return current_example, few_shot_retriever(current_example.to_string())
+
+    def merge_key(
+        self,
+        question: str,
+        values: List[str],
+        model: Optional[Model] = None,
+        few_shot_retriever: Callable[[str], List[AnnotatedMapExample]] = None,
+        options: Collection[str] = None,
+        list_options_in_prompt: bool = None,
+        value_limit: Union[int, None] = None,
+        example_outputs: Optional[str] = None,
+        output_type: Optional[Union[DataType, str]] = None,
+        **kwargs,
+    ) -> Optional[Hashable]:
+        """Calls on the same column with the same value cache namespace (see `get_value_cache_namespace()`)
+        can be merged. The merged outputs reach each call through `Model.fetch_cached_values()`.
+
+        If `few_shot_retriever` picks examples based on the values, the merged call may retrieve
+        different examples than the calls it merges. Their outputs then land in a different namespace,
+        and each call maps its own values as if it were never merged.
+        """
+        if model is None or value_limit is not None:
+            return None
+        table_name, column_name = self.unpack_default_kwargs(**kwargs)
+        values, output_type, _ = self._prepare_inputs(
+            values=values,
+            options=options,
+            value_limit=value_limit,
+            output_type=output_type,
+            batch_token_budget=None,
+        )
+        _, few_shot_examples = self._retrieve_few_shot_examples(
+            question=question,
+            values=values,
+            few_shot_retriever=few_shot_retriever,
+            options=options,
+            example_outputs=example_outputs,
+            output_type=output_type,
+            table_name=table_name,
+            column_name=column_name,
+        )
+        namespace = get_value_cache_namespace(
+            question=question,
+            options=options,
+            output_type=output_type,
+            example_outputs=example_outputs,
+            few_shot_examples=few_shot_examples,
+            list_options_in_prompt=list_options_in_prompt,
+        )
+        return (
+            self.name,
+            id(model),
+            json.dumps(namespace, sort_keys=True, default=str),
+            table_name,
+            column_name,
+        )
+
+    def estimate(
+        self,
+        question: str,
+        values: List[str],
+        model: Optional[Model] = None,
+        few_shot_retriever: Callable[[str], List[AnnotatedMapExample]] = None,
+        options: Collection[str] = None,
+        list_options_in_prompt: bool = True,
+        value_limit: Union[int, None] = None,
+        example_outputs: Optional[str] = None,
+        output_type: Optional[Union[DataType, str]] = None,
+        batch_size: int = DEFAULT_MAP_BATCH_SIZE,
+        batch_token_budget: Optional[int] = None,
+        **kwargs,
+    ) -> IngredientEstimate:
+        """Predicts the batches `run()` would send to the model.
+        Values found in the model's value cache aren't sent, so they don't count towards any batch.
+        Without a model, we can't check the cache, and count tokens with a heuristic.
+        """
+        table_name, column_name = self.unpack_default_kwargs(**kwargs)
+        values, output_type, batch_token_budget = self._prepare_inputs(
+            values=values,
+            options=options,
+            value_limit=value_limit,
+            output_type=output_type,
+            batch_token_budget=batch_token_budget,
+        )
+        current_example, few_shot_examples = self._retrieve_few_shot_examples(
+            question=question,
+            values=values,
+            few_shot_retriever=few_shot_retriever,
+            options=options,
+            example_outputs=example_outputs,
+            output_type=output_type,
+            table_name=table_name,
+            column_name=column_name,
+        )
+        cached_values: Dict[str, Any] = {}
+        if model is not None:
+            cached_values = model.fetch_cached_values(
+                namespace=get_value_cache_namespace(
+                    question=question,
+                    options=options,
+                    output_type=output_type,
+                    example_outputs=example_outputs,
+                    few_shot_examples=few_shot_examples,
+                    list_options_in_prompt=list_options_in_prompt,
+                ),
+                values=values,
+            )
+        num_cached_values = len(cached_values) if model is not None else None
+        values = list(dict.fromkeys(v for v in values if v not in cached_values))
+        if len(values) == 0:
+            return IngredientEstimate(
+                num_prompts=0, prompt_tokens=0, num_cached_values=num_cached_values
+            )
+        tokenizer = model.tokenizer if model is not None else None
+        prefix_tokens = get_prefix_tokens(
+            current_example,
+            few_shot_examples=few_shot_examples,
+            list_options_in_prompt=get_list_options_in_prompt(
+                options, list_options_in_prompt
+            ),
+            tokenizer=tokenizer,
+        )
+        value_batches = get_value_batches(
+            values,
+            batch_size=batch_size,
+            token_budget=batch_token_budget,
+            prefix_tokens=prefix_tokens,
+            tokenizer=tokenizer,
+        )
+        return IngredientEstimate(
+            num_prompts=len(value_batches),
+            # +1 for the newline separating values
+            prompt_tokens=len(value_batches) * prefix_tokens
+            + sum(count_tokens(str(value), tokenizer) + 1 for value in values),
+            num_cached_values=num_cached_values,
         )
 
     def run(
@@ -269,6 +571,7 @@ class LLMMap(MapIngredient):
         example_outputs: Optional[str] = None,
         output_type: Optional[Union[DataType, str]] = None,
         batch_size: int = DEFAULT_MAP_BATCH_SIZE,
+        batch_token_budget: Optional[int] = None,
         **kwargs,
     ) -> Iterable[Any]:
         """For each value in a given column, calls a Model and retrieves the output.
@@ -281,47 +584,109 @@ class LLMMap(MapIngredient):
             example_outputs: This gives the Model an example of the output we expect.
             output_type: In the absence of example_outputs, give the Model some signal as to what we expect as output.
             regex: Optional regex to constrain answer generation.
+            batch_size: Number of values to pass to the Model in a single request.
+            batch_token_budget: If specified, pack values into requests of at most this many prompt tokens instead.
 
         Returns:
             Iterable[Any] containing the output of the Model for each value.
         """
+        return run_steps(
+            self._predict_steps(
+                model=model,
+                question=question,
+                values=values,
+                few_shot_retriever=few_shot_retriever,
+                options=options,
+                list_options_in_prompt=list_options_in_prompt,
+                value_limit=value_limit,
+                example_outputs=example_outputs,
+                output_type=output_type,
+                batch_size=batch_size,
+                batch_token_budget=batch_token_budget,
+                **kwargs,
+            ),
+            lambda request: model.predict(program=MapProgram, **request),
+        )
+
+    async def arun(self, model: Model, *args, **kwargs) -> Iterable[Any]:
+        """Awaitable version of `run()`, which awaits `Model.apredict()` on the running event loop.
+        Few-shot retrieval and the value cache are accessed from a worker thread.
+        """
+        return await arun_steps(
+            self._predict_steps(model, *args, **kwargs),
+            lambda request: model.apredict(program=MapProgram, **request),
+            offload=True,
+        )
+
+    def _predict_steps(
+        self,
+        model: Model,
+        question: str,
+        values: List[str],
+        few_shot_retriever: Callable[[str], List[AnnotatedMapExample]] = None,
+        options: Collection[str] = None,
+        list_options_in_prompt: bool = None,
+        value_limit: Union[int, None] = None,
+        example_outputs: Optional[str] = None,
+        output_type: Optional[Union[DataType, str]] = None,
+        batch_size: int = DEFAULT_MAP_BATCH_SIZE,
+        batch_token_budget: Optional[int] = None,
+        **kwargs,
+    ):
+        """The logic of `run()`, yielding the kwargs to call `Model.predict()` with."""
         if model is None:
             raise IngredientException(
                 "LLMMap requires a `Model` object, but nothing was passed!\nMost likely you forgot to set the `default_model` argument in `blend()`"
             )
-        if few_shot_retriever is None:
-            few_shot_retriever = lambda *_: DEFAULT_MAP_FEW_SHOT
         # Unpack default kwargs
         table_name, column_name = self.unpack_default_kwargs(**kwargs)
-        if value_limit is not None:
-            values = values[:value_limit]
-        values = [value if not pd.isna(value) else "-" for value in values]
-        output_type: DataType = prepare_datatype(
-            output_type=output_type, options=options, modifier=None
+        values, output_type, batch_token_budget = self._prepare_inputs(
+            values=values,
+            options=options,
+            value_limit=value_limit,
+            output_type=output_type,
+            batch_token_budget=batch_token_budget,
         )
-        current_example = MapExample(
-            **{
-                "question": question,
-                "column_name": column_name,
-                "table_name": table_name,
-                "output_type": output_type,
-                "example_outputs": example_outputs,
-                "options": options,
-                # Random subset of values for few-shot example retrieval
-                # these will get replaced during batching later
-                "values": values[:10],
-            }
+        current_example, few_shot_examples = self._retrieve_few_shot_examples(
+            question=question,
+            values=values,
+            few_shot_retriever=few_shot_retriever,
+            options=options,
+            example_outputs=example_outputs,
+            output_type=output_type,
+            table_name=table_name,
+            column_name=column_name,
+        )
+        # Check which values we've already mapped in previous queries
+        # Unlike the `Model.predict()` cache, this hits on partially-overlapping sets of values
+        value_cache_namespace = get_value_cache_namespace(
+            question=question,
+            options=options,
+            output_type=output_type,
+            example_outputs=example_outputs,
+            few_shot_examples=few_shot_examples,
+            list_options_in_prompt=list_options_in_prompt,
         )
-        few_shot_examples: List[AnnotatedMapExample] = few_shot_retriever(
-            current_example.to_string()
+        cached_values: Dict[str, Any] = model.fetch_cached_values(
+            namespace=value_cache_namespace, values=values
         )
-        mapped_values: List[str] = model.predict(
-            program=MapProgram,
+        if len(cached_values) > 0:
+            logger.debug(
+                Fore.MAGENTA
+                + f"Using cached LLMMap outputs for {len(cached_values)} out of {len(set(values))} values..."
+                + Fore.RESET
+            )
+        all_values = values
+        values = list(dict.fromkeys(v for v in values if v not in cached_values))
+        if len(values) == 0:
+            return [cached_values[value] for value in all_values]
+        mapped_values: List[str] = yield dict(
             current_example=current_example,
             values=values,
             question=question,
             few_shot_examples=few_shot_examples,
             batch_size=batch_size,
+            batch_token_budget=batch_token_budget,
             list_options_in_prompt=list_options_in_prompt,
             example_outputs=example_outputs,
             output_type=output_type,
@@ -334,4 +699,11 @@ class LLMMap(MapIngredient):
             + f"Finished LLMMap with values:\n{json.dumps(dict(zip(values[:10], mapped_values[:10])), indent=4)}"
             + Fore.RESET
         )
-        return mapped_values
+        newly_mapped_values = dict(zip(values, mapped_values))
+        model.cache_values(namespace=value_cache_namespace, mapping=newly_mapped_values)
+        return [
+            cached_values[value]
+            if value in cached_values
+            else newly_mapped_values[value]
+            for value in all_values
+        ]
@@ -1,4 +1,3 @@
-import os
 import copy
 import re
 from ast import literal_eval
@@ -9,13 +8,13 @@ import pandas as pd
 import json
 from colorama import Fore
 from attr import attrs, attrib
-import guidance
 
-from blendsql._logger import logger
 from blendsql.models import Model, LocalModel
-from blendsql.ingredients.generate import generate, user, assistant
+from blendsql.models._rate_limit import count_tokens
+from blendsql.ingredients.generate import user, assistant
 from blendsql._program import Program
-from blendsql.ingredients.ingredient import QAIngredient
+from blendsql._steps import run_steps, arun_steps
+from blendsql.ingredients.ingredient import QAIngredient, IngredientEstimate
 from blendsql.db.utils import single_quote_escape
 from blendsql._exceptions import IngredientException
 from blendsql.ingredients.utils import (
@@ -23,8 +22,8 @@ from blendsql.ingredients.utils import (
     cast_responses_to_datatypes,
     prepare_datatype,
     partialclass,
+    get_list_options_in_prompt,
 )
-from blendsql._configure import MAX_OPTIONS_IN_PROMPT_KEY, DEFAULT_MAX_OPTIONS_IN_PROMPT
 from blendsql._constants import ModifierType, DataType
 from .examples import QAExample, AnnotatedQAExample
 
@@ -41,7 +40,9 @@ DEFAULT_QA_FEW_SHOT: List[AnnotatedQAExample] = [
 
 def get_modifier_wrapper(
     modifier: ModifierType,
-) -> Callable[[guidance.models.Model], guidance.models.Model]:
+) -> Callable[["guidance.models.Model"], "guidance.models.Model"]:
+    import guidance
+
     modifier_wrapper = lambda x: x
     if modifier is not None:
         if modifier == "*":
@@ -61,26 +62,31 @@ def get_modifier_wrapper(
     return modifier_wrapper
 
 
-@guidance(stateless=True)
 def gen_list(
-    lm, force_quotes: bool, modifier=None, options: List[str] = None, regex: str = None
+    force_quotes: bool, modifier=None, options: List[str] = None, regex: str = None
 ):
-    if options:
-        single_item = guidance.select(options, list_append=True, name="response")
-    else:
-        single_item = guidance.gen(
-            max_tokens=100,
-            # If not regex is passed, default to all characters except these specific to list-syntax
-            regex=regex or "[^],']+",
-            list_append=True,
-            name="response",
-        )
-    quote = "'"
-    if not force_quotes:
-        quote = guidance.optional(quote)
-    single_item = quote + single_item + quote
-    single_item += guidance.optional(", ")
-    return lm + "[" + get_modifier_wrapper(modifier)(single_item) + "]"
+    import guidance
+
+    @guidance(stateless=True, dedent=False)
+    def _gen_list(lm):
+        if options:
+            single_item = guidance.select(options, list_append=True, name="response")
+        else:
+            single_item = guidance.gen(
+                max_tokens=100,
+                # If not regex is passed, default to all characters except these specific to list-syntax
+                regex=regex or "[^],']+",
+                list_append=True,
+                name="response",
+            )
+        quote = "'"
+        if not force_quotes:
+            quote = guidance.optional(quote)
+        single_item = quote + single_item + quote
+        single_item += guidance.optional(", ")
+        return lm + "[" + get_modifier_wrapper(modifier)(single_item) + "]"
+
+    return _gen_list()
 
 
 def get_option_aliases(options: Optional[List[str]], is_list_output: bool):
@@ -120,6 +126,8 @@ class QAProgram(Program):
         **kwargs,
     ) -> Tuple[str, str]:
         if isinstance(model, LocalModel):
+            import guidance
+
             lm: guidance.models.Model = model.model_obj
         is_list_output = "list" in current_example.output_type.name.lower()
         regex = current_example.output_type.regex
@@ -128,15 +136,9 @@ class QAProgram(Program):
         options_with_aliases, options_alias_to_original = get_option_aliases(
             options, is_list_output=is_list_output
         )
-        if options is not None and list_options_in_prompt:
-            if len(options) > os.getenv(
-                MAX_OPTIONS_IN_PROMPT_KEY, DEFAULT_MAX_OPTIONS_IN_PROMPT
-            ):
-                logger.debug(
-                    Fore.YELLOW
-                    + f"Number of options ({len(options)}) is greater than the configured MAX_OPTIONS_IN_PROMPT.\nWill run inference without explicitly listing these options in the prompt text."
-                )
-                list_options_in_prompt = False
+        list_options_in_prompt = get_list_options_in_prompt(
+            options, list_options_in_prompt
+        )
         if isinstance(model, LocalModel):
             with guidance.user():
                 lm += MAIN_INSTRUCTION
@@ -149,6 +151,7 @@ class QAProgram(Program):
                     lm += example.to_string(context_formatter)
                 with guidance.assistant():
                     lm += example.answer
+            model.pin_prefix(lm)
             with guidance.user():
                 lm += current_example.to_string(
                     context_formatter, list_options=list_options_in_prompt
@@ -196,11 +199,12 @@ class QAProgram(Program):
                     )
                 )
             )
-            response = generate(
-                model,
-                messages_list=[messages],
-                max_tokens=max_tokens,
-            )[0].strip()
+            # Yield the request to `generate()`, so that it can also be awaited (see `Program.acall()`)
+            responses: List[str] = yield {
+                "messages_list": [messages],
+                "max_tokens": max_tokens,
+            }
+            response = responses[0].strip()
             prompt = "".join([i["content"] for i in messages])
         if isinstance(response, str):
             # If we have specified a modifier, we try to parse it to a tuple
@@ -340,6 +344,91 @@ class LLMQA(QAIngredient):
             list_options_in_prompt=list_options_in_prompt,
         )
 
+    @staticmethod
+    def _prepare_examples(
+        question: str,
+        context_formatter: Callable[[pd.DataFrame], str],
+        few_shot_retriever: Optional[Callable[[str], List[AnnotatedQAExample]]],
+        options: Optional[Collection[str]],
+        modifier: ModifierType,
+        output_type: Optional[Union[DataType, str]],
+        context: Optional[pd.DataFrame],
+        value_limit: Optional[int],
+    ) -> Tuple[QAExample, List[AnnotatedQAExample]]:
+        if few_shot_retriever is None:
+            few_shot_retriever = lambda *_: DEFAULT_QA_FEW_SHOT
+        if context is not None:
+            if value_limit is not None:
+                context = context.iloc[:value_limit]
+        output_type: DataType = prepare_datatype(
+            output_type=output_type, options=options, modifier=modifier
+        )
+        current_example = QAExample(
+            **{
+                "question": question,
+                "context": context,
+                "options": options,
+                "output_type": output_type,
+            }
+        )
+        few_shot_examples: List[AnnotatedQAExample] = few_shot_retriever(
+            current_example.to_string(context_formatter)
+        )
+        return current_example, few_shot_examples
+
+    def estimate(
+        self,
+        question: str,
+        context_formatter: Callable[[pd.DataFrame], str],
+        model: Optional[Model] = None,
+        few_shot_retriever: Callable[[str], List[AnnotatedQAExample]] = None,
+        options: Optional[Collection[str]] = None,
+        list_options_in_prompt: bool = True,
+        modifier: ModifierType = None,
+        output_type: Optional[Union[DataType, str]] = None,
+        context: Optional[pd.DataFrame] = None,
+        value_limit: Optional[int] = None,
+        long_answer: bool = False,
+        **kwargs,
+    ) -> IngredientEstimate:
+        """Predicts the single request `run()` would send to the model.
+        Without a model, we count tokens with a heuristic.
+        """
+        current_example, few_shot_examples = self._prepare_examples(
+            question=question,
+            context_formatter=context_formatter,
+            few_shot_retriever=few_shot_retriever,
+            options=options,
+            modifier=modifier,
+            output_type=output_type,
+            context=context,
+            value_limit=value_limit,
+        )
+        prompt = "".join(
+            [
+                MAIN_INSTRUCTION,
+                LONG_ANSWER_INSTRUCTION if long_answer else SHORT_ANSWER_INSTRUCTION,
+            ]
+            + [
+                example.to_string(context_formatter) + str(example.answer)
+                for example in few_shot_examples
+            ]
+            + [
+                current_example.to_string(
+                    context_formatter,
+                    list_options=get_list_options_in_prompt(
+                        options, list_options_in_prompt
+                    ),
+                )
+            ]
+        )
+        return IngredientEstimate(
+            num_prompts=1,
+            prompt_tokens=count_tokens(
+                prompt, model.tokenizer if model is not None else None
+            ),
+        )
+
     def run(
         self,
         model: Model,
@@ -376,31 +465,65 @@ class LLMQA(QAIngredient):
             Union[str, int, float, tuple] containing the response from the model.
                 Response will only be a tuple if `modifier` is not None.
         """
+        return run_steps(
+            self._predict_steps(
+                model=model,
+                question=question,
+                context_formatter=context_formatter,
+                few_shot_retriever=few_shot_retriever,
+                options=options,
+                list_options_in_prompt=list_options_in_prompt,
+                modifier=modifier,
+                output_type=output_type,
+                context=context,
+                value_limit=value_limit,
+                long_answer=long_answer,
+                **kwargs,
+            ),
+            lambda request: model.predict(program=QAProgram, **request),
+        )
+
+    async def arun(self, model: Model, *args, **kwargs) -> Union[str, int, float]:
+        """Awaitable version of `run()`, which awaits `Model.apredict()` on the running event loop.
+        Few-shot retrieval and serializing the context happen on a worker thread.
+        """
+        return await arun_steps(
+            self._predict_steps(model, *args, **kwargs),
+            lambda request: model.apredict(program=QAProgram, **request),
+            offload=True,
+        )
+
+    def _predict_steps(
+        self,
+        model: Model,
+        question: str,
+        context_formatter: Callable[[pd.DataFrame], str],
+        few_shot_retriever: Callable[[str], List[AnnotatedQAExample]] = None,
+        options: Optional[Collection[str]] = None,
+        list_options_in_prompt: bool = None,
+        modifier: ModifierType = None,
+        output_type: Optional[Union[DataType, str]] = None,
+        context: Optional[pd.DataFrame] = None,
+        value_limit: Optional[int] = None,
+        long_answer: bool = False,
+        **kwargs,
+    ):
+        """The logic of `run()`, yielding the kwargs to call `Model.predict()` with."""
         if model is None:
             raise IngredientException(
                 "LLMQA requires a `Model` object, but nothing was passed!\nMost likely you forgot to set the `default_model` argument in `blend()`"
             )
-        if few_shot_retriever is None:
-            few_shot_retriever = lambda *_: DEFAULT_QA_FEW_SHOT
-        if context is not None:
-            if value_limit is not None:
-                context = context.iloc[:value_limit]
-        output_type: DataType = prepare_datatype(
-            output_type=output_type, options=options, modifier=modifier
-        )
-        current_example = QAExample(
-            **{
-                "question": question,
-                "context": context,
-                "options": options,
-                "output_type": output_type,
-            }
-        )
-        few_shot_examples: List[AnnotatedQAExample] = few_shot_retriever(
-            current_example.to_string(context_formatter)
+        current_example, few_shot_examples = self._prepare_examples(
+            question=question,
+            context_formatter=context_formatter,
+            few_shot_retriever=few_shot_retriever,
+            options=options,
+            modifier=modifier,
+            output_type=output_type,
+            context=context,
+            value_limit=value_limit,
         )
-        result = model.predict(
-            program=QAProgram,
+        result = yield dict(
             current_example=current_example,
             context_formatter=context_formatter,
             few_shot_examples=few_shot_examples,
@@ -1,6 +1,5 @@
 from typing import Dict, Union, Optional, Tuple
 import pandas as pd
-import guidance
 
 from blendsql.models import Model, LocalModel
 from blendsql._program import Program
@@ -18,6 +17,8 @@ class ValidateProgram(Program):
         table_title: Optional[str] = None,
         **kwargs,
     ) -> Tuple[str, str]:
+        import guidance
+
         m: guidance.models.Model = model.model_obj
         serialized_db = context.to_string() if context is not None else ""
         m += "You are a database expert in charge of validating a claim given a context. Given a claim and associated database context, you will respond 'true' if the claim is factual given the context, and 'false' if not."
@@ -1,14 +1,13 @@
-import os
-from functools import singledispatch
+from functools import singledispatch, partial
 import asyncio
-from asyncio import Semaphore
+import threading
 import logging
 from colorama import Fore
 from typing import Optional, List
 
-from blendsql._configure import ASYNC_LIMIT_KEY, DEFAULT_ASYNC_LIMIT
 from .._logger import logger
 from ..models import Model, OllamaLLM, OpenaiLLM, AnthropicLLM, GeminiLLM
+from ..models._rate_limit import estimate_tokens
 
 
 system = lambda x: {"role": "system", "content": x}
@@ -16,11 +15,65 @@ assistant = lambda x: {"role": "assistant", "content": x}
 user = lambda x: {"role": "user", "content": x}
 
 
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Returns the event loop shared by all model calls in this process.
+    It runs forever on a daemon thread, so that async clients (and their HTTP connection pools)
+    stay bound to a single loop, no matter which thread a `blend()` call comes from.
+    """
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(
+                target=_loop.run_forever, name="blendsql-event-loop", daemon=True
+            )
+            _loop_thread.start()
+    return _loop
+
+
+def run_until_complete(coro):
+    """Runs a coroutine to completion from synchronous code, on the shared event loop.
+    Unlike `asyncio.get_event_loop().run_until_complete()`, this is safe to call
+    when the current thread already runs an event loop (e.g. in Jupyter, or FastAPI).
+    """
+    loop = get_event_loop()
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError(
+            "`run_until_complete()` can't be called from the shared event loop itself!"
+        )
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+async def await_on_event_loop(coro):
+    """Awaits a coroutine on the shared event loop, from any other running loop
+    (e.g. that of an application calling `blend_async()`). The requests still run on the shared loop,
+    which async clients are bound to, but the calling loop is free to run other tasks in the meantime.
+    """
+    loop = get_event_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
 @singledispatch
 def generate(model: Model, *args, **kwargs) -> str:
     pass
 
 
+@singledispatch
+async def agenerate(model: Model, *args, **kwargs) -> List[str]:
+    """Awaitable version of `generate()`, used by `Model.apredict()`.
+    Models with an async client await their requests directly. For all others,
+    `generate()` runs on a worker thread.
+    """
+    return await asyncio.to_thread(generate, model, *args, **kwargs)
+
+
 async def run_openai_async_completions(
     model: OpenaiLLM,
     messages_list: List[List[dict]],
@@ -28,19 +81,21 @@ async def run_openai_async_completions(
     stop_at: Optional[List[str]] = None,
     **kwargs,
 ):
-    sem = Semaphore(int(os.getenv(ASYNC_LIMIT_KEY, DEFAULT_ASYNC_LIMIT)))
     client: "AsyncOpenAI" = model.model_obj
-    async with sem:
-        responses = [
-            client.chat.completions.create(
+    responses = [
+        model.scheduler.submit(
+            partial(
+                client.chat.completions.create,
                 model=model.model_name_or_path,
                 messages=messages,
                 max_tokens=max_tokens,
                 stop=stop_at,
                 **model.load_model_kwargs,
-            )
-            for messages in messages_list
-        ]
+            ),
+            num_tokens=estimate_tokens(messages, model.tokenizer, max_tokens),
+        )
+        for messages in messages_list
+    ]
     return [m.choices[0].message.content for m in await asyncio.gather(*responses)]
 
 
@@ -51,7 +106,12 @@ def generate_openai(model: OpenaiLLM, *args, **kwargs) -> List[str]:
 
     https://gist.github.com/neubig/80de662fb3e225c18172ec218be4917a
     """
-    return asyncio.get_event_loop().run_until_complete(
+    return run_until_complete(run_openai_async_completions(model, *args, **kwargs))
+
+
+@agenerate.register(OpenaiLLM)
+async def agenerate_openai(model: OpenaiLLM, *args, **kwargs) -> List[str]:
+    return await await_on_event_loop(
         run_openai_async_completions(model, *args, **kwargs)
     )
 
@@ -63,63 +123,57 @@ async def run_anthropic_async_completions(
     stop_at: Optional[List[str]] = None,
     **kwargs,
 ):
-    sem = Semaphore(int(os.getenv(ASYNC_LIMIT_KEY, DEFAULT_ASYNC_LIMIT)))
     client: "AsyncAnthropic" = model.model_obj
-    async with sem:
-        responses = [
-            client.messages.create(
+    responses = [
+        model.scheduler.submit(
+            partial(
+                client.messages.create,
                 model=model.model_name_or_path,
                 messages=messages,
                 max_tokens=max_tokens or 4000,
                 # stop_sequences=stop_at
                 **model.load_model_kwargs,
-            )
-            for messages in messages_list
-        ]
+            ),
+            num_tokens=estimate_tokens(messages, model.tokenizer, max_tokens or 4000),
+        )
+        for messages in messages_list
+    ]
     return [m.content[0].text for m in await asyncio.gather(*responses)]
 
+
 @generate.register(GeminiLLM)
 def generate_gemini(model: GeminiLLM, messages_list: List[List[dict]], **kwargs) -> str:
     """Helper function to work with Gemini models."""
-    responses = []
-    for messages in messages_list:
-        response = asyncio.get_event_loop().run_until_complete(
-            run_gemini_async_completions(model, messages, **kwargs)
-        )
-        responses.append(response)
-    return responses
+    return run_until_complete(
+        run_gemini_async_completions(model, messages_list, **kwargs)
+    )
+
+
+@agenerate.register(GeminiLLM)
+async def agenerate_gemini(
+    model: GeminiLLM, messages_list: List[List[dict]], **kwargs
+) -> List[str]:
+    return await await_on_event_loop(
+        run_gemini_async_completions(model, messages_list, **kwargs)
+    )
+
 
 async def run_gemini_async_completions(
-    model: GeminiLLM,
-    messages_list: List[List[dict]],
-    max_tokens: Optional[int] = None,
-    stop_at: Optional[List[str]] = None,
-    **kwargs,
-):
-    sem = Semaphore(int(os.getenv(ASYNC_LIMIT_KEY, DEFAULT_ASYNC_LIMIT)))
-    client: "AsyncGemini" = model.model_obj
-    async with sem:
-        responses = [
-            client.messages.create(
-                model=model.model_name_or_path,
-                messages=messages,
-                max_tokens=max_tokens or 4000,
-                # stop_sequences=stop_at
-                **model.load_model_kwargs,
+    model: GeminiLLM, messages_list: List[List[dict]], **kwargs
+) -> List[str]:
+    client = model.model_obj
+    responses = []
+    for messages in messages_list:
+        # Convert messages to Gemini format
+        prompt = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
+        responses.append(
+            model.scheduler.submit(
+                partial(client.generate_content_async, prompt),
+                num_tokens=estimate_tokens(messages, model.tokenizer),
             )
-            for messages in messages_list
-        ]
-    return [m.content[0].text for m in await asyncio.gather(*responses)]
+        )
+    return [response.text for response in await asyncio.gather(*responses)]
 
-async def run_gemini_async_completions(model, messages, **kwargs):
-    client = model.model_obj
-    
-    # Convert messages to Gemini format
-    prompt = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
-    
-    # Generate content
-    response = await client.generate_content_async(prompt)
-    return response.text
 
 @generate.register(AnthropicLLM)
 def generate_anthropic(
@@ -127,16 +181,19 @@ def generate_anthropic(
     *args,
     **kwargs,
 ) -> List[str]:
-    return asyncio.get_event_loop().run_until_complete(
+    return run_until_complete(run_anthropic_async_completions(model, *args, **kwargs))
+
+
+@agenerate.register(AnthropicLLM)
+async def agenerate_anthropic(model: AnthropicLLM, *args, **kwargs) -> List[str]:
+    return await await_on_event_loop(
         run_anthropic_async_completions(model, *args, **kwargs)
     )
 
 
-@generate.register(OllamaLLM)
-def generate_ollama(model: OllamaLLM, messages_list: List[List[dict]], **kwargs) -> str:
-    """Helper function to work with Ollama models,
-    since they're not recognized natively in the guidance ecosystem.
-    """
+async def run_ollama_async_completions(
+    model: OllamaLLM, messages_list: List[List[dict]], **kwargs
+) -> List[str]:
     # if options:
     #     raise NotImplementedError(
     #         "Cannot use choice generation with an Ollama model"
@@ -153,17 +210,20 @@ def generate_ollama(model: OllamaLLM, messages_list: List[List[dict]], **kwargs)
     options = Options(**kwargs)
     if options.get("temperature") is None:
         options["temperature"] = 0.0
-    stream = logger.level <= logging.DEBUG
-    responses = []
-    for messages in messages_list:
-        response = model.model_obj(
+    # Streaming output from concurrent requests would get interleaved,
+    #   so we only stream when there's a single prompt in the batch
+    stream = logger.level <= logging.DEBUG and len(messages_list) == 1
+
+    async def chat(messages: List[dict]) -> str:
+        response = await model.async_client.chat(
+            model=model.model_name_or_path,
             messages=messages,
             options=options,
             stream=stream,
         )  # type: ignore
         if stream:
             chunked_res = []
-            for chunk in response:
+            async for chunk in response:
                 chunked_res.append(chunk["message"]["content"])
                 print(
                     Fore.CYAN + chunk["message"]["content"] + Fore.RESET,
@@ -171,7 +231,36 @@ def generate_ollama(model: OllamaLLM, messages_list: List[List[dict]], **kwargs)
                     flush=True,
                 )
             print("\n")
-            responses.append("".join(chunked_res))
-            continue
-        responses.append(response["message"]["content"])
-    return responses
+            return "".join(chunked_res)
+        return response["message"]["content"]
+
+    return await asyncio.gather(
+        *[
+            model.scheduler.submit(
+                partial(chat, messages),
+                num_tokens=estimate_tokens(messages, model.tokenizer),
+            )
+            for messages in messages_list
+        ]
+    )
+
+
+@generate.register(OllamaLLM)
+def generate_ollama(
+    model: OllamaLLM, messages_list: List[List[dict]], **kwargs
+) -> List[str]:
+    """Helper function to work with Ollama models,
+    since they're not recognized natively in the guidance ecosystem.
+    """
+    return run_until_complete(
+        run_ollama_async_completions(model, messages_list, **kwargs)
+    )
+
+
+@agenerate.register(OllamaLLM)
+async def agenerate_ollama(
+    model: OllamaLLM, messages_list: List[List[dict]], **kwargs
+) -> List[str]:
+    return await await_on_event_loop(
+        run_ollama_async_completions(model, messages_list, **kwargs)
+    )
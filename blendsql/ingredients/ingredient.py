@@ -3,22 +3,35 @@ from abc import abstractmethod
 import pandas as pd
 from sqlglot import exp
 import json
-from skrub import Joiner
-from typing import Any, Union, Dict, Tuple, Callable, Set, Optional, Type, List
+from typing import (
+    Any,
+    Union,
+    Dict,
+    Tuple,
+    Callable,
+    Set,
+    Optional,
+    Type,
+    List,
+    Hashable,
+)
 from collections.abc import Collection, Iterable
+import asyncio
+import threading
 import uuid
 from colorama import Fore
 from typeguard import check_type
 
 from .._exceptions import IngredientException
 from .._logger import logger
+from .._steps import run_steps, arun_steps
 from .. import utils
 from .._constants import (
     IngredientKwarg,
     IngredientType,
 )
 from ..db import Database
-from ..db.utils import select_all_from_table_query, format_tuple
+from ..db.utils import format_tuple
 from .utils import unpack_options
 from .few_shot import Example
 from .utils import partialclass
@@ -31,6 +44,34 @@ def unpack_default_kwargs(**kwargs):
     )
 
 
+@attrs
+class IngredientEstimate:
+    """What a single ingredient call would cost, as predicted by `Ingredient.estimate()`.
+    `None` means the ingredient can't tell.
+    """
+
+    # Requests sent to the model, excluding those answered by the cache
+    num_prompts: Optional[int] = attrib(default=None)
+    # Prompt tokens across those requests
+    prompt_tokens: Optional[int] = attrib(default=None)
+    # Values whose output would be fetched from the model's cache
+    num_cached_values: Optional[int] = attrib(default=None)
+
+
+# Guards `Ingredient.num_values_passed`, which is updated from scheduler worker threads
+_NUM_VALUES_PASSED_LOCK = threading.Lock()
+
+
+def _overrides_sync_method(cls: type, name: str, async_name: str) -> bool:
+    """Returns True if `cls` overrides the method `name` below the class defining its
+    awaitable version `async_name`. E.g. a subclass of `LLMMap` with its own `run()`,
+    which `LLMMap.arun()` knows nothing about.
+    """
+    owner = next(c for c in cls.__mro__ if name in c.__dict__)
+    async_owner = next(c for c in cls.__mro__ if async_name in c.__dict__)
+    return owner is not async_owner and issubclass(owner, async_owner)
+
+
 @attrs
 class Ingredient:
     name: str = attrib()
@@ -60,9 +101,58 @@ class Ingredient:
     def __call__(self, *args, **kwargs) -> Any:
         ...
 
+    def add_values_passed(self, n: int) -> None:
+        """Atomically increments `num_values_passed`, since the same ingredient
+        may be called from several scheduler threads at once (see `set_ingredient_concurrency()`).
+        """
+        with _NUM_VALUES_PASSED_LOCK:
+            self.num_values_passed += n
+
+    async def arun(self, *args, **kwargs) -> Any:
+        """Awaitable version of `run()`, used by `blend_async()`.
+        By default, `run()` is called on a worker thread. Ingredients which call a model
+        can override this to await `Model.apredict()` on the running event loop instead.
+        """
+        return await asyncio.to_thread(self.run, *args, **kwargs)
+
+    async def acall(self, *args, **kwargs) -> Any:
+        """Awaitable version of `__call__()`, used by `blend_async()`.
+        By default, `__call__()` is called on a worker thread.
+        """
+        return await asyncio.to_thread(self, *args, **kwargs)
+
     def _run(self, *args, **kwargs):
         return check_type(self.run(*args, **kwargs), self.allowed_output_types)
 
+    async def _arun(self, *args, **kwargs):
+        if _overrides_sync_method(type(self), "run", "arun"):
+            output = await asyncio.to_thread(self.run, *args, **kwargs)
+        else:
+            output = await self.arun(*args, **kwargs)
+        return check_type(output, self.allowed_output_types)
+
+    async def _acall(self, *args, **kwargs):
+        if _overrides_sync_method(type(self), "__call__", "acall"):
+            return await asyncio.to_thread(self, *args, **kwargs)
+        return await self.acall(*args, **kwargs)
+
+    def _run_request(self, request: Tuple[tuple, dict]):
+        """Fulfils a request for `_run()`, yielded as (args, kwargs) by `_call_steps()`."""
+        args, kwargs = request
+        return self._run(*args, **kwargs)
+
+    async def _arun_request(self, request: Tuple[tuple, dict]):
+        args, kwargs = request
+        return await self._arun(*args, **kwargs)
+
+    def estimate(self, *args, **kwargs) -> IngredientEstimate:
+        """Predicts the model usage of calling `run()` with the same arguments, without calling any models.
+        Used by `blendsql.explain()`.
+
+        Ingredients which call a model should override this. By default, nothing is known.
+        """
+        return IngredientEstimate()
+
     def maybe_get_temp_table(
         self, temp_table_func: Callable, tablename: str
     ) -> Tuple[str, bool]:
@@ -180,7 +270,40 @@ class MapIngredient(Ingredient):
         *args,
         **kwargs,
     ) -> tuple:
-        """Returns tuple with format (arg, tablename, colname, new_table)"""
+        """Returns tuple with format (arg, tablename, colname, new_table),
+        where `new_table` maps each distinct value of `colname` onto the ingredient output `arg`.
+        """
+        return run_steps(
+            self._call_steps(question, context, options, *args, **kwargs),
+            self._run_request,
+        )
+
+    async def acall(
+        self,
+        question: Optional[str] = None,
+        context: Optional[str] = None,
+        options: Optional[Union[list, str]] = None,
+        *args,
+        **kwargs,
+    ) -> tuple:
+        """Awaitable version of `__call__()`.
+        Database calls run on a worker thread, while `arun()` is awaited on the running event loop.
+        """
+        return await arun_steps(
+            self._call_steps(question, context, options, *args, **kwargs),
+            self._arun_request,
+            offload=True,
+        )
+
+    def _call_steps(
+        self,
+        question: Optional[str] = None,
+        context: Optional[str] = None,
+        options: Optional[Union[list, str]] = None,
+        *args,
+        **kwargs,
+    ):
+        """The logic of `__call__()`, yielding the (args, kwargs) to call `run()` with."""
         # Unpack kwargs
         aliases_to_tablenames: Dict[str, str] = kwargs["aliases_to_tablenames"]
         get_temp_subquery_table: Callable = kwargs["get_temp_subquery_table"]
@@ -201,16 +324,13 @@ class MapIngredient(Ingredient):
 
         # Optionally materialize a CTE
         if tablename in self.db.lazy_tables:
-            original_table = self.db.lazy_tables.pop(tablename).collect()
-        else:
-            original_table = self.db.execute_to_df(
-                select_all_from_table_query(tablename)
-            )
+            self.db.lazy_tables.pop(tablename).collect()
 
         # Need to be sure the new column doesn't already exist here
         new_arg_column = question or str(uuid.uuid4())[:4]
+        existing_columns = set(self.db.iter_columns(tablename))
         while (
-            new_arg_column in set(self.db.iter_columns(tablename))
+            new_arg_column in existing_columns
             or new_arg_column in prev_subquery_map_columns
         ):
             new_arg_column = "_" + new_arg_column
@@ -218,12 +338,12 @@ class MapIngredient(Ingredient):
         # Get a list of values to map
         # First, check if we've already dumped some `MapIngredient` output to the main session table
         if temp_session_table_exists:
-            temp_session_table = self.db.execute_to_df(
-                select_all_from_table_query(temp_session_tablename)
-            )
             # We don't need to run this function on everything,
             #   if a previous subquery already got to certain values
-            if new_arg_column in temp_session_table.columns:
+            if (
+                new_arg_column
+                in self.db.temp_tables.get(temp_session_tablename).columns
+            ):
                 values = self.db.execute_to_list(
                     f'SELECT DISTINCT "{colname}" FROM "{temp_session_tablename}" WHERE "{new_arg_column}" IS NULL',
                 )
@@ -240,8 +360,12 @@ class MapIngredient(Ingredient):
 
         # No need to run ingredient if we have no values to map onto
         if len(values) == 0:
-            original_table[new_arg_column] = None
-            return (new_arg_column, tablename, colname, original_table)
+            return (
+                new_arg_column,
+                tablename,
+                colname,
+                pd.DataFrame({colname: [], new_arg_column: []}),
+            )
 
         unpacked_options = None
         if options is not None:
@@ -258,8 +382,8 @@ class MapIngredient(Ingredient):
         kwargs[IngredientKwarg.VALUES] = values
         kwargs[IngredientKwarg.QUESTION] = question
         kwargs[IngredientKwarg.OPTIONS] = unpacked_options
-        mapped_values: Collection[Any] = self._run(*args, **self.__dict__ | kwargs)
-        self.num_values_passed += len(mapped_values)
+        mapped_values: Collection[Any] = yield (args, self.__dict__ | kwargs)
+        self.add_values_passed(len(mapped_values))
         df_as_dict: Dict[str, list] = {colname: [], new_arg_column: []}
         for value, mapped_value in zip(values, mapped_values):
             df_as_dict[colname].append(value)
@@ -273,14 +397,19 @@ class MapIngredient(Ingredient):
             for x in mapped_values
         ):
             subtable[new_arg_column] = subtable[new_arg_column].astype("Int64")
-        # Add new_table to original table
-        new_table = original_table.merge(subtable, how="left", on=colname)
-        if new_table.shape[0] != original_table.shape[0]:
-            raise IngredientException(
-                f"subtable from run() needs same length as # rows from original\nOriginal has {original_table.shape[0]}, new_table has {new_table.shape[0]}"
-            )
-        # Now, new table has original columns + column with the name of the question we answered
-        return (new_arg_column, tablename, colname, new_table)
+        # We don't merge `subtable` into the original table here
+        # Instead, `_blend()` stores it as a side table, which gets joined lazily
+        return (new_arg_column, tablename, colname, subtable)
+
+    def merge_key(self, **kwargs) -> Optional[Hashable]:
+        """Identifies calls to `run()` which `blend_many()` may merge into a single call,
+        over the union of their `values`. Only safe if the output for each value
+        doesn't depend on which other values are passed along, and if `run()` stores its outputs
+        somewhere the later, individual calls will find them (e.g. `Model.cache_values()`).
+
+        By default, returns None, and calls are never merged.
+        """
+        return None
 
     @abstractmethod
     def run(self, *args, **kwargs) -> Iterable[Any]:
@@ -334,6 +463,37 @@ class JoinIngredient(Ingredient):
         *args,
         **kwargs,
     ) -> tuple:
+        return run_steps(
+            self._call_steps(question, left_on, right_on, *args, **kwargs),
+            self._run_request,
+        )
+
+    async def acall(
+        self,
+        question: Optional[str] = None,
+        left_on: Optional[str] = None,
+        right_on: Optional[str] = None,
+        *args,
+        **kwargs,
+    ) -> tuple:
+        """Awaitable version of `__call__()`.
+        Database calls run on a worker thread, while `arun()` is awaited on the running event loop.
+        """
+        return await arun_steps(
+            self._call_steps(question, left_on, right_on, *args, **kwargs),
+            self._arun_request,
+            offload=True,
+        )
+
+    def _call_steps(
+        self,
+        question: Optional[str] = None,
+        left_on: Optional[str] = None,
+        right_on: Optional[str] = None,
+        *args,
+        **kwargs,
+    ):
+        """The logic of `__call__()`, yielding the (args, kwargs) to call `run()` with."""
         # Unpack kwargs
         aliases_to_tablenames: Dict[str, str] = kwargs["aliases_to_tablenames"]
         get_temp_subquery_table: Callable = kwargs["get_temp_subquery_table"]
@@ -387,6 +547,8 @@ class JoinIngredient(Ingredient):
                 main_table = pd.DataFrame(_outer, columns=["out"])
                 # Create the aux_table DataFrame
                 aux_table = pd.DataFrame(inner, columns=["in"])
+                from skrub import Joiner
+
                 joiner = Joiner(
                     aux_table,
                     main_key="out",
@@ -433,14 +595,12 @@ class JoinIngredient(Ingredient):
 
         if all(len(x) > 0 for x in [left_values, right_values]):
             # Some alignment still left to do
-            self.num_values_passed += len(kwargs["left_values"]) + len(
-                kwargs["right_values"]
+            self.add_values_passed(
+                len(kwargs["left_values"]) + len(kwargs["right_values"])
             )
 
             kwargs[IngredientKwarg.QUESTION] = question
-            _predicted_mapping: Dict[str, str] = self._run(
-                *args, **self.__dict__ | kwargs
-            )
+            _predicted_mapping: Dict[str, str] = yield (args, self.__dict__ | kwargs)
             mapping = mapping | _predicted_mapping
         # Using mapped left/right values, create intermediary mapping table
         temp_join_tablename = get_temp_session_table(str(uuid.uuid4())[:4])
@@ -452,7 +612,9 @@ class JoinIngredient(Ingredient):
                 "right" if not swapped else "left": mapping.values(),
             }
         )
-        self.db.to_temp_table(df=joined_values_df, tablename=temp_join_tablename)
+        self.db.to_temp_table(
+            df=joined_values_df, tablename=temp_join_tablename, created_by=self.name
+        )
         return (
             left_tablename,
             right_tablename,
@@ -553,6 +715,37 @@ class QAIngredient(Ingredient):
         *args,
         **kwargs,
     ) -> Tuple[Union[str, int, float], Optional[exp.Expression]]:
+        return run_steps(
+            self._call_steps(question, context, options, *args, **kwargs),
+            self._run_request,
+        )
+
+    async def acall(
+        self,
+        question: Optional[str] = None,
+        context: Optional[Union[str, pd.DataFrame]] = None,
+        options: Optional[Union[list, str]] = None,
+        *args,
+        **kwargs,
+    ) -> Tuple[Union[str, int, float], Optional[exp.Expression]]:
+        """Awaitable version of `__call__()`.
+        Database calls run on a worker thread, while `arun()` is awaited on the running event loop.
+        """
+        return await arun_steps(
+            self._call_steps(question, context, options, *args, **kwargs),
+            self._arun_request,
+            offload=True,
+        )
+
+    def _call_steps(
+        self,
+        question: Optional[str] = None,
+        context: Optional[Union[str, pd.DataFrame]] = None,
+        options: Optional[Union[list, str]] = None,
+        *args,
+        **kwargs,
+    ):
+        """The logic of `__call__()`, yielding the (args, kwargs) to call `run()` with."""
         # Unpack kwargs
         aliases_to_tablenames: Dict[str, str] = kwargs["aliases_to_tablenames"]
 
@@ -585,12 +778,10 @@ class QAIngredient(Ingredient):
         else:
             kwargs[IngredientKwarg.OPTIONS] = None
 
-        self.num_values_passed += len(subtable) if subtable is not None else 0
+        self.add_values_passed(len(subtable) if subtable is not None else 0)
         kwargs[IngredientKwarg.CONTEXT] = subtable
         kwargs[IngredientKwarg.QUESTION] = question
-        response: Union[str, int, float, tuple] = self._run(
-            *args, **self.__dict__ | kwargs
-        )
+        response: Union[str, int, float, tuple] = yield (args, self.__dict__ | kwargs)
         if isinstance(response, tuple):
             response = format_tuple(
                 response, kwargs.get("wrap_tuple_in_parentheses", True)
@@ -1,3 +1,4 @@
+import os
 from typing import Union, List, Set, Dict, Callable, Optional, Union
 from collections.abc import Collection
 from functools import partialmethod, partial
@@ -9,6 +10,7 @@ from ..db import Database
 from .few_shot import Example
 from .._logger import logger
 from blendsql._exceptions import IngredientException
+from blendsql._configure import MAX_OPTIONS_IN_PROMPT_KEY, DEFAULT_MAX_OPTIONS_IN_PROMPT
 from blendsql._constants import (
     DEFAULT_NAN_ANS,
     ModifierType,
@@ -40,6 +42,24 @@ def unpack_options(
     return set(unpacked_options)
 
 
+def get_list_options_in_prompt(
+    options: Optional[Collection[str]], list_options_in_prompt: bool
+) -> bool:
+    """Decides whether `options` get listed in the prompt text.
+    Too many options would crowd out the rest of the prompt, so we only constrain generation to them.
+    """
+    if options is not None and list_options_in_prompt:
+        if len(options) > int(
+            os.getenv(MAX_OPTIONS_IN_PROMPT_KEY, DEFAULT_MAX_OPTIONS_IN_PROMPT)
+        ):
+            logger.debug(
+                Fore.YELLOW
+                + f"Number of options ({len(options)}) is greater than the configured MAX_OPTIONS_IN_PROMPT.\nWill run inference without explicitly listing these options in the prompt text."
+            )
+            return False
+    return list_options_in_prompt
+
+
 def initialize_retriever(
     examples: Example, k: int = None, **to_string_args
 ) -> Callable[[str], List[Example]]:
@@ -1,27 +1,37 @@
-from typing import Any, List, Optional, Generic, Type, Dict, TypeVar, Union
+from typing import Any, List, Optional, Generic, Type, Dict, Tuple, TypeVar, Union
 import pandas as pd
 from attr import attrib, attrs
 from pathlib import Path
 from dotenv import load_dotenv
 from colorama import Fore
+import asyncio
 import time
 import threading
-from diskcache import Cache
-import platformdirs
 import hashlib
 from abc import abstractmethod
 from functools import cached_property
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 from .._logger import logger
+from .. import _context
 from .._program import Program, program_to_str
 from .._constants import IngredientKwarg
 from ..db.utils import truncate_df_content
 from ..db._database import Database
 from ..ingredients.few_shot import Example
+from ._rate_limit import RequestScheduler
 
 CONTEXT_TRUNCATION_LIMIT = 100
+_MISSING = object()
 ModelObj = TypeVar("ModelObj")
 
+# In-memory outputs of each model (by `id()`), shared within `Model.share_outputs()`.
+# Held in a `ContextVar`, so concurrent `blend()` calls on the same model don't see each other's outputs
+_shared_outputs: ContextVar[Optional[Dict[int, Dict[str, Any]]]] = ContextVar(
+    "blendsql_shared_outputs", default=None
+)
+
 
 class TokenTimer(threading.Thread):
     """Class to handle refreshing tokens."""
@@ -67,16 +77,23 @@ class Model:
     caching: bool = attrib(default=True)
 
     model_obj: Generic[ModelObj] = attrib(init=False)
+    # Usage across all calls. Usage of a single `blend()` call is tracked on its `ExecutionContext`
     prompts: List[dict] = attrib(init=False)
     raw_prompts: List[str] = attrib(init=False)
     prompt_tokens: int = attrib(init=False)
     completion_tokens: int = attrib(init=False)
     num_calls: int = attrib(init=False)
-    cache: Cache = attrib(init=False)
+    batch_sizes: List[int] = attrib(init=False)
+    cache: "diskcache.Cache" = attrib(init=False)
+    scheduler: RequestScheduler = attrib(init=False)
+    _usage_lock: threading.Lock = attrib(init=False)
     run_setup_on_load: bool = attrib(default=True)
 
     def __attrs_post_init__(self):
         if self.caching:
+            import platformdirs
+            from diskcache import Cache
+
             self.cache = Cache(
                 Path(platformdirs.user_cache_dir("blendsql"))
                 / f"{self.model_name_or_path}.diskcache"
@@ -88,6 +105,10 @@ class Model:
         self.prompt_tokens = 0
         self.completion_tokens = 0
         self.num_calls = 0
+        # Number of values sent in each batched request, e.g. by `LLMMap`
+        self.batch_sizes: List[int] = []
+        self._usage_lock = threading.Lock()
+        self.scheduler = RequestScheduler()
         if self.requires_config:
             if self.env is None:
                 self.env = "."
@@ -126,33 +147,141 @@ class Model:
             >>> model.predict(program, **kwargs)
             "This is model generated output"
         """
-        if self.caching:
-            # First, check our cache
-            key: str = self._create_key(program, **kwargs)
-            if key in self.cache:
-                logger.debug(Fore.MAGENTA + "Using model cache..." + Fore.RESET)
-                response: str = self.cache.get(key)  # type: ignore
-                self.prompts.insert(-1, self.format_prompt(response, **kwargs))
-                self.raw_prompts.insert(-1, "")
-                return response
-        # Modify fields used for tracking Model usage
-        response: Any
+        key, response = self._fetch_cached_prediction(program, **kwargs)
+        if response is not _MISSING:
+            return response
         prompts: Union[str, List[str]]
         response, prompts = program(model=self, **kwargs)
+        self._store_prediction(key, response, prompts, **kwargs)
+        return response
+
+    async def apredict(self, program: Type[Program], **kwargs) -> str:
+        """Awaitable version of `predict()`, sharing the same cache.
+        Programs which yield their requests to `generate()` await them on the running
+        event loop (see `Program.acall()`), while all others run on a worker thread.
+
+        Examples:
+            >>> await model.apredict(program, **kwargs)
+            "This is model generated output"
+        """
+        key, response = self._fetch_cached_prediction(program, **kwargs)
+        if response is not _MISSING:
+            return response
+        prompts: Union[str, List[str]]
+        if hasattr(program, "acall"):
+            response, prompts = await program.acall(model=self, **kwargs)
+        else:
+            # E.g. a program written as a function
+            response, prompts = await asyncio.to_thread(program, model=self, **kwargs)
+        self._store_prediction(key, response, prompts, **kwargs)
+        return response
+
+    def _fetch_cached_prediction(
+        self, program: Type[Program], **kwargs
+    ) -> Tuple[Optional[str], Any]:
+        """Returns the cache key of a `predict()` call, along with its cached response.
+        The response is `_MISSING` if it isn't cached, and the key is None if nothing is cached at all.
+        """
+        shared_outputs = self.shared_outputs
+        if not self.caching and shared_outputs is None:
+            return (None, _MISSING)
+        key: str = self._create_key(program, **kwargs)
+        response = _MISSING
+        if shared_outputs is not None:
+            response = shared_outputs.get(key, _MISSING)
+        if response is _MISSING and self.caching and key in self.cache:
+            response = self.cache.get(key)
+        if response is not _MISSING:
+            logger.debug(Fore.MAGENTA + "Using model cache..." + Fore.RESET)
+            self._log_prompt(self.format_prompt(response, **kwargs), "", cached=True)
+        return (key, response)
+
+    def _store_prediction(
+        self,
+        key: Optional[str],
+        response: Any,
+        prompts: Union[str, List[str]],
+        **kwargs,
+    ) -> None:
+        """Records the usage of a `predict()` call, and caches its response under `key`."""
         if not isinstance(prompts, list):
             prompts = [prompts]
         for prompt in prompts:
-            self.prompts.insert(-1, self.format_prompt(response, **kwargs))
-            self.raw_prompts.insert(-1, prompt)
-            self.num_calls += 1
-            if self.tokenizer is not None:
-                self.prompt_tokens += len(self.tokenizer.encode(prompt))
-                # self.completion_tokens += sum(
-                #     [len(self.tokenizer.encode(r)) for r in " ".join(response)]
-                # )
+            self._log_prompt(
+                self.format_prompt(response, **kwargs),
+                prompt,
+                num_tokens=len(self.tokenizer.encode(prompt))
+                if self.tokenizer is not None
+                else 0,
+            )
+            # self.completion_tokens += sum(
+            #     [len(self.tokenizer.encode(r)) for r in " ".join(response)]
+            # )
+        if key is None:
+            return
+        shared_outputs = self.shared_outputs
+        if shared_outputs is not None:
+            shared_outputs[key] = response
         if self.caching:
             self.cache[key] = response  # type: ignore
-        return response
+
+    def _log_prompt(
+        self, prompt: dict, raw_prompt: str, num_tokens: int = 0, cached: bool = False
+    ) -> None:
+        """Records a prompt on the model, and on the context of the running `blend()` call.
+        Concurrent calls may share the model, so updates are made under a lock.
+        """
+        with self._usage_lock:
+            self.prompts.insert(-1, prompt)
+            self.raw_prompts.insert(-1, raw_prompt)
+            if not cached:
+                self.num_calls += 1
+                self.prompt_tokens += num_tokens
+        context = _context.current_context()
+        if context is not None:
+            context.log_prompt(prompt, raw_prompt, num_tokens=num_tokens, cached=cached)
+
+    def log_batch_sizes(self, batch_sizes: List[int]) -> None:
+        """Records the number of values sent in each batched request, e.g. by `LLMMap`."""
+        with self._usage_lock:
+            self.batch_sizes.extend(batch_sizes)
+        context = _context.current_context()
+        if context is not None:
+            context.log_batch_sizes(batch_sizes)
+
+    @property
+    def shared_outputs(self) -> Optional[Dict[str, Any]]:
+        """The outputs shared within the current `share_outputs()` context, if any."""
+        shared = _shared_outputs.get()
+        if shared is None:
+            return None
+        return shared.get(id(self))
+
+    @contextmanager
+    def share_outputs(self):
+        """Within this context, outputs are also kept in memory, so that identical requests
+        and values (see `fetch_cached_values()`) are only sent to the model once,
+        even if `caching` is False. Used by `blend_many()`.
+
+        Examples:
+            ```python
+            with model.share_outputs():
+                for query in queries:
+                    blend(query, db=db, ingredients={LLMMap}, default_model=model)
+            ```
+
+        The outputs are only visible to code running in this context (and copies of it, e.g. on
+        the worker threads of an ingredient call), not to other `blend()` calls using the same model.
+        """
+        if self.shared_outputs is not None:
+            # Already sharing, e.g. in a nested call
+            yield
+            return
+        token = _shared_outputs.set({**(_shared_outputs.get() or {}), id(self): {}})
+        try:
+            yield
+        finally:
+            _shared_outputs.reset(token)
 
     def _create_key(self, program: Type[Program], **kwargs) -> str:
         """Generates a hash to use in diskcache Cache.
@@ -183,6 +312,66 @@ class Model:
         hasher.update(combined)
         return hasher.hexdigest()
 
+    def _create_value_key(self, namespace: Dict[str, Any], value: Any) -> str:
+        """Generates a hash for a single value within a given namespace.
+        Used for the value-level cache, e.g. in `LLMMap`.
+        """
+        hasher = hashlib.md5()
+        namespace_str = str(sorted([(k, serialize(v)) for k, v in namespace.items()]))
+        combined = "{}||{}||{}".format(
+            f"{self.model_name_or_path}||{type(self)}",
+            namespace_str,
+            serialize(value),
+        ).encode()
+        hasher.update(combined)
+        return f"value::{hasher.hexdigest()}"
+
+    def fetch_cached_values(
+        self, namespace: Dict[str, Any], values: List[Any]
+    ) -> Dict[Any, Any]:
+        """Value-level counterpart to the `predict()` cache.
+        Where `predict()` only hits if the entire request is identical, this allows
+        ingredients to re-use outputs for individual values across queries and sessions.
+
+        Args:
+            namespace: Everything (other than the value itself) that determines the output,
+                e.g. the question and output type of an `LLMMap` call
+            values: The values to look up
+
+        Returns:
+            Mapping from value to cached output, for those values we've seen before
+        """
+        shared_outputs = self.shared_outputs
+        if not self.caching and shared_outputs is None:
+            return {}
+        cached = {}
+        for value in values:
+            key = self._create_value_key(namespace, value)
+            response = _MISSING
+            if shared_outputs is not None:
+                response = shared_outputs.get(key, _MISSING)
+            if response is _MISSING and self.caching:
+                response = self.cache.get(key, default=_MISSING)
+            if response is not _MISSING:
+                cached[value] = response
+        return cached
+
+    def cache_values(self, namespace: Dict[str, Any], mapping: Dict[Any, Any]) -> None:
+        """Stores outputs for individual values. See `fetch_cached_values()`."""
+        shared_outputs = self.shared_outputs
+        if shared_outputs is not None:
+            for value, response in mapping.items():
+                if response is not None:
+                    shared_outputs[self._create_value_key(namespace, value)] = response
+        if not self.caching:
+            return
+        with self.cache.transact():
+            for value, response in mapping.items():
+                # Don't persist failed generations, so we can retry them later
+                if response is None:
+                    continue
+                self.cache[self._create_value_key(namespace, value)] = response
+
     @cached_property
     def model_obj(self) -> ModelObj:
         """Allows for lazy loading of underlying model weights."""
@@ -220,7 +409,12 @@ class Model:
 
 
 class LocalModel(Model):
-    pass
+    def pin_prefix(self, lm: "guidance.models.Model") -> None:
+        """Hints that the prompt in `lm` is a prefix shared by upcoming generations,
+        e.g. the instruction and few-shot examples of an ingredient.
+        Models which can reuse computation across prompts (see `TransformersLLM`) override this.
+        """
+        pass
 
 
 class RemoteModel(Model):
@@ -0,0 +1,303 @@
+"""Client-side scheduling of requests to remote model APIs.
+
+Every `Model` owns a `RequestScheduler`, through which all remote `generate` implementations
+submit their requests. It enforces:
+
+- A maximum number of in-flight requests (`blendsql.config.set_async_limit()`)
+- Optional requests-per-minute and tokens-per-minute budgets, as token buckets
+- Retries with full-jitter exponential backoff, when the provider tells us we're rate-limited
+
+All requests are awaited on the shared BlendSQL event loop
+(see `blendsql.ingredients.generate.get_event_loop()`), so no thread synchronization is needed here.
+"""
+import asyncio
+import math
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, List, Optional, TypeVar
+
+from attr import attrs, attrib
+from colorama import Fore
+
+from .._logger import logger
+from .._configure import (
+    ASYNC_LIMIT_KEY,
+    DEFAULT_ASYNC_LIMIT,
+    REQUESTS_PER_MINUTE_KEY,
+    TOKENS_PER_MINUTE_KEY,
+    MAX_RETRIES_KEY,
+    DEFAULT_MAX_RETRIES,
+)
+
+T = TypeVar("T")
+
+RATE_LIMIT_STATUS_CODES = {429}
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Checks whether an exception raised by a provider client signals a rate limit.
+    Covers `openai.RateLimitError`, `anthropic.RateLimitError`, `google.api_core.exceptions.ResourceExhausted`
+    and any HTTP error exposing a 429 `status_code`, without importing the client libraries.
+    """
+    if getattr(error, "status_code", None) in RATE_LIMIT_STATUS_CODES:
+        return True
+    if getattr(error, "code", None) in RATE_LIMIT_STATUS_CODES:
+        return True
+    return any(
+        name in type(error).__name__ for name in ("RateLimit", "ResourceExhausted")
+    )
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """Returns the number of seconds the provider asked us to wait, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def count_tokens(text: str, tokenizer: Any = None) -> int:
+    """Counts the tokens in `text` with the model's tokenizer, if it has one.
+    Otherwise, we fall back to the rough heuristic of 4 characters per token.
+    """
+    if tokenizer is not None:
+        return len(tokenizer.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def estimate_tokens(
+    messages: List[dict], tokenizer: Any = None, max_tokens: Optional[int] = None
+) -> int:
+    """Estimates the tokens a chat request counts against a tokens-per-minute budget.
+    Providers generally count the requested `max_tokens` along with the prompt.
+    """
+    text = "\n".join(str(m.get("content", "")) for m in messages)
+    return count_tokens(text, tokenizer) + (max_tokens or 0)
+
+
+@attrs
+class TokenBucket:
+    """Continuously refilling budget of `capacity` units per minute."""
+
+    capacity: int = attrib()
+
+    available: float = attrib(init=False)
+    updated_at: float = attrib(init=False, factory=time.monotonic)
+
+    def __attrs_post_init__(self):
+        self.available = float(self.capacity)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(
+            self.capacity,
+            self.available + (now - self.updated_at) * self.capacity / 60,
+        )
+        self.updated_at = now
+
+    def wait_time(self, amount: int) -> float:
+        """Returns 0. and consumes `amount` if available, else the seconds to wait before retrying.
+        Requests larger than the full capacity are let through once the bucket is full.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            self.available -= amount
+            return 0.0
+        return (amount - self.available) * 60 / self.capacity
+
+
+@attrs
+class SchedulerMetrics:
+    """Counters describing the requests that went through a `RequestScheduler`."""
+
+    submitted: int = attrib(default=0)
+    completed: int = attrib(default=0)
+    failed: int = attrib(default=0)
+    retries: int = attrib(default=0)
+    rate_limited: int = attrib(default=0)
+    # Requests waiting on a concurrency slot or rate budget
+    queue_depth: int = attrib(default=0)
+    max_queue_depth: int = attrib(default=0)
+    in_flight: int = attrib(default=0)
+    total_queue_seconds: float = attrib(default=0.0)
+    total_latency_seconds: float = attrib(default=0.0)
+
+    @property
+    def avg_queue_seconds(self) -> float:
+        return self.total_queue_seconds / max(self.submitted, 1)
+
+    @property
+    def avg_latency_seconds(self) -> float:
+        """Average time from submission to response, including queueing and retries."""
+        return self.total_latency_seconds / max(self.completed + self.failed, 1)
+
+
+@attrs
+class RequestScheduler:
+    """Enforces concurrency, rate limits and retries for a single model's remote requests.
+
+    Any limit left as `None` is read from the environment at request time,
+    so that `blendsql.config` setters apply to existing models.
+
+    Args:
+        max_concurrency: Maximum number of requests in flight at once.
+            Defaults to `blendsql.config.set_async_limit()`.
+        requests_per_minute: Optional request budget.
+            Defaults to `blendsql.config.set_requests_per_minute()`.
+        tokens_per_minute: Optional token budget, estimated via `estimate_tokens()`.
+            Defaults to `blendsql.config.set_tokens_per_minute()`.
+        max_retries: How many times to retry a rate-limited request before raising.
+            Defaults to `blendsql.config.set_max_retries()`.
+        base_delay: Initial backoff (in seconds), doubled on each retry
+        max_delay: Upper bound on a single backoff (in seconds)
+
+    Examples:
+        ```python
+        from blendsql.models import OpenaiLLM
+        from blendsql.models._rate_limit import RequestScheduler
+
+        model = OpenaiLLM("gpt-4o-mini")
+        model.scheduler = RequestScheduler(requests_per_minute=500, tokens_per_minute=200_000)
+        ...
+        print(model.scheduler.metrics.avg_latency_seconds)
+        ```
+    """
+
+    max_concurrency: Optional[int] = attrib(default=None)
+    requests_per_minute: Optional[int] = attrib(default=None)
+    tokens_per_minute: Optional[int] = attrib(default=None)
+    max_retries: Optional[int] = attrib(default=None)
+    base_delay: float = attrib(default=1.0)
+    max_delay: float = attrib(default=60.0)
+
+    metrics: SchedulerMetrics = attrib(init=False, factory=SchedulerMetrics)
+    _condition: Optional[asyncio.Condition] = attrib(init=False, default=None)
+    _request_bucket: Optional[TokenBucket] = attrib(init=False, default=None)
+    _token_bucket: Optional[TokenBucket] = attrib(init=False, default=None)
+
+    def get_max_concurrency(self) -> int:
+        if self.max_concurrency is not None:
+            return self.max_concurrency
+        return max(int(os.getenv(ASYNC_LIMIT_KEY, DEFAULT_ASYNC_LIMIT)), 1)
+
+    def get_max_retries(self) -> int:
+        if self.max_retries is not None:
+            return self.max_retries
+        return int(os.getenv(MAX_RETRIES_KEY, DEFAULT_MAX_RETRIES))
+
+    def _get_bucket(self, attrname: str, limit: Optional[int], key: str):
+        if limit is None and os.getenv(key) is not None:
+            limit = int(os.getenv(key))
+        bucket: Optional[TokenBucket] = getattr(self, attrname)
+        if not limit:
+            return None
+        if bucket is None or bucket.capacity != limit:
+            bucket = TokenBucket(limit)
+            setattr(self, attrname, bucket)
+        return bucket
+
+    async def _acquire_slot(self) -> None:
+        if self._condition is None:
+            # Created lazily, so it's bound to the loop we're running on
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: self.metrics.in_flight < self.get_max_concurrency()
+            )
+            self.metrics.in_flight += 1
+
+    async def _release_slot(self) -> None:
+        async with self._condition:
+            self.metrics.in_flight -= 1
+            self._condition.notify()
+
+    async def _acquire_budget(self, num_tokens: int) -> None:
+        for bucket, amount in (
+            (
+                self._get_bucket(
+                    "_request_bucket", self.requests_per_minute, REQUESTS_PER_MINUTE_KEY
+                ),
+                1,
+            ),
+            (
+                self._get_bucket(
+                    "_token_bucket", self.tokens_per_minute, TOKENS_PER_MINUTE_KEY
+                ),
+                num_tokens,
+            ),
+        ):
+            if bucket is None:
+                continue
+            while (delay := bucket.wait_time(amount)) > 0:
+                await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return retry_after
+        # Full jitter, so that many rate-limited requests don't retry in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    async def submit(self, fn: Callable[[], Awaitable[T]], num_tokens: int = 0) -> T:
+        """Schedules a single request.
+
+        Args:
+            fn: Zero-argument callable returning a fresh awaitable for the request.
+                It is called again on each retry.
+            num_tokens: Estimated number of tokens this request counts against `tokens_per_minute`
+
+        Returns:
+            The result of the awaited request
+        """
+        metrics = self.metrics
+        metrics.submitted += 1
+        submitted_at = time.monotonic()
+        attempt = 0
+        try:
+            while True:
+                metrics.queue_depth += 1
+                metrics.max_queue_depth = max(
+                    metrics.max_queue_depth, metrics.queue_depth
+                )
+                queued_at = time.monotonic()
+                try:
+                    await self._acquire_slot()
+                    try:
+                        await self._acquire_budget(num_tokens)
+                    except BaseException:
+                        await self._release_slot()
+                        raise
+                finally:
+                    metrics.queue_depth -= 1
+                    metrics.total_queue_seconds += time.monotonic() - queued_at
+                try:
+                    result = await fn()
+                except Exception as e:
+                    if not is_rate_limit_error(e) or attempt >= self.get_max_retries():
+                        raise
+                    metrics.rate_limited += 1
+                    delay = self._backoff(attempt, e)
+                    logger.debug(
+                        Fore.YELLOW
+                        + f"Rate limited ({type(e).__name__}), retrying in {delay:.2f}s..."
+                        + Fore.RESET
+                    )
+                else:
+                    metrics.completed += 1
+                    return result
+                finally:
+                    await self._release_slot()
+                metrics.retries += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+        except BaseException:
+            metrics.failed += 1
+            raise
+        finally:
+            metrics.total_latency_seconds += time.monotonic() - submitted_at
@@ -0,0 +1,182 @@
+"""Pins the KV-cache of shared prompt prefixes for local `guidance` models.
+
+The guidance `TransformersEngine` keeps the KV-cache of the most recent prompt only,
+and reuses it for the longest shared prefix with the next prompt. This works well for
+consecutive `LLMMap` batches, but as soon as another prompt is evaluated in between
+(e.g. an `LLMQA` call, or a different `LLMMap` question), the instruction and few-shot prefix
+has to be recomputed from scratch. On CPU, with long few-shot prompts, this dominates inference time.
+
+A `PrefixCache` stores a copy of the KV-cache for explicitly pinned prefixes, keyed by their text.
+Before the engine computes logits for a prompt starting with a pinned prefix, the pinned state
+is forked back into the engine, so only the remaining tokens need a forward pass.
+Entries are evicted in least-recently-used order, once their total size exceeds `max_bytes`.
+"""
+import copy
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from attr import attrs, attrib
+from colorama import Fore
+
+from ..._logger import logger
+
+DEFAULT_PREFIX_CACHE_MAX_BYTES = 1024**3
+
+
+def get_nbytes(obj: Any, _seen: Optional[set] = None) -> int:
+    """Returns the memory held by the tensors and arrays in `obj`.
+    Handles both legacy tuple-based KV-caches and `transformers.Cache` objects.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    if hasattr(obj, "element_size") and hasattr(obj, "nelement"):
+        # torch.Tensor
+        return obj.element_size() * obj.nelement()
+    if hasattr(obj, "nbytes") and hasattr(obj, "dtype"):
+        # np.ndarray
+        return int(obj.nbytes)
+    if isinstance(obj, (tuple, list)):
+        return sum(get_nbytes(x, _seen) for x in obj)
+    if isinstance(obj, dict):
+        return sum(get_nbytes(x, _seen) for x in obj.values())
+    if hasattr(obj, "__dict__"):
+        return sum(get_nbytes(x, _seen) for x in vars(obj).values())
+    return 0
+
+
+def get_common_prefix_length(a: List[int], b: List[int]) -> int:
+    num_common = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        num_common += 1
+    return num_common
+
+
+@attrs
+class PrefixCacheEntry:
+    token_ids: Tuple[int, ...] = attrib()
+    past_key_values: Any = attrib()
+    logits: Any = attrib()
+    nbytes: int = attrib()
+
+
+@attrs
+class PrefixCache:
+    """Least-recently-used store of pinned prompt prefixes and their KV-cache.
+
+    Args:
+        max_bytes: Upper bound on the memory held by pinned KV-caches
+    """
+
+    max_bytes: int = attrib(default=DEFAULT_PREFIX_CACHE_MAX_BYTES)
+
+    entries: "OrderedDict[str, PrefixCacheEntry]" = attrib(
+        init=False, factory=OrderedDict
+    )
+    nbytes: int = attrib(init=False, default=0)
+    # Number of times a pinned prefix was forked into the engine
+    hits: int = attrib(init=False, default=0)
+    # Number of times a prefix had to be computed before pinning
+    misses: int = attrib(init=False, default=0)
+    evictions: int = attrib(init=False, default=0)
+    _lock: threading.RLock = attrib(init=False, factory=threading.RLock)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, text: str) -> bool:
+        return text in self.entries
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def put(self, text: str, entry: PrefixCacheEntry) -> None:
+        with self._lock:
+            if entry.nbytes > self.max_bytes:
+                logger.debug(
+                    Fore.YELLOW
+                    + f"Not pinning prefix of {len(entry.token_ids)} tokens, since its KV-cache ({entry.nbytes} bytes) exceeds the prefix cache size"
+                    + Fore.RESET
+                )
+                return
+            if text in self.entries:
+                self.nbytes -= self.entries.pop(text).nbytes
+            self.entries[text] = entry
+            self.nbytes += entry.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def longest_prefix(self, token_ids: List[int]) -> Optional[PrefixCacheEntry]:
+        """Returns the longest pinned prefix of `token_ids`, if any."""
+        with self._lock:
+            best_text, best = None, None
+            for text, entry in self.entries.items():
+                n = len(entry.token_ids)
+                if n <= len(token_ids) and (best is None or n > len(best.token_ids)):
+                    if tuple(token_ids[:n]) == entry.token_ids:
+                        best_text, best = text, entry
+            if best_text is not None:
+                self.entries.move_to_end(best_text)
+            return best
+
+    def attach(self, engine: "guidance.models.Engine") -> None:
+        """Wraps `engine.get_logits()`, so that prompts starting with a pinned prefix
+        fork its KV-cache instead of recomputing it."""
+        get_logits = engine.get_logits
+
+        def get_logits_with_prefix_cache(token_ids: List[int]):
+            entry = self.longest_prefix(token_ids)
+            if entry is not None and len(entry.token_ids) > get_common_prefix_length(
+                engine._cached_token_ids, token_ids
+            ):
+                # The engine extends its KV-cache in-place, so hand it a copy
+                engine._past_key_values = copy.deepcopy(entry.past_key_values)
+                engine._cached_token_ids = list(entry.token_ids)
+                engine._cached_logits = copy.deepcopy(entry.logits)
+                with self._lock:
+                    self.hits += 1
+            return get_logits(token_ids)
+
+        engine.get_logits = get_logits_with_prefix_cache
+
+    def pin(self, engine: "guidance.models.Engine", text: str) -> None:
+        """Computes and stores the KV-cache for the prompt prefix `text`, if not already pinned."""
+        with self._lock:
+            if text in self.entries:
+                self.entries.move_to_end(text)
+                return
+            token_ids = tokenize_prefix(engine, text)
+            if len(token_ids) == 0:
+                return
+            self.misses += 1
+            engine.get_logits(token_ids)
+            past_key_values = copy.deepcopy(engine._past_key_values)
+            logits = copy.deepcopy(engine._cached_logits)
+            self.put(
+                text,
+                PrefixCacheEntry(
+                    token_ids=tuple(token_ids),
+                    past_key_values=past_key_values,
+                    logits=logits,
+                    nbytes=get_nbytes(past_key_values) + get_nbytes(logits),
+                ),
+            )
+
+
+def tokenize_prefix(engine: "guidance.models.Engine", text: str) -> List[int]:
+    """Tokenizes `text` the way the engine tokenizes a prompt starting with it."""
+    tokenizer = engine.tokenizer
+    token_ids = tokenizer.encode(text.encode("utf-8"))
+    if tokenizer.bos_token is not None and token_ids[:1] != [tokenizer.bos_token_id]:
+        token_ids = [tokenizer.bos_token_id] + token_ids
+    # The final token may merge with whatever text follows the prefix
+    return token_ids[:-1]
@@ -4,6 +4,7 @@ from colorama import Fore
 
 from ..._logger import logger
 from .._model import LocalModel, ModelObj
+from ._prefix_cache import PrefixCache, DEFAULT_PREFIX_CACHE_MAX_BYTES
 
 DEFAULT_KWARGS = {"do_sample": True, "temperature": 0.0, "top_p": 1.0}
 
@@ -17,6 +18,9 @@ class TransformersLLM(LocalModel):
     Args:
         model_name_or_path: Name of the model on HuggingFace, or the path to a local model
         caching: Bool determining whether we access the model's cache
+        prefix_cache_max_bytes: Memory budget for the KV-cache of pinned prompt prefixes,
+            such as the instruction and few-shot examples of an ingredient.
+            Set to 0 to disable prefix caching.
 
     Examples:
         ```python
@@ -30,6 +34,7 @@ class TransformersLLM(LocalModel):
         model_name_or_path: str,
         config: Optional[dict] = None,
         caching: bool = True,
+        prefix_cache_max_bytes: int = DEFAULT_PREFIX_CACHE_MAX_BYTES,
         **kwargs,
     ):
         if not _has_transformers and _has_torch:
@@ -49,6 +54,11 @@ class TransformersLLM(LocalModel):
         transformers.logging.set_verbosity_error()
         if config is None:
             config = {}
+        self.prefix_cache = (
+            PrefixCache(max_bytes=prefix_cache_max_bytes)
+            if prefix_cache_max_bytes
+            else None
+        )
 
         super().__init__(
             model_name_or_path=model_name_or_path,
@@ -90,8 +100,17 @@ class TransformersLLM(LocalModel):
                 + "chat_template not found in tokenizer config.\nBlendSQL currently only works with chat models"
                 + Fore.RESET
             )
+        if self.prefix_cache is not None:
+            self.prefix_cache.attach(lm.engine)
         return lm
 
+    def pin_prefix(self, lm: "guidance.models.Model") -> None:
+        """Stores the KV-cache for the prompt in `lm`, so later prompts sharing it
+        only need to compute the remaining tokens. See `PrefixCache`."""
+        if self.prefix_cache is None:
+            return
+        self.prefix_cache.pin(lm.engine, lm._current_prompt())
+
 
 class TransformersVisionModel(TransformersLLM):
     """Wrapper for the image-to-text Transformers pipeline."""
@@ -1,5 +1,5 @@
 import importlib.util
-from functools import partial
+from functools import partial, cached_property
 
 from .._model import RemoteModel
 from typing import Optional
@@ -37,6 +37,7 @@ class OllamaLLM(RemoteModel):
                 "Please install ollama with `pip install ollama`!"
             ) from None
 
+        self.host = host
         self.client = None
         if host is not None:
             from ollama import Client
@@ -52,6 +53,13 @@ class OllamaLLM(RemoteModel):
             **kwargs,
         )
 
+    @cached_property
+    def async_client(self) -> "AsyncClient":
+        """Used in `generate()`, so that batches are sent concurrently."""
+        from ollama import AsyncClient
+
+        return AsyncClient(host=self.host)
+
     def _load_model(self) -> partial:
         import ollama
 
@@ -2,5 +2,5 @@ from ._parse import QueryContextManager, SubqueryContextManager
 from ._dialect import get_dialect, _parse_one
 from . import _transforms as transform
 from . import _checks as check
-from ._parse import get_reversed_subqueries, get_scope_nodes
+from ._parse import get_reversed_subqueries, get_scope_nodes, PushdownRewrite
 from ._utils import get_first_child
@@ -10,6 +10,7 @@ from typing import (
     Optional,
     Dict,
     Any,
+    Collection,
 )
 from ast import literal_eval
 from sqlglot.optimizer.scope import find_all_in_scope
@@ -70,6 +71,139 @@ def get_reversed_subqueries(node):
     )
 
 
+def get_conjuncts(node: Optional[exp.Expression]) -> List[exp.Expression]:
+    """Splits a condition into its top-level `AND` operands, removing any parentheses.
+
+    Examples:
+        >>> get_conjuncts(_parse_one("SELECT * FROM w WHERE (a = 1 AND b = 2) AND c = 3").args["where"].this)
+        [a = 1, b = 2, c = 3]
+    """
+    if node is None:
+        return []
+    node = fix_connector_precedence(node.unnest())
+    if isinstance(node, exp.And):
+        return get_conjuncts(node.left) + get_conjuncts(node.right)
+    return [node]
+
+
+def fix_connector_precedence(node: exp.Expression) -> exp.Expression:
+    """Our version of sqlglot parses `AND` and `OR` with equal precedence, from left to right.
+    So `a AND b OR c AND d` becomes `((a AND b) OR c) AND d`. The SQL it generates is still
+    correct, since it's printed the same way, but we can't reason about the tree directly.
+    This rebuilds a chain of unparenthesized `AND`s and `OR`s as `(a AND b) OR (c AND d)`.
+    """
+    if not isinstance(node, exp.Connector):
+        return node
+    operands, operators = [], []
+    curr = node
+    while isinstance(curr, (exp.And, exp.Or)):
+        operands.append(curr.right)
+        operators.append(type(curr))
+        curr = curr.left
+    if len(set(operators)) == 1:
+        return node
+    operands.append(curr)
+    operands, operators = operands[::-1], operators[::-1]
+    disjuncts = [[operands[0]]]
+    for operator, operand in zip(operators, operands[1:]):
+        if operator is exp.Or:
+            disjuncts.append([operand])
+        else:
+            disjuncts[-1].append(operand)
+    return exp.or_(*[exp.and_(*conjuncts) for conjuncts in disjuncts])
+
+
+def _is_false_or_null(node: exp.Expression) -> bool:
+    return (
+        isinstance(node, exp.Null)
+        or node == exp.false()
+        or (isinstance(node, exp.Literal) and not node.is_string and node.name == "0")
+    )
+
+
+def get_superset_condition(node: exp.Expression) -> Optional[exp.Expression]:
+    """Derives a condition without ingredients, which holds for (at least) every row where `node` holds.
+    Returns None if no such condition can be derived, i.e. we need to assume `TRUE`.
+
+    Examples:
+        ```text
+        (a = 1 AND {{A()}}) OR (a = 2 AND {{B()}})          ->  a = 1 OR a = 2
+        CASE WHEN a = 1 THEN {{A()}} WHEN a = 2 THEN FALSE END  ->  a = 1
+        a = 1 OR {{A()}}                                      ->  None
+        NOT {{A()}}                                           ->  None
+        ```
+    """
+    node = fix_connector_precedence(node.unnest())
+    if not check.contains_ingredient(node):
+        return node
+    if isinstance(node, exp.And):
+        left, right = (
+            get_superset_condition(node.left),
+            get_superset_condition(node.right),
+        )
+        if left is None or right is None:
+            return left or right
+        return exp.and_(left, right)
+    if isinstance(node, exp.Or):
+        left, right = (
+            get_superset_condition(node.left),
+            get_superset_condition(node.right),
+        )
+        if left is None or right is None:
+            return None
+        return exp.or_(left, right)
+    if isinstance(node, exp.Case) and node.args.get("this") is None:
+        # A searched `CASE` in a boolean context only holds if one of its non-false branches is taken
+        default = node.args.get("default")
+        if default is not None and not _is_false_or_null(default):
+            return None
+        branch_conditions = []
+        for if_node in node.args["ifs"]:
+            if check.contains_ingredient(if_node.this):
+                return None
+            if not _is_false_or_null(if_node.args["true"]):
+                branch_conditions.append(if_node.this)
+        if len(branch_conditions) == 0:
+            return exp.false()
+        return exp.or_(*branch_conditions)
+    # E.g. `{{A()}} = TRUE`, or `NOT {{A()}}`
+    return None
+
+
+def _join_filters_table(join: exp.Join, tablename: str) -> bool:
+    """Whether the `ON` conditions of `join` filter the rows of `tablename`.
+    They don't for tables on the preserved side of an outer join.
+    """
+    side = (join.side or "").upper()
+    kind = (join.kind or "").upper()
+    if kind not in ("", "INNER", "CROSS"):
+        return False
+    if side == "":
+        return True
+    elif side == "LEFT":
+        return join.this.alias_or_name == tablename
+    elif side == "RIGHT":
+        return join.this.alias_or_name != tablename
+    return False
+
+
+@attrs
+class PushdownRewrite:
+    """A condition added to the abstracted select of `tablename`,
+    beyond the predicates written against that table directly.
+
+    `kind` is one of:
+
+        - 'semi_join': Only keep rows with a match in a table they're joined to, e.g. `w.id IN (SELECT id FROM x WHERE ...)`
+
+        - 'superset': Derived from an `OR` or `CASE` containing ingredients, e.g. `a = 1 OR a = 2`
+    """
+
+    tablename: str = attrib()
+    kind: str = attrib()
+    condition: str = attrib()
+
+
 def get_scope_nodes(
     nodetype: Type[exp.Expression],
     restrict_scope: bool = False,
@@ -137,13 +271,24 @@ class SubqueryContextManager:
 
     # Keep a running log of what aliases we've initialized so far, per subquery
     alias_to_subquery: dict = attrib(default=None)
+    # Tables which don't exist in the database yet (e.g. CTEs we haven't materialized)
+    #   and so can't be referenced in a semi-join
+    lazy_tablenames: Collection[str] = attrib(factory=set)
+    # Conditions (as SQL strings) to leave out of the abstracted selects.
+    #   Used by `explain()` to measure what each rewrite eliminates.
+    skip_rewrites: Collection[str] = attrib(factory=set)
     alias_to_tablename: dict = attrib(init=False)
     tablename_to_alias: dict = attrib(init=False)
     root: sqlglot.optimizer.scope.Scope = attrib(init=False)
+    # The rewrites applied to the abstracted selects we generated
+    rewrites: List[PushdownRewrite] = attrib(init=False)
+    _semi_join_conditions: Dict[str, List[str]] = attrib(init=False)
 
     def __attrs_post_init__(self):
         self.alias_to_tablename = {}
         self.tablename_to_alias = {}
+        self.rewrites = []
+        self._semi_join_conditions = {}
         # https://github.com/tobymao/sqlglot/blob/v20.9.0/posts/ast_primer.md#scope
         self.root = build_scope(self.node)
 
@@ -181,9 +326,6 @@ class SubqueryContextManager:
             ('transactions', False, 'SELECT * FROM transactions WHERE TRUE AND child_category = \'Restaurants & Dining\'')
             ```
         """
-        # TODO: don't really know how to optimize with 'CASE' queries right now
-        if self.node.find(exp.Case):
-            return
         # Special condition: If...
         #   1) We *only* have an ingredient in the top-level `SELECT` clause
         # ... then we should execute entire rest of SQL first and assign to temporary session table.
@@ -235,16 +377,23 @@ class SubqueryContextManager:
             )
             # Check here to see if we have no other predicates other than 'WHERE TRUE'
             # There's no point in creating a temporary table in this situation
+            #   unless we can reduce the table with a semi-join
+            semi_join_conditions = self._semi_join_conditions.get(tablename, [])
             where_node = abstracted_query.find(exp.Where)
-            if where_node:
-                if where_node.args["this"] == exp.true():
-                    continue
-                elif isinstance(where_node.args["this"], exp.Column):
+            if len(semi_join_conditions) == 0:
+                if where_node:
+                    if where_node.args["this"] == exp.true():
+                        continue
+                    elif isinstance(where_node.args["this"], exp.Column):
+                        continue
+                    elif check.all_terminals_are_true(where_node):
+                        continue
+                elif not where_node:
                     continue
-                elif check.all_terminals_are_true(where_node):
-                    continue
-            elif not where_node:
-                continue
+            else:
+                abstracted_query = abstracted_query.where(
+                    *semi_join_conditions, dialect=self.dialect
+                )
             abstracted_query_str = abstracted_query.sql(dialect=self.dialect)
 
             yield (tablename, False, abstracted_query_str)
@@ -321,6 +470,13 @@ class SubqueryContextManager:
                 disambiguate_multi_tables=bool(len(tablenodes) > 1)
                 or (table_alias_node is not None),
             )
+            semi_join_conditions = self._get_semi_join_conditions(
+                tablename=tablename_to_extract, tablenodes=tablenodes
+            )
+            if semi_join_conditions:
+                self._semi_join_conditions[tablenode.name] = semi_join_conditions
+                # We still need a `SELECT`, even if no predicates act on this table directly
+                table_conditions_str = table_conditions_str or "TRUE"
             self.alias_to_tablename = self.alias_to_tablename | curr_alias_to_tablename
             self.tablename_to_alias = self.tablename_to_alias | {
                 v: k for k, v in curr_alias_to_tablename.items()
@@ -344,32 +500,149 @@ class SubqueryContextManager:
             disambiguate_multi_tables: `True` if we have multiple tables in our subquery,
                 and need to be sure we're only fetching the predicates for the specified `tablename`
         """
-        # 2 places conditions can come in here
-        # 'WHERE' statement and predicate in a 'JOIN' statement
         all_table_predicates = []
-        for table_predicates in get_scope_nodes(
-            nodetype=exp.Predicate, root=self.root, restrict_scope=True
+        for condition, is_derived in self._get_table_conditions(
+            tablename, disambiguate_multi_tables=disambiguate_multi_tables
         ):
-            # Unary operators like `NOT` get parsed as parents of predicate by sqlglot
-            # i.e. `SELECT * FROM w WHERE x IS NOT NULL` -> `SELECT * FROM w WHERE NOT x IS NULL`
-            # Since these impact the temporary table creation, we consider them parts of the predicate
-            #   and fetch them below.
-            if isinstance(table_predicates.parent, exp.Unary):
-                table_predicates = table_predicates.parent
-            if check.in_subquery(table_predicates):
+            condition_str = condition.sql(dialect=self.dialect)
+            if is_derived:
+                if condition_str in self.skip_rewrites:
+                    continue
+                self.rewrites.append(
+                    PushdownRewrite(
+                        tablename=self.alias_to_tablename.get(tablename, tablename),
+                        kind="superset",
+                        condition=condition_str,
+                    )
+                )
+            all_table_predicates.append(condition_str)
+        return " AND ".join(all_table_predicates)
+
+    def _get_table_conditions(
+        self, tablename: str, disambiguate_multi_tables: bool
+    ) -> List[Tuple[exp.Expression, bool]]:
+        """Returns the conditions every row of `tablename` contributing to our query result needs to meet.
+        These are the top-level conjuncts of the `WHERE` clause, along with those of any `JOIN ... ON`
+        which filters `tablename` (i.e. `tablename` isn't on the preserved side of an outer join).
+        Conjuncts containing ingredients are replaced by a superset condition, where possible.
+
+        Returns:
+            List of (condition, is_derived) tuples, where `is_derived` is True if the condition
+            was derived from a conjunct containing an ingredient.
+        """
+        where_node = self.node.args.get("where")
+        conjuncts = get_conjuncts(where_node.this if where_node else None)
+        for join in self.node.args.get("joins") or []:
+            if _join_filters_table(join, tablename):
+                conjuncts.extend(get_conjuncts(join.args.get("on")))
+        ingredient_aliases = {
+            alias.alias
+            for alias in self.node.expressions
+            if isinstance(alias, exp.Alias) and check.contains_ingredient(alias)
+        }
+        table_conditions = []
+        for conjunct in conjuncts:
+            superset_condition = get_superset_condition(conjunct)
+            if superset_condition is None:
                 continue
-            if disambiguate_multi_tables:
-                table_predicates = table_predicates.transform(
-                    transform.extract_multi_table_predicates, tablename=tablename
+            is_derived = check.contains_ingredient(conjunct)
+            for condition in get_conjuncts(superset_condition):
+                # Ignore the columns of subqueries in the condition
+                parent_select = condition.find_ancestor(exp.Select)
+                columns = [
+                    c
+                    for c in condition.find_all(exp.Column)
+                    if c.find_ancestor(exp.Select) is parent_select
+                ]
+                if any(c.table == "" and c.name in ingredient_aliases for c in columns):
+                    # References an ingredient output through its alias
+                    continue
+                if disambiguate_multi_tables:
+                    if any(c.table != tablename for c in columns):
+                        continue
+                elif any(c.table not in ("", tablename) for c in columns):
+                    continue
+                if isinstance(condition, exp.Connector):
+                    # So it can safely be joined with others via `AND`
+                    condition = exp.paren(condition)
+                table_conditions.append((condition, is_derived))
+        return table_conditions
+
+    def _get_semi_join_conditions(
+        self, tablename: str, tablenodes: Collection[exp.Table]
+    ) -> List[str]:
+        """For each equi-join of `tablename` onto another table, creates the condition
+        keeping only those rows with a match in the other table (after its own predicates).
+        Rows without a match can't contribute to the query result, so there's no need
+        to pass their values to an ingredient.
+
+        Examples:
+            ```sql
+            SELECT * FROM account_history JOIN constituents ON account_history.Symbol = constituents.Symbol
+            WHERE constituents.Sector = 'Information Technology'
+            ```
+            For `account_history`, returns:
+            ```text
+            ["account_history.Symbol IN (SELECT constituents.Symbol FROM constituents WHERE constituents.Sector = 'Information Technology')"]
+            ```
+        """
+        alias_to_tablenode = {t.alias_or_name: t for t in tablenodes}
+        if tablename not in alias_to_tablenode:
+            return []
+        # Conditions in the `WHERE` clause always filter both sides,
+        #   since NULL never equals anything
+        where_node = self.node.args.get("where")
+        conjuncts = get_conjuncts(where_node.this if where_node else None)
+        for join in self.node.args.get("joins") or []:
+            if _join_filters_table(join, tablename):
+                conjuncts.extend(get_conjuncts(join.args.get("on")))
+        semi_join_conditions = []
+        for conjunct in conjuncts:
+            if not (
+                isinstance(conjunct, exp.EQ)
+                and isinstance(conjunct.this, exp.Column)
+                and isinstance(conjunct.expression, exp.Column)
+            ):
+                continue
+            columns = {c.table: c for c in (conjunct.this, conjunct.expression)}
+            if tablename not in columns or len(columns) != 2 or "" in columns:
+                continue
+            column = columns.pop(tablename)
+            other_tablename, other_column = columns.popitem()
+            other_tablenode = alias_to_tablenode.get(other_tablename)
+            if (
+                other_tablenode is None
+                or other_tablenode.name == alias_to_tablenode[tablename].name
+                or other_tablenode.name in self.lazy_tablenames
+                or other_tablename in (self.alias_to_subquery or {})
+                or check.is_ingredient_node(other_tablenode)
+            ):
+                continue
+            other_conditions = [
+                condition.sql(dialect=self.dialect)
+                for condition, _ in self._get_table_conditions(
+                    other_tablename, disambiguate_multi_tables=True
                 )
-            if isinstance(table_predicates, exp.Expression):
-                all_table_predicates.append(table_predicates)
-        if len(all_table_predicates) == 0:
-            return ""
-        table_conditions_str = " AND ".join(
-            [c.sql(dialect=self.dialect) for c in all_table_predicates]
-        )
-        return table_conditions_str
+                # Subqueries may reference ingredient outputs we haven't stored yet
+                if not (
+                    self.prev_subquery_has_ingredient and condition.find(exp.Select)
+                )
+            ]
+            condition_str = (
+                f"{column.sql(dialect=self.dialect)} IN (SELECT {other_column.sql(dialect=self.dialect)} "
+                f"FROM {other_tablenode.sql(dialect=self.dialect)} WHERE {' AND '.join(other_conditions) or 'TRUE'})"
+            )
+            if condition_str in self.skip_rewrites:
+                continue
+            self.rewrites.append(
+                PushdownRewrite(
+                    tablename=alias_to_tablenode[tablename].name,
+                    kind="semi_join",
+                    condition=condition_str,
+                )
+            )
+            semi_join_conditions.append(condition_str)
+        return semi_join_conditions
 
     def infer_gen_constraints(self, start: int, end: int) -> dict:
         """Given syntax of BlendSQL query, infers a regex pattern (if possible) to guide
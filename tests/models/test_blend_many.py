@@ -0,0 +1,187 @@
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import pandas as pd
+
+from blendsql import blend, blend_many, LLMMap
+from blendsql.db import Pandas
+from blendsql.ingredients import MapIngredient
+from blendsql.ingredients.generate import generate
+from blendsql.models import RemoteModel
+
+
+class CountingMapModel(RemoteModel):
+    """Responds to `LLMMap` batches with the length of each value,
+    and logs each batch sent to the model."""
+
+    def __init__(self, model_name_or_path: str, **kwargs):
+        self.batches = []
+        super().__init__(
+            model_name_or_path=model_name_or_path,
+            requires_config=False,
+            tokenizer=None,
+            caching=False,
+            **kwargs,
+        )
+
+    def _load_model(self):
+        return self.model_name_or_path
+
+
+@generate.register(CountingMapModel)
+def generate_counting_map(
+    model: CountingMapModel, messages_list: List[List[dict]], **kwargs
+):
+    responses = []
+    for messages in messages_list:
+        values = messages[-1]["content"].split("Values:\n")[-1].split("\n")
+        values = [v for v in values if v and not v.startswith("Answer")]
+        model.batches.append(values)
+        responses.append(";".join(str(len(v)) for v in values))
+    return responses
+
+
+NAMES = ["Danny", "Emma", "Tony", "Jo", "Alexander"]
+QUERIES = [
+    "SELECT name, {{LLMMap('How long is this name?', 'w::name')}} AS l FROM w WHERE name IN ('Danny', 'Emma', 'Tony') ORDER BY name",
+    "SELECT name, {{LLMMap('How long is this name?', 'w::name')}} AS l FROM w WHERE name IN ('Emma', 'Tony', 'Jo') ORDER BY name",
+    "SELECT name, {{LLMMap('How long is this name?', 'w::name')}} AS l FROM w WHERE name != 'Danny' ORDER BY name",
+]
+
+
+def test_blend_many_merges_map_calls():
+    db = Pandas(pd.DataFrame({"name": NAMES}))
+    model = CountingMapModel(str(uuid.uuid4()))
+    expected = [
+        blend(query=query, db=db, ingredients={LLMMap}, default_model=model).df
+        for query in QUERIES
+    ]
+    num_values_sent = sum(len(batch) for batch in model.batches)
+    model.batches.clear()
+    smoothies = blend_many(QUERIES, db=db, ingredients={LLMMap}, default_model=model)
+    assert all(smoothie.df.equals(df) for smoothie, df in zip(smoothies, expected))
+    sent = [value for batch in model.batches for value in batch]
+    # Each distinct value is only sent once, in a single merged call
+    assert sorted(sent) == sorted(NAMES)
+    assert len(sent) < num_values_sent
+    # Outputs are only shared within `blend_many()`
+    assert model.shared_outputs is None
+
+
+def test_blend_many_without_inferred_constraints():
+    db = Pandas(pd.DataFrame({"name": NAMES}))
+    model = CountingMapModel(str(uuid.uuid4()))
+    queries = [
+        "SELECT name FROM w WHERE {{LLMMap('How long is this name?', 'w::name')}} > 3 AND name != 'Jo' ORDER BY name",
+        "SELECT name FROM w WHERE {{LLMMap('How long is this name?', 'w::name')}} > 3 AND name != 'Danny' ORDER BY name",
+    ]
+    smoothies = blend_many(
+        queries,
+        db=db,
+        ingredients={LLMMap},
+        default_model=model,
+        infer_gen_constraints=False,
+    )
+    assert [list(smoothie.df["name"]) for smoothie in smoothies] == [
+        ["Alexander", "Danny", "Emma", "Tony"],
+        ["Alexander", "Emma", "Tony"],
+    ]
+    # `blend()` re-uses the merged outputs, since they were mapped with the same (uninferred) arguments
+    sent = [value for batch in model.batches for value in batch]
+    assert sorted(sent) == sorted(NAMES)
+
+
+def test_blend_many_different_questions_not_merged():
+    db = Pandas(pd.DataFrame({"name": NAMES}))
+    model = CountingMapModel(str(uuid.uuid4()))
+    queries = [
+        "SELECT {{LLMMap('How long is this name?', 'w::name')}} FROM w",
+        "SELECT {{LLMMap('How many letters?', 'w::name')}} FROM w",
+    ]
+    smoothies = blend_many(queries, db=db, ingredients={LLMMap}, default_model=model)
+    assert len(smoothies) == 2
+    assert sorted(value for batch in model.batches for value in batch) == sorted(
+        NAMES * 2
+    )
+
+
+CALLED_WITH: List[list] = []
+
+
+class merged_starts_with(MapIngredient):
+    def merge_key(self, question: str, **kwargs):
+        return question
+
+    def run(self, question: str, values: List[str], **kwargs) -> List[bool]:
+        CALLED_WITH.append(values)
+        return [bool(v.startswith(question)) for v in values]
+
+
+def test_blend_many_custom_merge_key():
+    CALLED_WITH.clear()
+    db = Pandas(pd.DataFrame({"name": NAMES}))
+    queries = [
+        "SELECT name FROM w WHERE {{merged_starts_with('E', 'w::name')}} = TRUE AND name != 'Jo'",
+        "SELECT name FROM w WHERE {{merged_starts_with('E', 'w::name')}} = TRUE AND name != 'Danny'",
+    ]
+    smoothies = blend_many(queries, db=db, ingredients={merged_starts_with})
+    assert [list(smoothie.df["name"]) for smoothie in smoothies] == [
+        ["Emma"],
+        ["Emma"],
+    ]
+    # The merged call is made over the union of values
+    assert sorted(CALLED_WITH[0]) == sorted(NAMES)
+
+
+def test_concurrent_blend_usage_is_per_call():
+    db = Pandas(pd.DataFrame({"name": NAMES}))
+    model = CountingMapModel(str(uuid.uuid4()))
+    questions = [f"Question {idx}?" for idx in range(4)]
+    with ThreadPoolExecutor(len(questions)) as executor:
+        smoothies = list(
+            executor.map(
+                lambda question: blend(
+                    query=f"SELECT {{{{LLMMap('{question}', 'w::name')}}}} FROM w",
+                    db=db,
+                    ingredients={LLMMap},
+                    default_model=model,
+                ),
+                questions,
+            )
+        )
+    # The model is shared, but each `SmoothieMeta` only reports its own prompts
+    for smoothie in smoothies:
+        assert sum(smoothie.meta.batch_sizes) == len(NAMES)
+        assert len(smoothie.meta.raw_prompts) == len(smoothie.meta.batch_sizes)
+    assert model.num_calls == sum(len(s.meta.raw_prompts) for s in smoothies)
+    assert sum(model.batch_sizes) == len(NAMES) * len(questions)
+
+
+def test_shared_outputs_are_per_context():
+    db = Pandas(pd.DataFrame({"name": NAMES}))
+    model = CountingMapModel(str(uuid.uuid4()))
+    query = "SELECT {{LLMMap('How long is this name?', 'w::name')}} FROM w"
+    entered, exited = threading.Barrier(2, timeout=30), threading.Barrier(2, timeout=30)
+
+    def share_and_blend(share: bool):
+        if not share:
+            entered.wait()
+            # Another call sharing the same model doesn't share its outputs with us
+            assert model.shared_outputs is None
+            blend(query=query, db=db, ingredients={LLMMap}, default_model=model)
+            exited.wait()
+            return
+        with model.share_outputs():
+            blend(query=query, db=db, ingredients={LLMMap}, default_model=model)
+            entered.wait()
+            exited.wait()
+        assert model.shared_outputs is None
+
+    with ThreadPoolExecutor(2) as executor:
+        list(executor.map(share_and_blend, [True, False]))
+    # Both calls sent all of their values to the model
+    assert sorted(value for batch in model.batches for value in batch) == sorted(
+        NAMES * 2
+    )
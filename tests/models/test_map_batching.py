@@ -0,0 +1,50 @@
+import uuid
+import pandas as pd
+
+from blendsql import blend, LLMMap
+from blendsql.db import Pandas
+from blendsql.ingredients.builtin.map.main import get_value_batches
+from .test_model_caching import DummyMapModel
+
+
+def test_get_value_batches():
+    values = ["a" * 4, "b" * 4, "c" * 40, "d" * 4]
+    assert get_value_batches(values, batch_size=3) == [values[:3], values[3:]]
+    # With the 4-characters-per-token heuristic, each short value costs 2 tokens
+    assert get_value_batches(values, batch_size=3, token_budget=5) == [
+        values[:2],
+        [values[2]],
+        [values[3]],
+    ]
+    # The prompt prefix counts against the budget, but each batch holds at least one value
+    assert get_value_batches(
+        values, batch_size=3, token_budget=5, prefix_tokens=10
+    ) == [[v] for v in values]
+
+
+def test_llmmap_token_budget():
+    names = ["Danny", "Emma", "Tony", "Jo", "Bartholomew" * 400]
+    db = Pandas(pd.DataFrame({"name": names}))
+    query = "SELECT name, {{LLMMap('How long is this name?', 'w::name')}} AS l FROM w"
+
+    model = DummyMapModel(str(uuid.uuid4()))
+    smoothie = blend(
+        query=query,
+        db=db,
+        ingredients={LLMMap.from_args(batch_size=1)},
+        default_model=model,
+    )
+    assert smoothie.meta.batch_sizes == [1, 1, 1, 1, 1]
+
+    model = DummyMapModel(str(uuid.uuid4()))
+    smoothie = blend(
+        query=query,
+        db=db,
+        ingredients={LLMMap.from_args(batch_size=1, batch_token_budget=1000)},
+        default_model=model,
+    )
+    # Short names share a request, the long one doesn't fit alongside them
+    assert smoothie.meta.batch_sizes == [4, 1]
+    assert dict(zip(smoothie.df["name"], smoothie.df["l"])) == {
+        name: len(name) for name in names
+    }
@@ -1,7 +1,13 @@
+import asyncio
 import uuid
 from dataclasses import dataclass
+from typing import List
+import pandas as pd
 
-from blendsql.models import Model
+from blendsql import blend, explain, LLMMap
+from blendsql.db import Pandas
+from blendsql.models import Model, RemoteModel
+from blendsql.ingredients.generate import generate
 from blendsql._program import Program
 
 TEST_QUESTION = "The quick brown fox jumps over the lazy dog"
@@ -72,6 +78,25 @@ def test_simple_cache():
     assert model_b.num_calls == 0
 
 
+def test_apredict_shares_cache_with_predict():
+    model = DummyModel(str(uuid.uuid4()))
+    a = model.predict(program=DummyProgram, question=TEST_QUESTION)
+    b = asyncio.run(model.apredict(program=DummyProgram, question=TEST_QUESTION))
+    assert a == b
+    assert model.num_calls == 1
+
+    c = asyncio.run(
+        model.apredict(program=DifferentDummyProgram, question=TEST_QUESTION)
+    )
+    assert c != a
+    assert (
+        DummyModel(model.model_name_or_path).predict(
+            program=DifferentDummyProgram, question=TEST_QUESTION
+        )
+        == c
+    )
+
+
 def test_different_models():
     a = DummyModel(MODEL_A).predict(program=DummyProgram, question=TEST_QUESTION)
 
@@ -140,3 +165,114 @@ def test_with_set_vars():
     )
 
     assert a == b
+
+
+class DummyMapModel(RemoteModel):
+    """Responds to `LLMMap` batches with the length of each value,
+    and logs which values were sent to the model."""
+
+    def __init__(self, model_name_or_path: str, **kwargs):
+        self.seen_values = []
+        super().__init__(
+            model_name_or_path=model_name_or_path,
+            requires_config=False,
+            tokenizer=None,
+            **kwargs,
+        )
+
+    def _load_model(self):
+        return self.model_name_or_path
+
+
+@generate.register(DummyMapModel)
+def generate_dummy_map(model: DummyMapModel, messages_list: List[List[dict]], **kwargs):
+    responses = []
+    for messages in messages_list:
+        values = messages[-1]["content"].split("Values:\n")[-1].split("\n")
+        values = [v for v in values if v and not v.startswith("Answer")]
+        model.seen_values.extend(values)
+        responses.append(";".join(str(len(v)) for v in values))
+    return responses
+
+
+def test_value_cache():
+    model = DummyModel(str(uuid.uuid4()))
+    namespace = {"question": TEST_QUESTION}
+    model.cache_values(namespace, {"a": 1, "b": None})
+    assert model.fetch_cached_values(namespace, ["a", "b", "c"]) == {"a": 1}
+    assert model.fetch_cached_values({"question": "Different"}, ["a"]) == {}
+    assert DummyModel(str(uuid.uuid4())).fetch_cached_values(namespace, ["a"]) == {}
+
+
+def test_llmmap_value_cache():
+    model = DummyMapModel(str(uuid.uuid4()))
+    db = Pandas(pd.DataFrame({"name": ["Danny", "Emma", "Tony", "Jo"]}))
+    query = "SELECT name, {{LLMMap('How long is this name?', 'w::name')}} AS l FROM w WHERE name IN {}"
+    first = blend(
+        query=query.replace("{}", "('Danny', 'Emma')"),
+        db=db,
+        ingredients={LLMMap},
+        default_model=model,
+    )
+    assert sorted(model.seen_values) == ["Danny", "Emma"]
+    second = blend(
+        query=query.replace("{}", "('Emma', 'Tony', 'Jo')"),
+        db=db,
+        ingredients={LLMMap},
+        default_model=model,
+    )
+    # Only the never-seen values should get sent to the model
+    assert sorted(model.seen_values) == ["Danny", "Emma", "Jo", "Tony"]
+    assert dict(zip(first.df["name"], first.df["l"])) == {"Danny": 5, "Emma": 4}
+    assert dict(zip(second.df["name"], second.df["l"])) == {
+        "Emma": 4,
+        "Tony": 4,
+        "Jo": 2,
+    }
+
+
+def test_explain_predicts_value_cache_hits():
+    model = DummyMapModel(str(uuid.uuid4()))
+    db = Pandas(pd.DataFrame({"name": ["Danny", "Emma", "Tony", "Jo"]}))
+    query = "SELECT name, {{LLMMap('How long is this name?', 'w::name')}} AS l FROM w WHERE name IN {}"
+    blend(
+        query=query.replace("{}", "('Danny', 'Emma')"),
+        db=db,
+        ingredients={LLMMap},
+        default_model=model,
+    )
+    query = query.replace("{}", "('Emma', 'Tony', 'Jo')")
+    explanation = explain(query, db=db, ingredients={LLMMap}, default_model=model)
+    (ingredient,) = explanation.ingredients
+    assert ingredient.num_values == 3
+    assert ingredient.estimate.num_cached_values == 1
+    num_calls = model.num_calls
+    blend(query=query, db=db, ingredients={LLMMap}, default_model=model)
+    assert ingredient.estimate.num_prompts == model.num_calls - num_calls == 1
+
+
+def test_llmmap_value_cache_depends_on_prompt():
+    model = DummyMapModel(str(uuid.uuid4()))
+    db = Pandas(pd.DataFrame({"name": ["Danny", "Emma"]}))
+    query = "SELECT name, {{LLMMap('How long is this name?', 'w::name', options='2;4;5')}} AS l FROM w"
+    few_shot_example = {
+        "question": "How long is this name?",
+        "mapping": {"Bob": "3", "Alice": "5"},
+    }
+    for ingredient in [
+        LLMMap,
+        LLMMap.from_args(few_shot_examples=[few_shot_example]),
+        LLMMap.from_args(list_options_in_prompt=False),
+    ]:
+        model.seen_values = []
+        blend(query=query, db=db, ingredients={ingredient}, default_model=model)
+        # A different prompt may give a different output, so nothing is re-used
+        assert sorted(model.seen_values) == ["Danny", "Emma"]
+    model.seen_values = []
+    blend(
+        query=query,
+        db=db,
+        ingredients={LLMMap.from_args(few_shot_examples=[few_shot_example])},
+        default_model=model,
+    )
+    assert model.seen_values == []
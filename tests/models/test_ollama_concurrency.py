@@ -0,0 +1,89 @@
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import pandas as pd
+
+from blendsql import blend, config, LLMMap
+from blendsql.db import Pandas
+from blendsql._configure import ASYNC_LIMIT_KEY
+
+pytest.importorskip("ollama")
+from blendsql.models import OllamaLLM  # noqa: E402
+
+
+class StubServer(ThreadingHTTPServer):
+    request_queue_size = 64
+    daemon_threads = True
+    max_active = 0
+    active = 0
+    lock = threading.Lock()
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Mimics the Ollama `/api/chat` endpoint, answering with the length of each value
+    after a random delay, so that responses arrive out of order."""
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        values = [
+            v
+            for v in body["messages"][-1]["content"].split("Values:\n")[-1].split("\n")
+            if v and not v.startswith("Answer")
+        ]
+        time.sleep(random.uniform(0.01, 0.05))
+        response = json.dumps(
+            {
+                "model": body["model"],
+                "created_at": "2024-01-01T00:00:00Z",
+                "message": {
+                    "role": "assistant",
+                    "content": ";".join(str(len(v)) for v in values),
+                },
+                "done": True,
+            }
+        ).encode()
+        with server.lock:
+            server.active -= 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer(("127.0.0.1", 0), StubOllamaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    os.environ.pop(ASYNC_LIMIT_KEY, None)
+
+
+def test_concurrent_ollama_batches(stub_server):
+    config.set_async_limit(4)
+    model = OllamaLLM(
+        "stub", host=f"http://127.0.0.1:{stub_server.server_address[1]}", caching=False
+    )
+    values = ["x" * i for i in range(1, 41)]
+    smoothie = blend(
+        query="SELECT v, {{LLMMap('How long?', 'w::v')}} AS l FROM w",
+        db=Pandas(pd.DataFrame({"v": values})),
+        default_model=model,
+        ingredients={LLMMap.from_args(batch_size=2)},
+    )
+    # Outputs should line up with their values, regardless of response order
+    assert all(len(v) == l for v, l in zip(smoothie.df["v"], smoothie.df["l"]))
+    assert stub_server.max_active == 4
+    assert model.scheduler.metrics.completed == 20
@@ -0,0 +1,100 @@
+from typing import List
+import numpy as np
+
+from blendsql.models.local._prefix_cache import (
+    PrefixCache,
+    get_common_prefix_length,
+    get_nbytes,
+)
+
+
+class ByteTokenizer:
+    bos_token = None
+    bos_token_id = None
+
+    def encode(self, byte_string: bytes) -> List[int]:
+        return list(byte_string)
+
+
+class DummyEngine:
+    """Mimics the single-slot KV-cache reuse of guidance's `TransformersEngine`,
+    with one float per token standing in for the KV-cache."""
+
+    def __init__(self):
+        self.tokenizer = ByteTokenizer()
+        self._past_key_values = None
+        self._cached_logits = None
+        self._cached_token_ids: List[int] = []
+        self.num_computed_tokens = 0
+
+    def get_logits(self, token_ids: List[int]):
+        num_cached = get_common_prefix_length(self._cached_token_ids, token_ids)
+        past_length = (
+            len(self._past_key_values[0]) if self._past_key_values is not None else 0
+        )
+        if past_length > num_cached:
+            past_length = max(0, num_cached - 1)
+            self._past_key_values = tuple(
+                p[:past_length] for p in self._past_key_values
+            )
+        self._cached_token_ids[past_length:] = []
+        new_token_ids = token_ids[past_length:]
+        if len(new_token_ids) > 0:
+            self.num_computed_tokens += len(new_token_ids)
+            past = self._past_key_values[0] if self._past_key_values else np.array([])
+            self._past_key_values = (np.concatenate([past, new_token_ids]),)
+            self._cached_token_ids.extend(new_token_ids)
+            self._cached_logits = np.array([self._past_key_values[0].sum()])
+        return self._cached_logits
+
+
+def tokens(text: str) -> List[int]:
+    return list(text.encode())
+
+
+def test_fork_pinned_prefix():
+    engine = DummyEngine()
+    cache = PrefixCache()
+    cache.attach(engine)
+    prefix = "Instruction + few-shot examples\n"
+    cache.pin(engine, prefix)
+    assert cache.misses == 1
+    # The last token of the prefix is left out, since it could merge with what follows
+    assert engine.num_computed_tokens == len(prefix) - 1
+    # Pinning again is a no-op
+    cache.pin(engine, prefix)
+    assert engine.num_computed_tokens == len(prefix) - 1
+
+    # An unrelated prompt replaces the engine's KV-cache
+    engine.get_logits(tokens("Something else entirely"))
+    engine.num_computed_tokens = 0
+    logits = engine.get_logits(tokens(prefix + "Values: a, b"))
+    assert cache.hits == 1
+    assert engine.num_computed_tokens == len("\nValues: a, b")
+    assert logits == DummyEngine().get_logits(tokens(prefix + "Values: a, b"))
+
+    # The pinned entry wasn't modified by the fork
+    entry = cache.longest_prefix(tokens(prefix))
+    assert len(entry.past_key_values[0]) == len(prefix) - 1
+
+
+def test_prefix_cache_eviction():
+    engine = DummyEngine()
+    # Each pinned token costs 8 bytes
+    cache = PrefixCache(max_bytes=200)
+    cache.attach(engine)
+    cache.pin(engine, "a" * 10)
+    cache.pin(engine, "b" * 10)
+    assert len(cache) == 2
+    assert cache.nbytes == get_nbytes(
+        [e.past_key_values for e in cache.entries.values()]
+    ) + get_nbytes([e.logits for e in cache.entries.values()])
+    # Touch the first entry, so the second one is least recently used
+    cache.pin(engine, "a" * 10)
+    cache.pin(engine, "c" * 10)
+    assert cache.evictions == 1
+    assert "a" * 10 in cache and "c" * 10 in cache and "b" * 10 not in cache
+    assert cache.nbytes <= 200
+    # Entries larger than the whole cache aren't stored
+    cache.pin(engine, "d" * 100)
+    assert "d" * 100 not in cache
@@ -0,0 +1,100 @@
+import asyncio
+from typing import Optional
+import pytest
+
+from blendsql.models._rate_limit import RequestScheduler, TokenBucket, estimate_tokens
+from blendsql.ingredients.generate import run_until_complete
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class FlakyRequest:
+    """Raises a rate limit error the first `num_failures` times it's awaited."""
+
+    def __init__(self, num_failures: int, error: Optional[Exception] = None):
+        self.num_failures = num_failures
+        self.error = error if error is not None else RateLimitError()
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.calls <= self.num_failures:
+            raise self.error
+        return "done"
+
+
+def run_all(scheduler: RequestScheduler, fns: list) -> list:
+    async def _run():
+        return await asyncio.gather(*[scheduler.submit(fn) for fn in fns])
+
+    return run_until_complete(_run())
+
+
+def test_max_concurrency():
+    scheduler = RequestScheduler(max_concurrency=3)
+    in_flight = []
+
+    async def request(i: int):
+        in_flight.append(scheduler.metrics.in_flight)
+        await asyncio.sleep(0.02)
+        return i
+
+    results = run_all(scheduler, [lambda i=i: request(i) for i in range(10)])
+    assert results == list(range(10))
+    assert max(in_flight) == 3
+    assert scheduler.metrics.completed == 10
+    assert scheduler.metrics.max_queue_depth >= 7
+    assert scheduler.metrics.in_flight == 0
+
+
+def test_retries_rate_limit_errors():
+    scheduler = RequestScheduler(base_delay=0.001)
+    request = FlakyRequest(num_failures=2)
+    assert run_all(scheduler, [request]) == ["done"]
+    assert request.calls == 3
+    assert scheduler.metrics.retries == 2
+    assert scheduler.metrics.rate_limited == 2
+
+
+def test_gives_up_after_max_retries():
+    scheduler = RequestScheduler(base_delay=0.001, max_retries=1)
+    request = FlakyRequest(num_failures=5)
+    with pytest.raises(RateLimitError):
+        run_all(scheduler, [request])
+    assert request.calls == 2
+    assert scheduler.metrics.failed == 1
+
+
+def test_does_not_retry_other_errors():
+    scheduler = RequestScheduler(base_delay=0.001)
+    request = FlakyRequest(num_failures=1, error=ValueError("bad request"))
+    with pytest.raises(ValueError):
+        run_all(scheduler, [request])
+    assert request.calls == 1
+    assert scheduler.metrics.retries == 0
+
+
+def test_token_bucket():
+    bucket = TokenBucket(capacity=60)
+    assert bucket.wait_time(60) == 0
+    # Refills at 1 unit per second
+    assert bucket.wait_time(1) == pytest.approx(1, abs=0.05)
+    # Requests larger than the capacity only wait for a full bucket
+    assert bucket.wait_time(1000) == pytest.approx(60, abs=0.1)
+
+
+def test_requests_per_minute():
+    scheduler = RequestScheduler(requests_per_minute=600)
+    # Exhaust the budget, so that following requests are spaced by 0.1 seconds
+    scheduler._get_bucket("_request_bucket", 600, "").available = 0
+    results = run_all(scheduler, [FlakyRequest(0) for _ in range(3)])
+    assert results == ["done"] * 3
+    assert scheduler.metrics.avg_queue_seconds > 0.05
+
+
+def test_estimate_tokens():
+    messages = [{"role": "user", "content": "a" * 40}]
+    assert estimate_tokens(messages) == 10
+    assert estimate_tokens(messages, max_tokens=5) == 15
@@ -0,0 +1,117 @@
+import pytest
+import pandas as pd
+from typing import List
+from blendsql import blend
+from blendsql.db import SQLite, DuckDB
+from blendsql.ingredients import MapIngredient
+from blendsql.utils import fetch_from_hub
+from tests.utils import starts_with, get_length
+
+pa = pytest.importorskip("pyarrow")
+
+databases = [
+    SQLite(fetch_from_hub("multi_table.db")),
+    DuckDB.from_sqlite(fetch_from_hub("multi_table.db")),
+]
+
+
+class mixed_types(MapIngredient):
+    def run(self, values: List[str], **kwargs):
+        """Returns both strings and integers, which can't be stored in a single Arrow column."""
+        return [len(v) if idx % 2 == 0 else v for idx, v in enumerate(values)]
+
+
+@pytest.mark.parametrize("db", databases)
+def test_execute_to_arrow(db):
+    query = "SELECT Symbol, Name FROM constituents ORDER BY Symbol"
+    table = db.execute_to_arrow(query)
+    assert isinstance(table, pa.Table)
+    assert table.to_pandas().equals(db.execute_to_df(query))
+
+
+@pytest.mark.parametrize("db", databases)
+def test_arrow_to_temp_table(db):
+    table = pa.table(
+        {
+            "name": ["a", "b", None],
+            "count": pa.array([1, None, 3], type=pa.int64()),
+            "flag": [True, False, None],
+        }
+    )
+    try:
+        db.to_temp_table(table, "arrow_temp_table")
+        assert db.execute_to_list("SELECT name FROM arrow_temp_table WHERE flag") == [
+            "a"
+        ]
+        assert db.execute_to_list("SELECT COUNT(*) FROM arrow_temp_table") == [3]
+        assert db.execute_to_list('SELECT SUM("count") FROM arrow_temp_table') == [4]
+    finally:
+        db._reset_connection()
+
+
+@pytest.mark.parametrize("db", databases)
+def test_multiple_map_outputs(db):
+    smoothie = blend(
+        query="""
+        SELECT Symbol FROM constituents
+        WHERE {{starts_with('A', 'constituents::Name')}}
+        AND {{get_length('length', 'constituents::Name')}} > 5
+        ORDER BY Symbol
+        """,
+        db=db,
+        ingredients={starts_with, get_length},
+    )
+    sql_df = db.execute_to_df(
+        "SELECT Symbol FROM constituents WHERE Name LIKE 'A%' AND LENGTH(Name) > 5 ORDER BY Symbol"
+    )
+    assert list(smoothie.df["Symbol"]) == list(sql_df["Symbol"])
+
+
+@pytest.mark.parametrize("db", databases)
+def test_mixed_type_map_outputs(db):
+    smoothie = blend(
+        query="""
+        SELECT Symbol, {{mixed_types('mixed', 'constituents::Symbol')}} AS m
+        FROM constituents ORDER BY Symbol
+        """,
+        db=db,
+        ingredients={mixed_types},
+    )
+    assert len(smoothie.df) == len(db.execute_to_df("SELECT * FROM constituents"))
+
+
+@pytest.mark.parametrize("db", databases)
+def test_join_temp_table_written_by_database(db, monkeypatch):
+    written_queries = []
+    query_to_temp_table = db.query_to_temp_table
+
+    def spy_query_to_temp_table(query: str, *args, **kwargs):
+        written_queries.append(query)
+        return query_to_temp_table(query, *args, **kwargs)
+
+    monkeypatch.setattr(db, "query_to_temp_table", spy_query_to_temp_table)
+    fetched = []
+    monkeypatch.setattr(db, "execute_to_arrow", lambda *args: fetched.append(args))
+    smoothie = blend(
+        query="""
+        SELECT a.Symbol, constituents.Name, {{get_length('length', 'constituents::Name')}} AS l
+        FROM account_history AS a JOIN constituents ON a.Symbol = constituents.Symbol
+        WHERE a.Action LIKE '%DIVIDEND%'
+        ORDER BY a.Symbol, constituents.Name
+        """,
+        db=db,
+        ingredients={get_length},
+    )
+    sql_df = db.execute_to_df(
+        """
+        SELECT a.Symbol, constituents.Name, LENGTH(constituents.Name) AS l
+        FROM account_history AS a JOIN constituents ON a.Symbol = constituents.Symbol
+        WHERE a.Action LIKE '%DIVIDEND%'
+        ORDER BY a.Symbol, constituents.Name
+        """
+    )
+    assert len(sql_df) > 0
+    assert smoothie.df.values.tolist() == sql_df.values.tolist()
+    # The joined rows, with both `Symbol` columns, never left the database
+    assert fetched == []
+    assert any("JOIN" in query for query in written_queries)
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+import uuid
+import pandas as pd
+from typing import List
+
+from blendsql import blend, blend_async, LLMMap
+from blendsql.db import Pandas
+from blendsql.ingredients import MapIngredient
+from blendsql.ingredients.generate import agenerate, run_until_complete
+from blendsql.models import RemoteModel
+from tests.utils import starts_with
+
+NUM_QUERIES = 3
+
+
+class wait_for_others(MapIngredient):
+    """Only returns once `NUM_QUERIES` calls are running at the same time.
+    Then, calls finish one after the other, ordered by `question`.
+    """
+
+    barrier = threading.Barrier(NUM_QUERIES, timeout=10)
+
+    def run(self, question: str, values: List[str], **kwargs):
+        self.barrier.wait()
+        time.sleep(0.1 * int(question))
+        return [len(v) for v in values]
+
+
+def test_blend_async_concurrent():
+    db = Pandas(pd.DataFrame({"name": ["Danny", "Emma", "Tony", "Jo"]}), tablename="w")
+
+    async def main():
+        return await asyncio.gather(
+            *[
+                blend_async(
+                    query=f"""
+                    SELECT name FROM w
+                    WHERE name != 'Bob'
+                    AND {{{{wait_for_others('{idx}', 'w::name')}}}} = {length}
+                    """,
+                    db=db,
+                    ingredients={wait_for_others},
+                )
+                for idx, length in enumerate([2, 4, 5])
+            ]
+        )
+
+    smoothies = asyncio.run(main())
+    assert [list(s.df["name"]) for s in smoothies] == [
+        ["Jo"],
+        ["Emma", "Tony"],
+        ["Danny"],
+    ]
+
+
+class AsyncMapModel(RemoteModel):
+    """Responds to `LLMMap` batches with the length of each value, via an async client only.
+    Each request waits until `NUM_QUERIES` requests are in flight at once.
+    """
+
+    def __init__(self, model_name_or_path: str, **kwargs):
+        self.request_loops = []
+        self.all_started: asyncio.Event = None
+        super().__init__(
+            model_name_or_path=model_name_or_path,
+            requires_config=False,
+            tokenizer=None,
+            caching=False,
+            **kwargs,
+        )
+
+    def _load_model(self):
+        return self.model_name_or_path
+
+
+@agenerate.register(AsyncMapModel)
+async def agenerate_async_map(
+    model: AsyncMapModel, messages_list: List[List[dict]], **kwargs
+):
+    model.request_loops.append(asyncio.get_running_loop())
+    if len(model.request_loops) == NUM_QUERIES:
+        model.all_started.set()
+    await asyncio.wait_for(model.all_started.wait(), timeout=10)
+    responses = []
+    for messages in messages_list:
+        values = messages[-1]["content"].split("Values:\n")[-1].split("\n")
+        values = [v for v in values if v and not v.startswith("Answer")]
+        responses.append(";".join(str(len(v)) for v in values))
+    return responses
+
+
+def test_blend_async_awaits_model_on_running_loop():
+    db = Pandas(pd.DataFrame({"name": ["Danny", "Emma", "Tony", "Jo"]}), tablename="w")
+    model = AsyncMapModel(str(uuid.uuid4()))
+    names = ["Danny", "Emma", "Jo"]
+
+    async def main():
+        model.all_started = asyncio.Event()
+        smoothies = await asyncio.gather(
+            *[
+                blend_async(
+                    query=f"""
+                    SELECT {{{{LLMMap('How long is this name?', 'w::name')}}}} AS l
+                    FROM w WHERE name = '{name}'
+                    """,
+                    db=db,
+                    ingredients={LLMMap},
+                    default_model=model,
+                )
+                for name in names
+            ]
+        )
+        return asyncio.get_running_loop(), smoothies
+
+    loop, smoothies = asyncio.run(main())
+    # No requests were sent from a worker thread, so they all waited on each other on our loop
+    assert model.request_loops == [loop] * NUM_QUERIES
+    assert [list(s.df["l"]) for s in smoothies] == [[5], [4], [2]]
+    assert all(s.meta.num_values_passed == 1 for s in smoothies)
+
+
+def test_overlapping_sessions_keep_temp_tables():
+    db = Pandas(pd.DataFrame({"name": ["Danny", "Emma", "Tony", "Jo"]}), tablename="w")
+    query = "SELECT name FROM w WHERE {{starts_with('T', 'w::name')}}"
+    # The final query of a streamed `blend()` only runs once we consume the chunks
+    streamed = blend(query=query, db=db, ingredients={starts_with}, stream=True)
+    # Finishing another query on the same db shouldn't drop the temp tables in use above
+    assert list(blend(query=query, db=db, ingredients={starts_with}).df["name"]) == [
+        "Tony"
+    ]
+    assert list(pd.concat(streamed.chunks)["name"]) == ["Tony"]
+
+
+def test_run_until_complete_in_running_loop():
+    async def add(a, b):
+        await asyncio.sleep(0)
+        return a + b
+
+    async def main():
+        # Synchronous model calls may happen while an event loop is already running
+        return run_until_complete(add(1, 2))
+
+    assert asyncio.run(main()) == 3
@@ -0,0 +1,107 @@
+import shutil
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from blendsql import blend
+from blendsql.db import SQLite, Pandas
+from blendsql.utils import fetch_from_hub
+from tests.utils import starts_with
+
+
+@pytest.fixture
+def db(tmp_path) -> SQLite:
+    path = tmp_path / "multi_table.db"
+    shutil.copy(fetch_from_hub("multi_table.db"), path)
+    return SQLite(str(path))
+
+
+def test_catalog_caches_lookups(db):
+    tables = db.tables()
+    assert "constituents" in tables
+    # Nothing is reflected until it's needed
+    assert db.catalog.reflect([]) == []
+    assert "CREATE TABLE constituents" in db.schema_string(use_tables=["constituents"])
+    assert [t.name for t in db.catalog.reflect(["constituents"])] == ["constituents"]
+    misses = db.catalog.misses
+    assert db.tables() == tables
+    assert db.has_table("constituents")
+    assert not db.has_table("not_a_table")
+    assert "Name" in list(db.iter_columns("constituents"))
+    assert list(db.iter_columns("not_a_table")) == []
+    # Only the columns of 'constituents' needed a catalog query
+    assert db.catalog.misses == misses + 1
+
+
+def test_catalog_sees_schema_changes(db):
+    assert not db.has_table("new_table")
+    con = sqlite3.connect(db.db_path)
+    con.execute("CREATE TABLE new_table (a INT)")
+    con.commit()
+    assert db.has_table("new_table")
+    assert list(db.iter_columns("new_table")) == ["a"]
+    con.execute("ALTER TABLE new_table ADD COLUMN b TEXT")
+    con.commit()
+    con.close()
+    assert list(db.iter_columns("new_table")) == ["a", "b"]
+    assert "b TEXT" in db.schema_string(use_tables=["new_table"])
+
+
+def test_catalog_version_checked_once_per_blend(db):
+    get_version = db.catalog.get_version
+    num_checks = []
+
+    def counting_get_version(con):
+        num_checks.append(1)
+        return get_version(con)
+
+    db.catalog.get_version = counting_get_version
+    blend(
+        query="""
+        SELECT Symbol FROM constituents
+        WHERE {{starts_with('A', 'constituents::Name')}}
+        AND Sector IN (SELECT Sector FROM constituents WHERE {{starts_with('I', 'constituents::Sector')}})
+        """,
+        db=db,
+        ingredients={starts_with},
+    )
+    assert len(num_checks) == 1
+
+
+def test_sqlglot_schema_single_query(db):
+    get_schema_rows = db.catalog.get_schema_rows
+    num_queries = []
+
+    def counting_get_schema_rows(con):
+        num_queries.append(1)
+        return get_schema_rows(con)
+
+    db.catalog.get_schema_rows = counting_get_schema_rows
+    schema = db.sqlglot_schema
+    assert list(schema) == [f'"{t}"' for t in db.tables()]
+    assert schema['"constituents"']['"Name"'] == "TEXT"
+    # All columns were fetched by the same query, and cached
+    assert db.sqlglot_schema is schema
+    assert list(db.iter_columns("constituents"))[0] == "Symbol"
+    assert len(num_queries) == 1
+    con = sqlite3.connect(db.db_path)
+    con.execute("ALTER TABLE constituents ADD COLUMN new_column INT")
+    con.commit()
+    con.close()
+    assert db.sqlglot_schema['"constituents"']['"new_column"'] == "INT"
+    db.invalidate_schema()
+    assert db.sqlglot_schema is not schema
+    assert len(num_queries) == 3
+
+
+def test_duckdb_sqlglot_schema_sees_schema_changes():
+    db = Pandas({"a": pd.DataFrame({"x": [1], "y": ["s"]})})
+    schema = db.sqlglot_schema
+    assert schema == {'"a"': {'"x"': "BIGINT", '"y"': "VARCHAR"}}
+    assert db.sqlglot_schema is schema
+    # Temp tables aren't part of the schema
+    db.to_temp_table(pd.DataFrame({"z": [1]}), "temp_table")
+    assert db.sqlglot_schema is schema
+    db.con.execute("ALTER TABLE a ADD COLUMN z DOUBLE")
+    assert db.sqlglot_schema['"a"']['"z"'] == "DOUBLE"
@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import pytest
+from sqlalchemy import text
+
+from blendsql import blend, config
+from blendsql.db import SQLite
+from blendsql.ingredients import MapIngredient
+from blendsql.utils import fetch_from_hub
+from tests.utils import starts_with
+
+QUERY = """
+SELECT DISTINCT Name FROM constituents
+WHERE Sector = 'Information Technology'
+AND {{starts_with('A', 'constituents::Name')}} = TRUE
+"""
+
+
+class fails(MapIngredient):
+    def run(self, question: str, values: List[str], **kwargs) -> List[bool]:
+        raise ValueError("Ingredient failed")
+
+
+def get_pooled_temp_tables(db: SQLite) -> list:
+    with db.engine.connect() as con:
+        return con.execute(
+            text("SELECT name FROM sqlite_temp_master WHERE type='table'")
+        ).fetchall()
+
+
+def test_pool_size_is_configurable(monkeypatch):
+    db = SQLite(fetch_from_hub("multi_table.db"), pool_size=2, max_overflow=0)
+    assert db.engine.pool.size() == 2
+    monkeypatch.setenv(config.POOL_SIZE_KEY, "3")
+    db = SQLite(fetch_from_hub("multi_table.db"))
+    assert db.engine.pool.size() == 3
+
+
+def test_blend_returns_connection_to_pool():
+    db = SQLite(fetch_from_hub("multi_table.db"), pool_size=1, max_overflow=0)
+    # More concurrent calls than connections, so calls wait for one to be returned
+    with ThreadPoolExecutor(4) as executor:
+        smoothies = list(
+            executor.map(
+                lambda _: blend(query=QUERY, db=db, ingredients={starts_with}),
+                range(4),
+            )
+        )
+    assert all(smoothie.df.equals(smoothies[0].df) for smoothie in smoothies)
+    assert len(smoothies[0].df) > 0
+    # The single connection was reused, and holds none of the calls' temp tables
+    assert db.engine.pool.checkedout() == 0
+    assert db.engine.pool.checkedin() == 1
+    assert get_pooled_temp_tables(db) == []
+
+
+def test_failed_blend_returns_connection_to_pool():
+    db = SQLite(fetch_from_hub("multi_table.db"), pool_size=1, max_overflow=0)
+    with pytest.raises(ValueError):
+        blend(
+            query="""
+            SELECT * FROM constituents
+            WHERE {{starts_with('A', 'constituents::Name')}} = TRUE
+            AND {{fails('A', 'constituents::Sector')}} = TRUE
+            """,
+            db=db,
+            ingredients={starts_with, fails},
+        )
+    assert db.engine.pool.checkedout() == 0
+    assert get_pooled_temp_tables(db) == []
+    assert len(blend(query=QUERY, db=db, ingredients={starts_with}).df) > 0
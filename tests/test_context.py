@@ -0,0 +1,69 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Set
+
+import pytest
+from sqlalchemy import text
+
+from blendsql import blend
+from blendsql.db import SQLite, DuckDB
+from blendsql.ingredients import MapIngredient
+from blendsql.utils import fetch_from_hub
+
+NUM_QUERIES = 2
+VISIBLE_TEMP_TABLES: Dict[str, Set[str]] = {}
+
+
+class wait_for_others(MapIngredient):
+    """Records the temp tables visible to its `blend()` call,
+    and only returns once `NUM_QUERIES` calls are running at the same time."""
+
+    barrier = threading.Barrier(NUM_QUERIES, timeout=10)
+
+    def run(self, question: str, values: List[str], **kwargs) -> List[bool]:
+        VISIBLE_TEMP_TABLES[question] = set(self.db.temp_tables.tables)
+        self.barrier.wait()
+        return [bool(v.startswith(question)) for v in values]
+
+
+databases = [
+    SQLite(fetch_from_hub("multi_table.db")),
+    DuckDB.from_sqlite(fetch_from_hub("multi_table.db")),
+]
+
+
+@pytest.mark.parametrize("db", databases)
+def test_concurrent_blend_isolates_temp_tables(db):
+    VISIBLE_TEMP_TABLES.clear()
+    letters = ["A", "M"]
+    with ThreadPoolExecutor(NUM_QUERIES) as executor:
+        smoothies = list(
+            executor.map(
+                lambda letter: blend(
+                    query=f"""
+                    SELECT DISTINCT Name FROM constituents
+                    WHERE Sector = 'Information Technology'
+                    AND {{{{wait_for_others('{letter}', 'constituents::Name')}}}} = TRUE
+                    """,
+                    db=db,
+                    ingredients={wait_for_others},
+                ),
+                letters,
+            )
+        )
+    for letter, smoothie in zip(letters, smoothies):
+        assert len(smoothie.df) > 0
+        assert all(name.startswith(letter) for name in smoothie.df["Name"])
+    # Each call only sees the temp tables it created itself
+    assert all(len(VISIBLE_TEMP_TABLES[letter]) > 0 for letter in letters)
+    assert VISIBLE_TEMP_TABLES["A"].isdisjoint(VISIBLE_TEMP_TABLES["M"])
+    assert len(db.temp_tables) == 0
+    if isinstance(db, SQLite):
+        # Every connection was returned to the engine's pool without its temp tables
+        with db.engine.connect() as con:
+            assert (
+                con.execute(
+                    text("SELECT name FROM sqlite_temp_master WHERE type='table'")
+                ).fetchall()
+                == []
+            )
@@ -0,0 +1,109 @@
+from typing import List
+
+import pytest
+import pandas as pd
+
+from blendsql import blend
+from blendsql.db import SQLite, DuckDB, Pandas
+from blendsql.ingredients import MapIngredient
+from blendsql.parse import _parse_one, get_dialect
+from blendsql.utils import fetch_from_hub
+from blendsql._cost import get_filter_predicates, estimate_selectivity
+from tests.utils import assert_equality, starts_with, get_length
+
+databases = [
+    SQLite(fetch_from_hub("single_table.db")),
+    DuckDB.from_sqlite(fetch_from_hub("single_table.db")),
+]
+
+
+class is_short(MapIngredient):
+    def run(self, question: str, values: List[str], **kwargs) -> List[bool]:
+        return [v is None or len(v) < 4 for v in values]
+
+
+class first_char(MapIngredient):
+    def run(self, question: str, values: List[str], **kwargs) -> List[str]:
+        return [v[0] if v else None for v in values]
+
+
+@pytest.mark.parametrize("db", databases)
+def test_selective_predicate_runs_first(db):
+    blendsql = """
+    SELECT merchant, child_category FROM transactions
+        WHERE {{starts_with('Z', 'transactions::merchant')}} = TRUE
+        AND {{get_length('length', 'transactions::merchant')}} < 5
+        AND child_category != 'Taxi'
+        ORDER BY merchant, child_category
+    """
+    sql = """
+    SELECT merchant, child_category FROM transactions
+        WHERE merchant LIKE 'Z%'
+        AND LENGTH(merchant) < 5
+        AND child_category != 'Taxi'
+        ORDER BY merchant, child_category
+    """
+    smoothie = blend(query=blendsql, db=db, ingredients={starts_with, get_length})
+    sql_df = db.execute_to_df(sql)
+    assert_equality(smoothie=smoothie, sql_df=sql_df, args=["Z"])
+    # `< 5` is estimated to be more selective than `= TRUE`, so only merchants
+    #   with short names get passed to `starts_with`
+    first, second = smoothie.meta.ingredient_costs
+    assert (first.ingredient, second.ingredient) == ("GET_LENGTH", "STARTS_WITH")
+    num_values, num_short_values = db.execute_to_list(
+        """
+    SELECT COUNT(DISTINCT merchant) FROM transactions WHERE child_category != 'Taxi'
+    UNION ALL
+    SELECT COUNT(DISTINCT merchant) FROM transactions WHERE child_category != 'Taxi' AND LENGTH(merchant) < 5
+    """
+    )
+    assert first.estimated_values == second.estimated_values == num_values
+    assert (first.actual_values, second.actual_values) == (num_values, num_short_values)
+    assert first.actual_selectivity == num_short_values / num_values
+    assert second.actual_cost < second.estimated_cost
+    assert smoothie.meta.num_values_passed == num_values + num_short_values
+
+
+def test_null_values_survive_filter():
+    db = Pandas(pd.DataFrame({"name": ["Al", None, "Zoe", "Zachary", "Bo"]}))
+    smoothie = blend(
+        query="""
+        SELECT name FROM w
+            WHERE {{is_short('short', 'w::name')}} = TRUE
+            AND {{first_char('first', 'w::name')}} IS NULL
+        """,
+        db=db,
+        ingredients={is_short, first_char},
+    )
+    assert smoothie.df["name"].tolist() == [None]
+    costs = {c.ingredient: c for c in smoothie.meta.ingredient_costs}
+    # 'Zachary' is filtered out before `first_char`
+    assert costs["FIRST_CHAR"].actual_values == 4
+
+
+def test_get_filter_predicates():
+    node = _parse_one(
+        "SELECT * FROM w WHERE {{A()}} = 1 AND w.x > 2 AND {{B()}} > w.y AND ({{C()}} OR w.z = 1)",
+        dialect=get_dialect("SQLite"),
+    )
+    assert {k: v.sql() for k, v in get_filter_predicates(node).items()} == {
+        "{{A()}}": "{{A()}} = 1"
+    }
+
+
+@pytest.mark.parametrize(
+    "predicate,selectivity",
+    [
+        ("{{A()}} = TRUE", 0.5),
+        ("{{A()}} = 'a'", 0.1),
+        ("{{A()}} <> 'a'", 0.9),
+        ("{{A()}} > 2", 1 / 3),
+        ("{{A()}} IN ('a', 'b')", 0.2),
+        ("NOT {{A()}} > 2", 2 / 3),
+    ],
+)
+def test_estimate_selectivity(predicate, selectivity):
+    node = _parse_one(
+        f"SELECT * FROM w WHERE {predicate}", dialect=get_dialect("SQLite")
+    )
+    assert estimate_selectivity(node.args["where"].this) == pytest.approx(selectivity)
@@ -0,0 +1,125 @@
+import math
+import pytest
+
+from blendsql import explain
+from blendsql.db import SQLite, DuckDB
+from blendsql.ingredients import LLMMap, LLMQA, LLMJoin
+from blendsql.ingredients.builtin.map.main import get_value_batches
+from blendsql.models._rate_limit import count_tokens
+from blendsql.utils import fetch_from_hub
+from tests.utils import starts_with
+
+single_table_databases = [
+    SQLite(fetch_from_hub("single_table.db")),
+    DuckDB.from_sqlite(fetch_from_hub("single_table.db")),
+]
+multi_table_databases = [
+    SQLite(fetch_from_hub("multi_table.db")),
+    DuckDB.from_sqlite(fetch_from_hub("multi_table.db")),
+]
+
+
+@pytest.mark.parametrize("db", single_table_databases)
+def test_explain_map_batches(db):
+    blendsql = """
+    SELECT merchant FROM transactions
+        WHERE {{LLMMap('Is this a fast food chain?', 'transactions::merchant')}} = TRUE
+        AND child_category = 'Restaurants & Dining'
+    """
+    explanation = explain(blendsql, db=db, ingredients={LLMMap})
+    (ingredient,) = explanation.ingredients
+    values = db.execute_to_list(
+        "SELECT DISTINCT merchant FROM transactions WHERE child_category = 'Restaurants & Dining'"
+    )
+    assert ingredient.ingredient_type == "MAP"
+    assert ingredient.num_values == len(values)
+    assert ingredient.estimate.num_prompts == math.ceil(len(values) / 5)
+    assert ingredient.estimate.prompt_tokens > sum(count_tokens(v) for v in values)
+    # Without a model, we can't know what's cached
+    assert ingredient.estimate.num_cached_values is None
+    assert explanation.num_prompts == ingredient.estimate.num_prompts
+
+
+@pytest.mark.parametrize("db", single_table_databases)
+def test_explain_map_token_budget(db):
+    blendsql = """
+    SELECT merchant FROM transactions
+        WHERE {{LLMMap('Is this a fast food chain?', 'transactions::merchant')}} = TRUE
+    """
+    explanation = explain(
+        blendsql, db=db, ingredients={LLMMap.from_args(batch_token_budget=300)}
+    )
+    (ingredient,) = explanation.ingredients
+    values = db.execute_to_list("SELECT DISTINCT merchant FROM transactions")
+    unbudgeted = math.ceil(len(values) / 5)
+    # Values get packed into fewer, larger batches
+    assert 0 < ingredient.estimate.num_prompts < unbudgeted
+    assert ingredient.estimate.num_prompts <= len(
+        get_value_batches(values, batch_size=5, token_budget=300)
+    )
+
+
+@pytest.mark.parametrize("db", multi_table_databases)
+def test_explain_nested_qa(db):
+    blendsql = """
+    SELECT Symbol FROM constituents WHERE Name = {{
+        LLMQA(
+            'Which company is the largest?',
+            (SELECT Name FROM constituents WHERE {{LLMMap('Is this a bank?', 'constituents::Name')}} = TRUE)
+        )
+    }}
+    """
+    explanation = explain(blendsql, db=db, ingredients={LLMMap, LLMQA})
+    (subquery,) = [s for s in explanation.subqueries if s.ingredients]
+    (qa,) = subquery.ingredients
+    assert qa.ingredient_type == "QA"
+    assert qa.estimate.num_prompts == 1
+    # The context depends on `LLMMap`, so it's explained on its own
+    (child,) = qa.children
+    (llmmap,) = child.ingredients
+    assert (
+        llmmap.num_values
+        == db.execute_to_list("SELECT COUNT(DISTINCT Name) FROM constituents")[0]
+    )
+    assert explanation.ingredients == [qa, llmmap]
+    assert explanation.num_prompts == 1 + llmmap.estimate.num_prompts
+    assert "LLMQA" in str(explanation) and "LLMMap" in str(explanation)
+
+
+@pytest.mark.parametrize("db", multi_table_databases)
+def test_explain_join_skips_exact_matches(db):
+    blendsql = """
+    SELECT * FROM portfolio JOIN {{
+        LLMJoin(
+            left_on='portfolio::Symbol',
+            right_on='constituents::Symbol'
+        )
+    }}
+    """
+    explanation = explain(blendsql, db=db, ingredients={LLMJoin})
+    (ingredient,) = explanation.ingredients
+    num_unmatched = db.execute_to_list(
+        """
+    SELECT COUNT(DISTINCT Symbol) FROM portfolio WHERE Symbol NOT IN (SELECT Symbol FROM constituents)
+    UNION ALL
+    SELECT COUNT(DISTINCT Symbol) FROM constituents WHERE Symbol NOT IN (SELECT Symbol FROM portfolio)
+    """
+    )
+    assert ingredient.num_values == sum(num_unmatched)
+
+
+@pytest.mark.parametrize("db", single_table_databases)
+def test_explain_unknown_estimate(db):
+    """Custom ingredients which don't override `estimate()` still report their values."""
+    blendsql = """
+    SELECT merchant FROM transactions
+        WHERE {{starts_with('A', 'transactions::merchant')}} = TRUE
+    """
+    explanation = explain(blendsql, db=db, ingredients={starts_with})
+    (ingredient,) = explanation.ingredients
+    assert (
+        ingredient.num_values
+        == db.execute_to_list("SELECT COUNT(DISTINCT merchant) FROM transactions")[0]
+    )
+    assert ingredient.estimate.num_prompts is None
+    assert explanation.num_prompts == 0
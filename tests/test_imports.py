@@ -0,0 +1,19 @@
+import subprocess
+import sys
+
+
+def test_import_defers_heavy_dependencies():
+    # Run in a fresh interpreter, since `conftest.py` imports guidance itself
+    out = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, blendsql; print(' '.join(sorted(sys.modules)))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    modules = set(out.split())
+    for name in ["guidance", "transformers", "torch", "skrub", "haystack", "diskcache"]:
+        assert name not in modules
@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import pytest
+import pandas as pd
+from blendsql import blend, config
+from blendsql.db import Pandas, SQLite
+from blendsql._plan_cache import plan_cache
+from blendsql._configure import PLAN_CACHE_SIZE_KEY
+from tests.utils import starts_with, get_length
+
+
+@pytest.fixture(scope="session")
+def db() -> Pandas:
+    return Pandas(
+        pd.DataFrame({"Name": ["Danny", "Emma", "Tony"], "Age": [23, 26, 19]}),
+        tablename="w",
+    )
+
+
+@pytest.fixture
+def fresh_plan_cache():
+    plan_cache.clear()
+    plan_cache.reset_stats()
+    yield plan_cache
+    os.environ.pop(PLAN_CACHE_SIZE_KEY, None)
+    plan_cache.clear()
+
+
+def test_plan_cache_hit(db, fresh_plan_cache):
+    blendsql = """
+    SELECT * FROM w WHERE {{starts_with('T', 'w::Name')}} AND Age > 18
+    """
+    first = blend(query=blendsql, db=db, ingredients={starts_with})
+    # Whitespace differences should map to the same plan
+    second = blend(query=" ".join(blendsql.split()), db=db, ingredients={starts_with})
+    assert fresh_plan_cache.misses == 1
+    assert fresh_plan_cache.hits == 1
+    assert first.df.equals(second.df)
+    assert list(second.df["Name"]) == ["Tony"]
+
+
+def test_plan_cache_keyed_on_ingredients(db, fresh_plan_cache):
+    blendsql = """
+    SELECT * FROM w WHERE {{get_length('length', 'w::Name')}} > 3
+    """
+    _ = blend(query=blendsql, db=db, ingredients={get_length})
+    _ = blend(query=blendsql, db=db, ingredients={get_length, starts_with})
+    assert fresh_plan_cache.misses == 2
+    assert fresh_plan_cache.hits == 0
+
+
+def test_plan_cache_eviction(db, fresh_plan_cache):
+    config.set_plan_cache_size(1)
+    for name in ["Danny", "Emma", "Danny"]:
+        smoothie = blend(
+            query=f"SELECT * FROM w WHERE Name = '{name}' AND {{{{starts_with('{name[0]}', 'w::Name')}}}}",
+            db=db,
+            ingredients={starts_with},
+        )
+        assert list(smoothie.df["Name"]) == [name]
+    assert fresh_plan_cache.misses == 3
+    assert fresh_plan_cache.evictions == 2
+    assert len(fresh_plan_cache) == 1
+
+
+def test_plan_cache_disabled(db, fresh_plan_cache):
+    config.set_plan_cache_size(0)
+    for _ in range(2):
+        _ = blend(query="SELECT * FROM w", db=db, ingredients={starts_with})
+    assert len(fresh_plan_cache) == 0
+    assert fresh_plan_cache.hits == 0
+
+
+def test_plan_cache_keeps_whitespace_in_literals(tmp_path, fresh_plan_cache):
+    path = tmp_path / "whitespace.db"
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE w (name TEXT)")
+    con.executemany("INSERT INTO w VALUES (?)", [("a b",), ("a  b",)])
+    con.commit()
+    con.close()
+    db = SQLite(str(path))
+    names = [
+        list(
+            blend(
+                query=f"SELECT name FROM w WHERE name = '{name}' AND {{{{starts_with('a', 'w::name')}}}} = TRUE",
+                db=db,
+                ingredients={starts_with},
+            ).df["name"]
+        )
+        for name in ["a b", "a  b"]
+    ]
+    assert names == [["a b"], ["a  b"]]
+    assert fresh_plan_cache.hits == 0
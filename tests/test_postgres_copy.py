@@ -0,0 +1,39 @@
+import io
+
+import pandas as pd
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.csv
+
+from blendsql.db._postgres import _CsvStream, _is_copyable
+
+
+def test_csv_stream_encodes_table_in_batches():
+    df = pd.DataFrame(
+        {
+            "s": ["a", "", None, 'x,"y"\nz'] * 3,
+            "i": [1, 2, None, 4] * 3,
+            "b": [True, False, None, True] * 3,
+        }
+    )
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    assert _is_copyable(table)
+    # Read in small chunks, as `COPY ... FROM STDIN` does, spanning several batches
+    stream = io.BufferedReader(_CsvStream(table, batch_size=5), buffer_size=7)
+    data = b"".join(iter(lambda: stream.read(7), b""))
+    decoded = pyarrow.csv.read_csv(
+        io.BytesIO(data),
+        read_options=pyarrow.csv.ReadOptions(column_names=table.column_names),
+        convert_options=pyarrow.csv.ConvertOptions(
+            column_types=table.schema,
+            # Like PostgreSQL's CSV format, only unquoted empty values are null
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    assert decoded.to_pandas().equals(table.to_pandas())
+
+
+def test_nested_types_are_not_copyable():
+    assert not _is_copyable(pa.table({"l": [[1, 2], [3]]}))
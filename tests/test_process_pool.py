@@ -0,0 +1,69 @@
+import shutil
+from functools import partial
+from typing import List
+
+import pytest
+
+from blendsql import blend, BlendProcessPool
+from blendsql.db import SQLite
+from blendsql._exceptions import InvalidBlendSQL
+from blendsql.ingredients import MapIngredient
+from blendsql.utils import fetch_from_hub
+
+
+class starts_with(MapIngredient):
+    def run(self, question: str, values: List[str], **kwargs) -> List[bool]:
+        return [bool(v.startswith(question)) for v in values]
+
+
+QUERIES = [
+    f"""
+    SELECT DISTINCT merchant FROM transactions
+        WHERE {{{{starts_with('{letter}', 'transactions::merchant')}}}} = TRUE
+        ORDER BY merchant
+    """
+    for letter in ["A", "Z", "P", "S"]
+]
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with BlendProcessPool(
+        db=partial(SQLite, fetch_from_hub("single_table.db"), read_only=True),
+        ingredients={starts_with},
+        max_workers=2,
+    ) as pool:
+        yield pool
+
+
+def test_process_pool_matches_blend(pool):
+    db = SQLite(fetch_from_hub("single_table.db"))
+    smoothies = pool.map(QUERIES)
+    assert len(smoothies) == len(QUERIES)
+    for query, smoothie in zip(QUERIES, smoothies):
+        expected = blend(query=query, db=db, ingredients={starts_with})
+        assert smoothie.df.equals(expected.df)
+        assert smoothie.meta.num_values_passed == expected.meta.num_values_passed
+        assert list(smoothie.meta.ingredients) == [starts_with]
+        assert smoothie.meta.query == query
+
+
+def test_process_pool_raises_worker_errors(pool):
+    future = pool.submit(
+        "SELECT {{not_an_ingredient('A', 'transactions::merchant')}} FROM transactions"
+    )
+    with pytest.raises(InvalidBlendSQL):
+        future.result()
+    # The worker is still usable afterwards
+    assert len(pool.submit(QUERIES[0]).result().df) > 0
+
+
+@pytest.mark.parametrize("filename", ["single table?.db", "single#table.db", "100%.db"])
+def test_read_only_sqlite_escapes_path(tmp_path, filename):
+    path = tmp_path / filename
+    shutil.copy(fetch_from_hub("single_table.db"), path)
+    db = SQLite(str(path), read_only=True)
+    smoothie = blend(query=QUERIES[0], db=db, ingredients={starts_with})
+    assert len(smoothie.df) > 0
+    # No stray database was created at a truncated path
+    assert [p.name for p in tmp_path.iterdir()] == [filename]
@@ -0,0 +1,177 @@
+import pytest
+from blendsql import blend, explain
+from blendsql.db import SQLite, DuckDB
+from blendsql.utils import fetch_from_hub
+from tests.utils import assert_equality, starts_with, get_length
+
+single_table_databases = [
+    SQLite(fetch_from_hub("single_table.db")),
+    DuckDB.from_sqlite(fetch_from_hub("single_table.db")),
+]
+multi_table_databases = [
+    SQLite(fetch_from_hub("multi_table.db")),
+    DuckDB.from_sqlite(fetch_from_hub("multi_table.db")),
+]
+
+
+@pytest.fixture
+def dummy_ingredients() -> set:
+    return {starts_with, get_length}
+
+
+@pytest.mark.parametrize("db", single_table_databases)
+def test_or_with_ingredient_not_pushed_down(db, dummy_ingredients):
+    """A predicate OR'd with an ingredient shouldn't filter the rows passed to it."""
+    blendsql = """
+    SELECT merchant, child_category FROM transactions
+        WHERE child_category = 'Taxi'
+        OR {{starts_with('A', 'transactions::merchant')}} = 1
+        ORDER BY merchant, child_category
+    """
+    sql = """
+    SELECT merchant, child_category FROM transactions
+        WHERE child_category = 'Taxi'
+        OR merchant LIKE 'A%'
+        ORDER BY merchant, child_category
+    """
+    smoothie = blend(query=blendsql, db=db, ingredients=dummy_ingredients)
+    sql_df = db.execute_to_df(sql)
+    assert_equality(smoothie=smoothie, sql_df=sql_df, args=["A"])
+
+
+@pytest.mark.parametrize("db", single_table_databases)
+def test_mixed_and_or_superset(db, dummy_ingredients):
+    """Each branch of the OR has its own cheap predicate,
+    so only rows matching one of them need to be passed to the ingredients.
+    """
+    blendsql = """
+    SELECT merchant, child_category FROM transactions
+        WHERE {{starts_with('A', 'transactions::merchant')}} = 1 AND child_category = 'Taxi'
+        OR {{get_length('length', 'transactions::merchant')}} > 3 AND child_category = 'Tolls'
+        ORDER BY merchant, child_category
+    """
+    sql = """
+    SELECT merchant, child_category FROM transactions
+        WHERE merchant LIKE 'A%' AND child_category = 'Taxi'
+        OR LENGTH(merchant) > 3 AND child_category = 'Tolls'
+        ORDER BY merchant, child_category
+    """
+    smoothie = blend(query=blendsql, db=db, ingredients=dummy_ingredients)
+    sql_df = db.execute_to_df(sql)
+    assert_equality(smoothie=smoothie, sql_df=sql_df, args=["A"])
+    passed_to_ingredients = db.execute_to_list(
+        """
+    SELECT COUNT(DISTINCT merchant) FROM transactions
+        WHERE child_category = 'Taxi' OR child_category = 'Tolls'
+    """
+    )[0]
+    assert smoothie.meta.num_values_passed == passed_to_ingredients * 2
+
+
+@pytest.mark.parametrize("db", single_table_databases)
+def test_case_in_where(db, dummy_ingredients):
+    blendsql = """
+    SELECT merchant FROM transactions
+        WHERE CASE
+            WHEN child_category = 'Taxi' THEN {{starts_with('A', 'transactions::merchant')}} = 1
+            WHEN child_category = 'Tolls' THEN TRUE
+            ELSE FALSE
+        END
+        ORDER BY merchant
+    """
+    sql = """
+    SELECT merchant FROM transactions
+        WHERE CASE
+            WHEN child_category = 'Taxi' THEN merchant LIKE 'A%'
+            WHEN child_category = 'Tolls' THEN TRUE
+            ELSE FALSE
+        END
+        ORDER BY merchant
+    """
+    smoothie = blend(query=blendsql, db=db, ingredients=dummy_ingredients)
+    sql_df = db.execute_to_df(sql)
+    assert_equality(smoothie=smoothie, sql_df=sql_df, args=["A"])
+    passed_to_ingredient = db.execute_to_list(
+        """
+    SELECT COUNT(DISTINCT merchant) FROM transactions
+        WHERE child_category = 'Taxi' OR child_category = 'Tolls'
+    """
+    )[0]
+    assert smoothie.meta.num_values_passed == passed_to_ingredient
+
+
+@pytest.mark.parametrize("db", multi_table_databases)
+def test_semi_join_reduction(db, dummy_ingredients):
+    """Only constituents which join with a dividend payment should be passed to the ingredient."""
+    blendsql = """
+    SELECT "Run Date", Account, Action, Name FROM account_history
+        JOIN constituents ON account_history.Symbol = constituents.Symbol
+        WHERE {{starts_with('A', 'constituents::Name')}} = 1
+        AND account_history.Action LIKE '%DIVIDEND%'
+    """
+    sql = """
+    SELECT "Run Date", Account, Action, Name FROM account_history
+        JOIN constituents ON account_history.Symbol = constituents.Symbol
+        WHERE constituents.Name LIKE 'A%'
+        AND account_history.Action LIKE '%DIVIDEND%'
+    """
+    smoothie = blend(query=blendsql, db=db, ingredients=dummy_ingredients)
+    sql_df = db.execute_to_df(sql)
+    assert_equality(smoothie=smoothie, sql_df=sql_df, args=["A"])
+    passed_to_ingredient = db.execute_to_list(
+        """
+    SELECT COUNT(DISTINCT Name) FROM constituents WHERE Symbol IN (
+        SELECT Symbol FROM account_history WHERE Action LIKE '%DIVIDEND%'
+    )
+    """
+    )[0]
+    assert smoothie.meta.num_values_passed == passed_to_ingredient
+
+
+@pytest.mark.parametrize("db", multi_table_databases)
+def test_left_join_not_reduced(db, dummy_ingredients):
+    """The preserved side of a LEFT JOIN can't be reduced by the joined table."""
+    blendsql = """
+    SELECT portfolio.Symbol, Description, constituents.Name FROM portfolio
+        LEFT JOIN constituents ON portfolio.Symbol = constituents.Symbol
+        AND constituents.Sector = 'Information Technology'
+        WHERE {{starts_with('A', 'portfolio::Description')}} = 1
+    """
+    sql = """
+    SELECT portfolio.Symbol, Description, constituents.Name FROM portfolio
+        LEFT JOIN constituents ON portfolio.Symbol = constituents.Symbol
+        AND constituents.Sector = 'Information Technology'
+        WHERE portfolio.Description LIKE 'A%'
+    """
+    smoothie = blend(query=blendsql, db=db, ingredients=dummy_ingredients)
+    sql_df = db.execute_to_df(sql)
+    assert_equality(smoothie=smoothie, sql_df=sql_df, args=["A"])
+    passed_to_ingredient = db.execute_to_list(
+        "SELECT COUNT(DISTINCT Description) FROM portfolio"
+    )[0]
+    assert smoothie.meta.num_values_passed == passed_to_ingredient
+
+
+@pytest.mark.parametrize("db", multi_table_databases)
+def test_explain_semi_join(db, dummy_ingredients):
+    blendsql = """
+    SELECT "Run Date", Account, Action, Name FROM account_history
+        JOIN constituents ON account_history.Symbol = constituents.Symbol
+        WHERE {{starts_with('A', 'constituents::Name')}} = 1
+        AND account_history.Action LIKE '%DIVIDEND%'
+    """
+    explanation = explain(blendsql, db=db, ingredients=dummy_ingredients)
+    (table,) = [t for t in explanation.tables if t.tablename == "constituents"]
+    total_values, reduced_values = db.execute_to_list(
+        """
+    SELECT COUNT(DISTINCT Name) FROM constituents UNION ALL
+    SELECT COUNT(DISTINCT Name) FROM constituents WHERE Symbol IN (
+        SELECT Symbol FROM account_history WHERE Action LIKE '%DIVIDEND%'
+    )
+    """
+    )
+    assert table.num_values == {"Name": reduced_values}
+    (rewrite,) = table.rewrites
+    assert rewrite.rewrite.kind == "semi_join"
+    assert rewrite.values_eliminated == {"Name": total_values - reduced_values}
+    assert "semi_join" in str(explanation)
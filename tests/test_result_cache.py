@@ -0,0 +1,146 @@
+import os
+import shutil
+import sqlite3
+from typing import List
+
+import pytest
+import pandas as pd
+
+from blendsql import blend, config
+from blendsql.db import SQLite, Pandas, DuckDB
+from blendsql.ingredients import MapIngredient
+from blendsql.utils import fetch_from_hub
+from blendsql._result_cache import result_cache
+from blendsql._configure import RESULT_CACHE_SIZE_KEY, RESULT_CACHE_TTL_KEY
+
+CALLED_WITH: List[list] = []
+
+
+class logged_starts_with(MapIngredient):
+    def run(self, question: str, values: List[str], **kwargs) -> List[bool]:
+        CALLED_WITH.append(values)
+        return [bool(v.startswith(question)) for v in values]
+
+
+@pytest.fixture
+def fresh_result_cache():
+    config.set_result_cache_size(8)
+    result_cache.clear()
+    result_cache.reset_stats()
+    CALLED_WITH.clear()
+    yield result_cache
+    os.environ.pop(RESULT_CACHE_SIZE_KEY, None)
+    os.environ.pop(RESULT_CACHE_TTL_KEY, None)
+    result_cache.clear()
+
+
+@pytest.fixture
+def sqlite_db(tmp_path) -> SQLite:
+    path = tmp_path / "single_table.db"
+    shutil.copy(fetch_from_hub("single_table.db"), path)
+    return SQLite(str(path))
+
+
+BLENDSQL = """
+SELECT DISTINCT merchant FROM transactions
+    WHERE {{logged_starts_with('Z', 'transactions::merchant')}} = TRUE
+    ORDER BY merchant
+"""
+
+
+def test_result_cache_hit(sqlite_db, fresh_result_cache):
+    first = blend(query=BLENDSQL, db=sqlite_db, ingredients={logged_starts_with})
+    second = blend(
+        query=" ".join(BLENDSQL.split()),
+        db=sqlite_db,
+        ingredients={logged_starts_with},
+    )
+    assert len(CALLED_WITH) == 1
+    assert (fresh_result_cache.misses, fresh_result_cache.hits) == (1, 1)
+    assert first.df.equals(second.df)
+    assert second.meta.num_values_passed == first.meta.num_values_passed
+    # Modifying a returned result doesn't modify the cache
+    second.df.drop(second.df.index, inplace=True)
+    third = blend(query=BLENDSQL, db=sqlite_db, ingredients={logged_starts_with})
+    assert first.df.equals(third.df)
+
+
+def test_result_cache_keeps_whitespace_in_literals(sqlite_db, fresh_result_cache):
+    query = """
+    SELECT DISTINCT merchant FROM transactions
+        WHERE {{logged_starts_with('%s', 'transactions::merchant')}} = TRUE
+    """
+    _ = blend(query=query % "Z  ", db=sqlite_db, ingredients={logged_starts_with})
+    _ = blend(query=query % "Z ", db=sqlite_db, ingredients={logged_starts_with})
+    # The queries only differ within a string literal, so they're distinct results
+    assert (fresh_result_cache.misses, fresh_result_cache.hits) == (2, 0)
+    assert len(CALLED_WITH) == 2
+
+
+def test_result_cache_disabled_by_default(sqlite_db, fresh_result_cache):
+    os.environ.pop(RESULT_CACHE_SIZE_KEY)
+    for _ in range(2):
+        _ = blend(query=BLENDSQL, db=sqlite_db, ingredients={logged_starts_with})
+    assert len(CALLED_WITH) == 2
+    assert len(fresh_result_cache) == 0
+
+
+def test_result_cache_invalidated_by_file_change(sqlite_db, fresh_result_cache):
+    first = blend(query=BLENDSQL, db=sqlite_db, ingredients={logged_starts_with})
+    con = sqlite3.connect(sqlite_db.db_url.database)
+    con.execute("INSERT INTO transactions (merchant) VALUES ('Zzz Cafe')")
+    con.commit()
+    con.close()
+    second = blend(query=BLENDSQL, db=sqlite_db, ingredients={logged_starts_with})
+    assert len(CALLED_WITH) == 2
+    assert len(second.df) == len(first.df) + 1
+
+
+def test_result_cache_invalidated_by_table_checksum(fresh_result_cache):
+    db = Pandas(pd.DataFrame({"merchant": ["Zara", "Apple", "Zillow"]}))
+    blendsql = (
+        "SELECT merchant FROM w WHERE {{logged_starts_with('Z', 'w::merchant')}} = TRUE"
+    )
+    _ = blend(query=blendsql, db=db, ingredients={logged_starts_with})
+    _ = blend(query=blendsql, db=db, ingredients={logged_starts_with})
+    assert len(CALLED_WITH) == 1
+    db.con.execute("UPDATE w SET merchant = 'Zoom' WHERE merchant = 'Apple'")
+    smoothie = blend(query=blendsql, db=db, ingredients={logged_starts_with})
+    assert len(CALLED_WITH) == 2
+    assert sorted(smoothie.df["merchant"]) == ["Zara", "Zillow", "Zoom"]
+
+
+def test_result_cache_invalidated_by_duckdb_file_write(tmp_path, fresh_result_cache):
+    import duckdb
+
+    path = str(tmp_path / "merchants.duckdb")
+    con = duckdb.connect(path)
+    con.execute(
+        "CREATE TABLE w AS SELECT * FROM (VALUES ('Zara'), ('Apple')) t(merchant)"
+    )
+    con.close()
+    db = DuckDB(con=duckdb.connect(path), db_url=path)
+    blendsql = (
+        "SELECT merchant FROM w WHERE {{logged_starts_with('Z', 'w::merchant')}} = TRUE"
+    )
+    _ = blend(query=blendsql, db=db, ingredients={logged_starts_with})
+    # The write lands in DuckDB's `.wal` file, leaving the database file untouched
+    db.con.execute("INSERT INTO w VALUES ('Zoom')")
+    smoothie = blend(query=blendsql, db=db, ingredients={logged_starts_with})
+    assert len(CALLED_WITH) == 2
+    assert sorted(smoothie.df["merchant"]) == ["Zara", "Zoom"]
+
+
+def test_result_cache_ttl(sqlite_db, fresh_result_cache):
+    config.set_result_cache_ttl(0)
+    for _ in range(2):
+        _ = blend(query=BLENDSQL, db=sqlite_db, ingredients={logged_starts_with})
+    assert len(CALLED_WITH) == 2
+    assert fresh_result_cache.evictions == 1
+
+
+def test_result_cache_invalidate(sqlite_db, fresh_result_cache):
+    _ = blend(query=BLENDSQL, db=sqlite_db, ingredients={logged_starts_with})
+    assert fresh_result_cache.invalidate(sqlite_db) == 1
+    _ = blend(query=BLENDSQL, db=sqlite_db, ingredients={logged_starts_with})
+    assert len(CALLED_WITH) == 2
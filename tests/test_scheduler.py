@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+import pytest
+import pandas as pd
+from typing import List
+
+from blendsql import blend, config
+from blendsql.db import Pandas
+from blendsql.ingredients import MapIngredient
+from blendsql._scheduler import IngredientCall, build_dependencies, run_ingredient_calls
+from blendsql._configure import INGREDIENT_CONCURRENCY_KEY
+
+
+class ConcurrencyTracker:
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+
+    @classmethod
+    def reset(cls):
+        cls.active = cls.max_active = 0
+
+    @classmethod
+    def track(cls, fn):
+        with cls.lock:
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        try:
+            return fn()
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+
+class slow_length(MapIngredient):
+    def run(self, values: List[str], **kwargs):
+        def _run():
+            time.sleep(0.2)
+            return [len(str(v)) for v in values]
+
+        return ConcurrencyTracker.track(_run)
+
+
+@pytest.fixture(scope="session")
+def db() -> Pandas:
+    return Pandas(
+        {
+            "people": pd.DataFrame(
+                {"name": ["Danny", "Emma", "Tony"], "id": [1, 2, 3]}
+            ),
+            "pets": pd.DataFrame(
+                {"pet": ["Rex", "Tiddles", "Fluffy"], "owner": [1, 2, 3]}
+            ),
+        }
+    )
+
+
+@pytest.fixture
+def concurrency():
+    ConcurrencyTracker.reset()
+    yield config.set_ingredient_concurrency
+    os.environ.pop(INGREDIENT_CONCURRENCY_KEY, None)
+
+
+def test_build_dependencies():
+    calls = [
+        IngredientCall("A", lambda: 1, reads={"a"}, writes={"column::q1"}),
+        IngredientCall("B", lambda: 2, reads={"b"}, writes={"column::q2"}),
+        IngredientCall("C", lambda: 3, reads={"a"}, writes={"column::q1"}),
+        IngredientCall("D", lambda: 4, exclusive=True),
+    ]
+    assert build_dependencies(calls) == {0: set(), 1: set(), 2: {0}, 3: {0, 1, 2}}
+
+
+def test_run_ingredient_calls_preserves_order():
+    calls = [
+        IngredientCall(str(i), lambda i=i: (time.sleep(0.05 * (3 - i)), i)[1])
+        for i in range(3)
+    ]
+    assert run_ingredient_calls(calls, max_concurrency=3) == [0, 1, 2]
+
+
+def test_run_ingredient_calls_raises_first_error():
+    def fail(msg):
+        raise ValueError(msg)
+
+    calls = [
+        IngredientCall("A", lambda: fail("first")),
+        IngredientCall("B", lambda: fail("second")),
+    ]
+    with pytest.raises(ValueError, match="first"):
+        run_ingredient_calls(calls, max_concurrency=2)
+
+
+@pytest.mark.parametrize("n", [1, 2])
+def test_concurrent_map_ingredients(db, concurrency, n):
+    concurrency(n)
+    smoothie = blend(
+        query="""
+        SELECT people.name, pets.pet,
+        {{slow_length('name length', 'people::name')}} AS a,
+        {{slow_length('pet length', 'pets::pet')}} AS b
+        FROM people JOIN pets ON people.id = pets.owner
+        ORDER BY people.id
+        """,
+        db=db,
+        ingredients={slow_length},
+    )
+    assert list(smoothie.df["a"]) == [5, 4, 4]
+    assert list(smoothie.df["b"]) == [3, 7, 6]
+    assert ConcurrencyTracker.max_active == n
+    # Both concurrent calls to the shared ingredient are counted
+    assert smoothie.meta.num_values_passed == 6
@@ -263,9 +263,16 @@ def test_multiple_nested_ingredients(db, dummy_ingredients):
     sql_df = db.execute_to_df(sql)
     assert_equality(smoothie=smoothie, sql_df=sql_df, args=["A", "T"])
     # Make sure we only pass what's necessary to our ingredient
+    # Since there's fewer distinct `child_category` values, we run that predicate first,
+    #   and only pass the merchants of surviving rows to the second
     passed_to_ingredient = db.execute_to_list(
         """
-    SELECT COUNT(DISTINCT merchant) + COUNT(DISTINCT child_category) FROM transactions WHERE parent_category = 'Food'
+    SELECT (
+        SELECT COUNT(DISTINCT child_category) FROM transactions WHERE parent_category = 'Food'
+    ) + (
+        SELECT COUNT(DISTINCT merchant) FROM transactions WHERE parent_category = 'Food'
+        AND child_category LIKE 'T%'
+    )
     """
     )[0]
     assert smoothie.meta.num_values_passed == passed_to_ingredient
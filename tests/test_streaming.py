@@ -0,0 +1,85 @@
+import gc
+import pytest
+import pandas as pd
+from blendsql import blend
+from blendsql.db import SQLite, DuckDB
+from blendsql.utils import fetch_from_hub
+from tests.utils import starts_with
+
+
+def get_temp_tables(db) -> list:
+    if isinstance(db, SQLite):
+        return db.execute_to_list("SELECT name FROM sqlite_temp_master")
+    return db.execute_to_list("SELECT table_name FROM duckdb_tables() WHERE temporary")
+
+
+databases = [
+    SQLite(fetch_from_hub("multi_table.db")),
+    DuckDB.from_sqlite(fetch_from_hub("multi_table.db")),
+]
+
+
+@pytest.mark.parametrize("db", databases)
+def test_stream_matches_blend(db):
+    blendsql = """
+    SELECT * FROM constituents WHERE {{starts_with('A', 'constituents::Name')}}
+    """
+    expected = blend(query=blendsql, db=db, ingredients={starts_with})
+    smoothie = blend(
+        query=blendsql, db=db, ingredients={starts_with}, stream=True, chunksize=2
+    )
+    assert smoothie.df is None
+    # Temp tables persist until the chunks are consumed,
+    #   but only on the connection checked out for the call
+    assert len(get_temp_tables(db)) == 0
+    chunks = list(smoothie.chunks)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 2 for chunk in chunks)
+    streamed = pd.concat(chunks, ignore_index=True)
+    assert list(streamed.columns) == list(expected.df.columns)
+    assert streamed.values.tolist() == expected.df.values.tolist()
+    if isinstance(db, DuckDB):
+        assert len(get_temp_tables(db)) == 0
+
+
+@pytest.mark.parametrize("db", databases)
+def test_stream_empty_result(db):
+    smoothie = blend(
+        query="SELECT Symbol FROM constituents WHERE Symbol = 'not a symbol'",
+        db=db,
+        stream=True,
+    )
+    chunks = list(smoothie.chunks)
+    assert len(chunks) == 1
+    assert chunks[0].empty
+    assert list(chunks[0].columns) == ["Symbol"]
+
+
+@pytest.mark.parametrize("db", databases)
+def test_unconsumed_stream_ends_session(db, monkeypatch):
+    closed = []
+    close_connection = db.close_connection
+    monkeypatch.setattr(
+        db,
+        "close_connection",
+        lambda *args: closed.append(close_connection(*args)),
+    )
+    blendsql = """
+    SELECT * FROM constituents WHERE {{starts_with('A', 'constituents::Name')}}
+    """
+    smoothie = blend(
+        query=blendsql, db=db, ingredients={starts_with}, stream=True, chunksize=2
+    )
+    assert len(closed) == 0
+    # The chunks are never iterated
+    del smoothie
+    gc.collect()
+    assert len(closed) == 1
+    # Stop after the first chunk
+    with blend(
+        query=blendsql, db=db, ingredients={starts_with}, stream=True, chunksize=2
+    ) as smoothie:
+        assert len(next(smoothie.chunks)) == 2
+    assert len(closed) == 2
+    assert list(smoothie.chunks) == []
+    assert len(get_temp_tables(db)) == 0
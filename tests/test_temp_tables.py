@@ -0,0 +1,217 @@
+import sqlite3
+from typing import List
+
+import pytest
+import pandas as pd
+from sqlalchemy import text
+
+from blendsql import blend
+from blendsql.db import SQLite, DuckDB, Pandas
+from blendsql.ingredients import MapIngredient
+from blendsql._merge import add_ingredient_columns
+from blendsql.utils import fetch_from_hub
+from tests.utils import starts_with, get_length
+
+databases = [
+    SQLite(fetch_from_hub("multi_table.db")),
+    DuckDB.from_sqlite(fetch_from_hub("multi_table.db")),
+]
+
+
+@pytest.mark.parametrize("db", databases)
+def test_temp_table_registry(db):
+    try:
+        db.to_temp_table(
+            pd.DataFrame({"a": [1, 2, 3]}), "registry_table", created_by="test"
+        )
+        info = db.temp_tables.get("registry_table")
+        assert (info.columns, info.num_rows, info.created_by) == (["a"], 3, "test")
+        before = db.temp_tables.catalog_queries_avoided
+        assert db.has_temp_table("registry_table")
+        assert not db.has_temp_table("missing_table")
+        assert db.temp_tables.catalog_queries_avoided == before + 2
+    finally:
+        db._reset_connection()
+    assert len(db.temp_tables) == 0
+    assert not db.has_temp_table("registry_table")
+
+
+@pytest.mark.parametrize("db", databases)
+def test_replace_temp_table_with_quote_in_name(db):
+    tablename = 'quoted "temp" table'
+    try:
+        db.query_to_temp_table("SELECT 1 AS a", tablename=tablename)
+        # Replacing the table drops the previous one first
+        db.query_to_temp_table("SELECT 2 AS a", tablename=tablename)
+        assert db.execute_to_list('SELECT a FROM "quoted ""temp"" table"') == [2]
+    finally:
+        db._reset_connection()
+    assert not db.has_temp_table(tablename)
+
+
+@pytest.mark.parametrize("db", databases)
+def test_blend_records_temp_tables(db):
+    created = []
+    original_to_temp_table = db.to_temp_table
+    original_create_temp_view = db.create_temp_view
+
+    def to_temp_table(df, tablename, created_by=None):
+        original_to_temp_table(df, tablename, created_by=created_by)
+        created.append(db.temp_tables.get(tablename))
+
+    def create_temp_view(tablename, query, columns, depends_on, created_by=None):
+        original_create_temp_view(
+            tablename, query, columns, depends_on=depends_on, created_by=created_by
+        )
+        created.append(db.temp_tables.get(tablename))
+
+    db.to_temp_table = to_temp_table
+    db.create_temp_view = create_temp_view
+    try:
+        blend(
+            query="""
+            SELECT Symbol FROM constituents
+            WHERE {{starts_with('A', 'constituents::Name')}}
+            AND {{get_length('length', 'constituents::Name')}} > 5
+            """,
+            db=db,
+            ingredients={starts_with, get_length},
+        )
+    finally:
+        del db.to_temp_table
+        del db.create_temp_view
+    ingredient_tables = [info for info in created if info.created_by is not None]
+    # One narrow side table per `MapIngredient` output, and the session view combining them
+    side_tables, session_views = ingredient_tables[:2], ingredient_tables[2:]
+    # `get_length` is estimated to be more selective, so it runs first
+    #   and `starts_with` only maps the names which passed it
+    assert [info.columns for info in side_tables] == [
+        ["Name", "length"],
+        ["Name", "A"],
+    ]
+    assert all(not info.is_view for info in side_tables)
+    assert [info.num_rows for info in side_tables] == [
+        15,
+        db.execute_to_list(
+            "SELECT COUNT(DISTINCT Name) FROM constituents WHERE LENGTH(Name) > 5"
+        )[0],
+    ]
+    assert len(session_views) == 1
+    assert session_views[0].is_view
+    assert session_views[0].created_by == "GET_LENGTH, STARTS_WITH"
+    assert session_views[0].columns[-2:] == ["A", "length"]
+    assert set(session_views[0].depends_on) == {
+        "constituents",
+        *[info.name for info in side_tables],
+    }
+    # All temp tables are dropped once the blend finishes
+    assert len(db.temp_tables) == 0
+
+
+def test_sqlite_pooled_connections_are_cleaned_up():
+    db = SQLite(fetch_from_hub("multi_table.db"))
+    blend(
+        query="SELECT Symbol FROM constituents WHERE {{starts_with('A', 'constituents::Name')}}",
+        db=db,
+        ingredients={starts_with},
+    )
+    # The previous connection was returned to the engine's pool, not closed
+    with db.engine.connect() as con:
+        assert (
+            con.execute(
+                text("SELECT name FROM sqlite_temp_master WHERE type='table'")
+            ).fetchall()
+            == []
+        )
+
+
+@pytest.mark.parametrize("db", databases)
+def test_session_view_over_side_tables(db):
+    try:
+        db.to_temp_table(
+            pd.DataFrame({"id": [1, 2, 3, 4], "k": ["a", "b", None, "a"]}), "base"
+        )
+        side_tables = []
+        add_ingredient_columns(
+            db,
+            tablename="base",
+            session_tablename="session_base",
+            ingredient_outputs=[pd.DataFrame({"k": ["a", None], "q": [1, 2]})],
+            side_tables=side_tables,
+        )
+        # A later output for the same column only fills in the missing values
+        add_ingredient_columns(
+            db,
+            tablename="base",
+            session_tablename="session_base",
+            ingredient_outputs=[pd.DataFrame({"k": ["b"], "q": [3]})],
+            side_tables=side_tables,
+        )
+        assert db.execute_to_list('SELECT q FROM session_base ORDER BY "id"') == [
+            1,
+            3,
+            2,
+            1,
+        ]
+        assert db.temp_tables.get("session_base").columns == ["id", "k", "q"]
+        # Replacing the base table drops the views selecting from it
+        db.to_temp_table(pd.DataFrame({"id": [5]}), "base")
+        assert not db.has_temp_table("session_base")
+        assert db.has_temp_table(side_tables[0].tablename)
+    finally:
+        db._reset_connection()
+
+
+class is_expensive(MapIngredient):
+    def run(self, values: List[float], **kwargs) -> List[bool]:
+        return [None if pd.isnull(v) else v > 2 for v in values]
+
+
+def test_map_float_keys(tmp_path):
+    df = pd.DataFrame(
+        {"item": ["a", "b", "c", "d", "e"], "price": [1.5, 2.25, None, 1.5, 0.1]}
+    )
+    db_path = str(tmp_path / "prices.db")
+    with sqlite3.connect(db_path) as con:
+        df.to_sql("w", con, index=False)
+    for db in [SQLite(db_path), Pandas(df)]:
+        smoothie = blend(
+            query="SELECT item, {{is_expensive('expensive', 'w::price')}} AS e FROM w",
+            db=db,
+            ingredients={is_expensive},
+        )
+        # NaN/NULL keys and float equality are handled by the database, not a pandas merge
+        assert list(smoothie.df["item"]) == ["a", "b", "c", "d", "e"]
+        assert [None if pd.isnull(v) else bool(v) for v in smoothie.df["e"]] == [
+            False,
+            True,
+            None,
+            False,
+            False,
+        ]
+
+
+@pytest.mark.parametrize("db", databases)
+def test_subquery_table_stays_in_database(db):
+    created = []
+    original_query_to_temp_table = db.query_to_temp_table
+
+    def query_to_temp_table(query, tablename, created_by=None):
+        original_query_to_temp_table(query, tablename, created_by=created_by)
+        created.append(db.temp_tables.get(tablename))
+
+    db.query_to_temp_table = query_to_temp_table
+    try:
+        blend(
+            query="""
+            SELECT Symbol FROM constituents
+            WHERE Sector = 'Information Technology'
+            AND {{starts_with('A', 'constituents::Name')}}
+            """,
+            db=db,
+            ingredients={starts_with},
+        )
+    finally:
+        del db.query_to_temp_table
+    assert len(created) == 1
+    assert "Name" in created[0].columns